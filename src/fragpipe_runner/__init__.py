@@ -1,10 +1,26 @@
-from .execute import run_fragpipe
+from .cache import ResultCache, run_fragpipe_cached
+from .execute import (
+    FragPipeJob,
+    RunResult,
+    run_fragpipe,
+    run_fragpipe_async,
+    start_fragpipe,
+)
 from .manifest import sdrf_to_manifest, update_rawfile_paths_in_manifest
+from .scheduler import FragPipeScheduler, SearchJob
 from .workflow import prepare_workflow_from_template
 
 __all__ = [
+    "FragPipeJob",
+    "FragPipeScheduler",
+    "ResultCache",
+    "RunResult",
+    "SearchJob",
     "prepare_workflow_from_template",
     "run_fragpipe",
+    "run_fragpipe_async",
+    "run_fragpipe_cached",
     "sdrf_to_manifest",
+    "start_fragpipe",
     "update_rawfile_paths_in_manifest",
 ]
@@ -0,0 +1,149 @@
+"""Minimal ctypes binding of the Linux inotify API for watching directory trees."""
+
+import ctypes
+import ctypes.util
+import os
+import pathlib
+import select
+import struct
+import sys
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+def _load_libc() -> ctypes.CDLL | None:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+_LIBC = _load_libc()
+
+
+def is_available() -> bool:
+    """Return True if inotify is available on this system."""
+    return _LIBC is not None
+
+
+class TreeWatcher:
+    """Watches a directory and all of its subdirectories for file events.
+
+    Subdirectories created after the watcher was started are watched automatically,
+    and files already present in them are reported as 'IN_CREATE' events.
+    """
+
+    def __init__(self, root_dir: pathlib.Path | str, mask: int):
+        """Start watching a directory tree.
+
+        Args:
+            root_dir: The root directory to watch.
+            mask: Bit mask of the inotify events to report for files.
+
+        Raises:
+            OSError: If inotify is not available or the watch cannot be added.
+        """
+        if _LIBC is None:
+            raise OSError("inotify is not available on this system.")
+        self.root_dir = pathlib.Path(root_dir)
+        self._mask = mask | IN_CREATE | IN_MOVED_TO
+        self._watches: dict[int, pathlib.Path] = {}
+        self._fd = _LIBC.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._pending: list[tuple[pathlib.Path, int]] = []
+        self._add_tree(self.root_dir)
+
+    def close(self) -> None:
+        """Stop watching and release the inotify file descriptor."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __enter__(self) -> "TreeWatcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def read_events(self, timeout: float) -> list[tuple[pathlib.Path, int]]:
+        """Wait for events and return them.
+
+        Args:
+            timeout: Maximum number of seconds to wait for events.
+
+        Returns:
+            A list of (path, mask) tuples. If the kernel event queue overflowed, a
+            single (root_dir, IN_Q_OVERFLOW) event is returned and the caller should
+            rescan the tree.
+        """
+        events, self._pending = self._pending, []
+        if not events:
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+            if not readable:
+                return []
+        try:
+            data = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return events
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = (
+                data[offset : offset + name_length]
+                .rstrip(b"\0")
+                .decode(errors="surrogateescape")
+            )
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                events.append((self.root_dir, IN_Q_OVERFLOW))
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            path = directory / name
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+                continue
+            events.append((path, mask))
+        return events
+
+    def _add_tree(self, directory: pathlib.Path) -> None:
+        """Watch a directory and its subdirectories, reporting existing files."""
+        for root, dirnames, filenames in os.walk(directory):
+            root_path = pathlib.Path(root)
+            self._add_watch(root_path)
+            if root_path != self.root_dir:
+                self._pending.extend(
+                    (root_path / filename, IN_CREATE) for filename in filenames
+                )
+            dirnames[:] = [d for d in dirnames if not os.path.islink(root_path / d)]
+
+    def _add_watch(self, directory: pathlib.Path) -> None:
+        assert _LIBC is not None
+        wd = _LIBC.inotify_add_watch(self._fd, os.fsencode(directory), self._mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(directory))
+        self._watches[wd] = directory
@@ -0,0 +1,360 @@
+"""Shared machinery of the disk-bounded LRU caches.
+
+Each cache stores an entry in a directory named by the cache key of the entry, which
+contains the cached files and an 'entry.json' file with the metadata of the entry.
+Directories starting with a dot, e.g. staging and job directories, are not entries.
+
+Files of stored entries are read-only and are shared by all users of the cache. They
+may only be hardlinked into directories that are private to the cache, files in
+directories of the user are created with `clone_file` instead.
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from collections.abc import Callable, Collection, Iterator
+from typing import Any
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LOGGER = logging.getLogger(__name__)
+
+METADATA_FILENAME = "entry.json"
+"""Name of the file with the metadata of a cache entry."""
+
+STAGING_DIR_PREFIX = ".staging-"
+"""Prefix of the directories cache entries are assembled in."""
+
+JOB_DIR_PREFIX = ".job-"
+"""Prefix of the private job directories created inside a cache directory."""
+
+LOCK_FILENAME = ".lock"
+"""Name of the file locked by `EntryCache.lock`."""
+
+# Linux ioctl request number for cloning a file (reflink) on CoW file systems
+_FICLONE = 0x40049409
+
+
+class EntryCache:
+    """Base class of disk-bounded LRU caches with one directory per entry.
+
+    The metadata of an entry contains at least its size in bytes and the time it was
+    last used. Once the total size of all entries exceeds 'max_size_bytes', the least
+    recently used entries are evicted.
+
+    Attributes:
+        entry_description: Description of an entry used in log messages.
+        key_version: Version of the cache key layout, increment when the fingerprint
+            inputs of the cache change.
+    """
+
+    entry_description = "cache entry"
+    key_version = 1
+
+    def __init__(
+        self,
+        cache_dir: pathlib.Path | str,
+        max_size_bytes: int | None = None,
+    ):
+        """Initialize the cache.
+
+        Args:
+            cache_dir: Directory where cache entries are stored. Created if missing.
+            max_size_bytes: Maximum total size of all cache entries. If None, the
+                cache is not bounded.
+        """
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.max_size_bytes = max_size_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._thread_lock = threading.Lock()
+
+    def entry_dir(self, key: str) -> pathlib.Path:
+        """Return the directory of the entry with the key."""
+        return self.cache_dir / key
+
+    def contains(self, key: str) -> bool:
+        """Return True if the cache contains an entry for the key."""
+        return (self.entry_dir(key) / METADATA_FILENAME).exists()
+
+    def hash_fingerprint(self, fingerprint: dict[str, Any]) -> str:
+        """Return the cache key of a fingerprint and the key version of the cache.
+
+        Args:
+            fingerprint: JSON serializable inputs identifying an entry.
+
+        Returns:
+            Hexadecimal SHA-256 digest of the fingerprint.
+        """
+        fingerprint = {"version": self.key_version, **fingerprint}
+        serialized = json.dumps(fingerprint, sort_keys=True).encode()
+        return hashlib.sha256(serialized).hexdigest()
+
+    def store_entry(
+        self,
+        key: str,
+        populate: Callable[[pathlib.Path], None],
+        metadata: dict[str, Any] | None = None,
+    ) -> bool:
+        """Add an entry to the cache.
+
+        The entry is assembled in a staging directory and moved into place atomically,
+        so that concurrent processes never observe partial entries. If another process
+        stored the same entry in the meantime, its entry is kept. The files of the
+        entry are made read-only, so 'populate' must not hardlink files that are
+        modified later, e.g. files in an output directory of the user.
+
+        Args:
+            key: Cache key of the entry.
+            populate: Function called with the staging directory, which creates the
+                files of the entry in it.
+            metadata: Additional metadata written to the 'entry.json' file.
+
+        Returns:
+            True if the entry was stored, False if the cache already contained it.
+        """
+        if self.contains(key):
+            return False
+        staging_dir = self.cache_dir / f"{STAGING_DIR_PREFIX}{uuid.uuid4().hex}"
+        try:
+            staging_dir.mkdir()
+            populate(staging_dir)
+            make_read_only(staging_dir)
+            now = time.time()
+            write_json(
+                staging_dir / METADATA_FILENAME,
+                {
+                    **(metadata or {}),
+                    "size_bytes": get_directory_size(staging_dir),
+                    "created": now,
+                    "last_used": now,
+                },
+            )
+            try:
+                staging_dir.rename(self.entry_dir(key))
+            except OSError:
+                # Another process stored the same entry in the meantime
+                return False
+        finally:
+            remove_tree(staging_dir)
+        return True
+
+    def read_metadata(self, key: str) -> dict[str, Any]:
+        """Return the metadata of an entry.
+
+        Raises:
+            OSError: If the cache does not contain the entry.
+            ValueError: If the metadata file is corrupted.
+        """
+        return read_json(self.entry_dir(key) / METADATA_FILENAME)
+
+    def touch(self, key: str) -> None:
+        """Mark an entry as used now, so that it is evicted last."""
+        metadata_path = self.entry_dir(key) / METADATA_FILENAME
+        try:
+            metadata = read_json(metadata_path)
+            metadata["last_used"] = time.time()
+            write_json(metadata_path, metadata)
+        except (OSError, ValueError) as e:
+            LOGGER.debug(f"Could not update {self.entry_description} '{key}': {e}")
+
+    def evict(self, protected: Collection[str] = ()) -> None:
+        """Remove the least recently used entries until the cache fits its budget.
+
+        Args:
+            protected: Keys of entries that must not be evicted, e.g. because they are
+                about to be restored.
+        """
+        if self.max_size_bytes is None:
+            return
+        entries = []
+        for entry_dir in self.cache_dir.iterdir():
+            if entry_dir.name.startswith("."):
+                continue
+            try:
+                metadata = read_json(entry_dir / METADATA_FILENAME)
+            except (OSError, ValueError):
+                continue
+            entries.append((metadata["last_used"], metadata["size_bytes"], entry_dir))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries, key=lambda entry: entry[0]):
+            if total_size <= self.max_size_bytes:
+                break
+            if entry_dir.name in protected or self._is_in_use(entry_dir):
+                continue
+            LOGGER.debug(f"Evicting {self.entry_description} '{entry_dir.name}'")
+            remove_entry(entry_dir)
+            total_size -= size
+
+    @contextlib.contextmanager
+    def lock(self) -> Iterator[None]:
+        """Hold an exclusive lock of the cache directory.
+
+        The lock is shared by all processes using the cache directory on platforms
+        supporting 'flock', and by the threads of this process on all platforms.
+        """
+        with (
+            self._thread_lock,
+            open(self.cache_dir / LOCK_FILENAME, "a") as lock_file,
+        ):
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def create_job_dir(self) -> pathlib.Path:
+        """Create a private job directory inside the cache directory.
+
+        Job directories are on the same file system as the cache entries, so that
+        files can be hardlinked between them, and are never evicted. They have to be
+        removed by the caller.
+        """
+        job_dir = self.cache_dir / f"{JOB_DIR_PREFIX}{uuid.uuid4().hex}"
+        job_dir.mkdir()
+        return job_dir
+
+    def _is_in_use(self, entry_dir: pathlib.Path) -> bool:
+        """Return True if an entry is in use and must not be evicted."""
+        return False
+
+
+def link_tree(
+    source_dir: pathlib.Path,
+    destination_dir: pathlib.Path,
+    link_function: Callable[[pathlib.Path, pathlib.Path], None] | None = None,
+) -> None:
+    """Materialize a directory tree file by file.
+
+    Existing files in the destination directory are replaced.
+
+    Args:
+        source_dir: Path of the source directory.
+        destination_dir: Path of the destination directory.
+        link_function: Function creating a file from a source file, by default
+            `link_file`.
+    """
+    if link_function is None:
+        link_function = link_file
+    destination_dir.mkdir(parents=True, exist_ok=True)
+    for root, dirnames, filenames in os.walk(source_dir):
+        relative_root = pathlib.Path(root).relative_to(source_dir)
+        for dirname in dirnames:
+            (destination_dir / relative_root / dirname).mkdir(exist_ok=True)
+        for filename in filenames:
+            destination = destination_dir / relative_root / filename
+            if destination.exists() or destination.is_symlink():
+                destination.unlink()
+            link_function(pathlib.Path(root) / filename, destination)
+
+
+def link_file(source: pathlib.Path, destination: pathlib.Path) -> None:
+    """Create a hardlink of a file, falling back to a reflink and then a copy."""
+    try:
+        os.link(source, destination)
+        return
+    except OSError:
+        pass
+    try:
+        reflink_file(source, destination)
+        return
+    except OSError:
+        destination.unlink(missing_ok=True)
+    shutil.copy2(source, destination)
+
+
+def clone_file(source: pathlib.Path, destination: pathlib.Path) -> None:
+    """Create a writable copy of a file, using a reflink if the file system supports
+    it, so that modifying either file never affects the other.
+    """
+    try:
+        reflink_file(source, destination)
+    except OSError:
+        destination.unlink(missing_ok=True)
+        shutil.copy2(source, destination)
+    os.chmod(destination, stat.S_IMODE(os.stat(source).st_mode) | stat.S_IWUSR)
+
+
+def reflink_file(source: pathlib.Path, destination: pathlib.Path) -> None:
+    """Clone a file on copy-on-write file systems like Btrfs and XFS.
+
+    Raises:
+        OSError: If the file system or platform does not support reflinks.
+    """
+    if fcntl is None:
+        raise OSError("Reflinks are not supported on this platform.")
+    with open(source, "rb") as source_file, open(destination, "wb") as dest_file:
+        fcntl.ioctl(dest_file.fileno(), _FICLONE, source_file.fileno())
+    shutil.copystat(source, destination)
+
+
+def get_directory_size(directory: pathlib.Path) -> int:
+    """Return the total size in bytes of all files within a directory tree."""
+    total_size = 0
+    pending = [directory]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(pathlib.Path(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    total_size += entry.stat(follow_symlinks=False).st_size
+    return total_size
+
+
+def make_read_only(directory: pathlib.Path) -> None:
+    """Remove the write permissions of all files within a directory tree."""
+    write_bits = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            if not os.path.islink(path):
+                os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) & ~write_bits)
+
+
+def remove_entry(entry_dir: pathlib.Path) -> None:
+    """Remove a cache entry, first renaming it so that it disappears atomically."""
+    trash_dir = entry_dir.with_name(f".trash-{uuid.uuid4().hex}")
+    try:
+        entry_dir.rename(trash_dir)
+    except OSError:
+        return
+    remove_tree(trash_dir)
+
+
+def remove_tree(directory: pathlib.Path) -> None:
+    """Remove a directory tree that may contain read-only files, ignoring errors."""
+    if os.name == "nt":
+        # Windows does not delete read-only files
+        for root, _, filenames in os.walk(directory):
+            for filename in filenames:
+                try:
+                    os.chmod(os.path.join(root, filename), stat.S_IWRITE)
+                except OSError:
+                    pass
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def read_json(path: pathlib.Path) -> dict:
+    """Read a JSON file."""
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_json(path: pathlib.Path, data: dict) -> None:
+    """Write JSON atomically by replacing the file with a completely written one."""
+    with tempfile.NamedTemporaryFile(
+        "w", dir=path.parent, prefix=".tmp-", suffix=".json", delete=False
+    ) as temp_file:
+        json.dump(data, temp_file)
+    os.replace(temp_file.name, path)
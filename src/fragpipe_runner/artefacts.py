@@ -0,0 +1,254 @@
+"""Module for caching the preprocessing artefacts FragPipe writes next to raw files.
+
+MSFragger converts raw files to '.mzBIN' files and writes '_uncalibrated.mzML' files
+next to the raw files. Reusing them skips the conversion on later searches of the same
+raw files, e.g. when reanalysing data with a different FASTA database.
+
+Artefacts are checked out of the cache by moving them next to their raw file before a
+search, and checked back in by `collect` afterwards. Moving instead of linking avoids
+any risk of a tool modifying a cached artefact in place. Checked in artefacts are
+read-only like the files of all cache entries.
+"""
+
+import glob
+import logging
+import pathlib
+import shutil
+import stat
+import uuid
+
+from ._lru import JOB_DIR_PREFIX, METADATA_FILENAME, EntryCache, remove_tree
+from .cache import get_fragpipe_fingerprint, get_rawfile_identity
+from .fingerprint import FingerprintIndex
+from .progress import RAWFILE_EXTENSIONS
+from .workflow import read_workflow
+
+LOGGER = logging.getLogger(__name__)
+
+ARTEFACT_SUFFIXES = (".mzBIN", "_uncalibrated.mzML")
+"""Suffixes of the files FragPipe writes next to raw files."""
+
+PREPROCESSING_PARAMETERS = (
+    "msfragger.calibrate_mass",
+    "msfragger.data_type",
+    "msfragger.deisotope",
+    "msfragger.deneutralloss",
+    "msfragger.fragment_mass_tolerance",
+    "msfragger.fragment_mass_units",
+    "msfragger.precursor_true_tolerance",
+    "msfragger.precursor_true_units",
+    "msfragger.isotope_error",
+    "msfragger.mass_offsets",
+    "msfragger.minimum_peaks",
+    "msfragger.minimum_ratio",
+    "msfragger.use_topN_peaks",
+    "msfragger.clear_mz_range",
+    "msfragger.remove_precursor_peak",
+    "msfragger.remove_precursor_range",
+    "msfragger.intensity_transform",
+    "msfragger.activation_types",
+)
+"""Workflow parameters that affect the content of preprocessing artefacts."""
+
+
+class ArtefactCache(EntryCache):
+    """Disk-bounded LRU cache of '.mzBIN' and '_uncalibrated.mzML' files.
+
+    Artefacts are stored per raw file identity, preprocessing parameters and FragPipe
+    installation, so that an artefact is only reused for the raw file, parameters and
+    converter version it was created with.
+
+    Example:
+        cache = ArtefactCache("path/to/artefacts", "path/to/fragpipe_23-1")
+        cache.restore(rawfile_paths, workflow_path)
+        run_fragpipe(...)
+        cache.collect(rawfile_dir, workflow_path)
+    """
+
+    entry_description = "FragPipe artefacts"
+    key_version = 2
+
+    def __init__(
+        self,
+        cache_dir: pathlib.Path | str,
+        fragpipe_root: pathlib.Path | str,
+        max_size_bytes: int | None = None,
+        fingerprint_index: FingerprintIndex | None = None,
+    ):
+        """Initialize the cache.
+
+        Args:
+            cache_dir: Directory where artefacts are stored. Created if missing. To
+                move artefacts without copying, it should be on the same file system
+                as the raw files.
+            fragpipe_root: Path to the FragPipe installation creating the artefacts.
+                Artefacts of other installations, e.g. with a different MSFragger
+                version, are not reused.
+            max_size_bytes: Maximum total size of all cached artefacts. If None, the
+                cache is not bounded.
+            fingerprint_index: Optional raw file fingerprint index used to identify
+                raw files by content. Otherwise, raw files are identified by their
+                name, size and mtime.
+        """
+        super().__init__(cache_dir, max_size_bytes)
+        self.fragpipe_fingerprint = get_fragpipe_fingerprint(fragpipe_root)
+        self.fingerprint_index = fingerprint_index
+
+    def restore(
+        self,
+        rawfile_paths: list[pathlib.Path],
+        workflow_path: pathlib.Path | str | None = None,
+    ) -> int:
+        """Move cached artefacts next to their raw files before a search.
+
+        Restored artefacts are removed from the cache and are writable again.
+
+        Args:
+            rawfile_paths: Paths of the raw files that are going to be searched.
+            workflow_path: Path to the workflow file of the search. If None, only
+                artefacts that were collected without a workflow are restored.
+
+        Returns:
+            The number of restored artefacts.
+        """
+        parameters = get_preprocessing_parameters(workflow_path)
+        restored = 0
+        for rawfile_path in rawfile_paths:
+            key = self._compute_key(rawfile_path, parameters)
+            if not self.contains(key):
+                continue
+            # Renaming the entry first ensures only one process checks it out
+            checkout_dir = self.cache_dir / f"{JOB_DIR_PREFIX}{uuid.uuid4().hex}"
+            try:
+                self.entry_dir(key).rename(checkout_dir)
+            except OSError:
+                continue
+            try:
+                for artefact_path in checkout_dir.iterdir():
+                    if artefact_path.name == METADATA_FILENAME:
+                        continue
+                    destination = rawfile_path.parent / artefact_path.name
+                    if destination.exists():
+                        continue
+                    shutil.move(artefact_path, destination)
+                    destination.chmod(
+                        stat.S_IMODE(destination.stat().st_mode) | stat.S_IWUSR
+                    )
+                    restored += 1
+            finally:
+                remove_tree(checkout_dir)
+        LOGGER.info(f"Restored {restored} cached FragPipe artefacts.")
+        return restored
+
+    def collect(
+        self,
+        rawfile_dir: pathlib.Path | str,
+        workflow_path: pathlib.Path | str | None = None,
+    ) -> int:
+        """Move the artefacts found next to raw files into the cache.
+
+        The artefacts of a raw file are stored as one entry, which records the raw file
+        and the preprocessing parameters. Artefacts without a matching raw file, and
+        artefacts of raw files that are already cached, are deleted.
+
+        Args:
+            rawfile_dir: The rawfile directory to collect artefacts from, including
+                subdirectories.
+            workflow_path: Path to the workflow file the artefacts were created with.
+
+        Returns:
+            The number of collected artefacts.
+        """
+        parameters = get_preprocessing_parameters(workflow_path)
+        artefacts: dict[pathlib.Path, list[pathlib.Path]] = {}
+        for artefact_path, rawfile_path in find_artefacts(rawfile_dir):
+            if rawfile_path is None:
+                LOGGER.debug(f"Deleting orphaned FragPipe artefact '{artefact_path}'")
+                artefact_path.unlink()
+                continue
+            artefacts.setdefault(rawfile_path, []).append(artefact_path)
+
+        collected = 0
+        for rawfile_path, artefact_paths in artefacts.items():
+
+            def populate(entry_dir: pathlib.Path) -> None:
+                for artefact_path in artefact_paths:
+                    shutil.move(artefact_path, entry_dir / artefact_path.name)
+
+            stored = self.store_entry(
+                self._compute_key(rawfile_path, parameters),
+                populate,
+                {"rawfile": rawfile_path.name, "parameters": parameters},
+            )
+            if stored:
+                collected += len(artefact_paths)
+                continue
+            for artefact_path in artefact_paths:
+                artefact_path.unlink(missing_ok=True)
+        LOGGER.info(f"Collected {collected} FragPipe artefacts from '{rawfile_dir}'.")
+        self.evict()
+        return collected
+
+    def _compute_key(
+        self,
+        rawfile_path: pathlib.Path,
+        parameters: dict[str, str],
+    ) -> str:
+        if self.fingerprint_index is None:
+            identity = get_rawfile_identity(rawfile_path)
+        else:
+            identity = self.fingerprint_index.get(rawfile_path).fast_hash
+        return self.hash_fingerprint(
+            {
+                "rawfile": identity,
+                "parameters": parameters,
+                "fragpipe": self.fragpipe_fingerprint,
+            }
+        )
+
+
+def find_artefacts(
+    rawfile_dir: pathlib.Path | str,
+) -> list[tuple[pathlib.Path, pathlib.Path | None]]:
+    """Find FragPipe artefacts and the raw files they were created from.
+
+    Args:
+        rawfile_dir: The rawfile directory to search, including subdirectories.
+
+    Returns:
+        A list of (artefact path, raw file path) tuples. The raw file path is None if
+        no raw file with the same name stem exists next to the artefact.
+    """
+    artefacts = []
+    for suffix in ARTEFACT_SUFFIXES:
+        for artefact_path in pathlib.Path(rawfile_dir).rglob(f"*{suffix}"):
+            stem = artefact_path.name[: -len(suffix)]
+            artefacts.append((artefact_path, _find_rawfile(artefact_path.parent, stem)))
+    return artefacts
+
+
+def get_preprocessing_parameters(
+    workflow_path: pathlib.Path | str | None,
+) -> dict[str, str]:
+    """Return the workflow parameters that affect preprocessing artefacts.
+
+    Args:
+        workflow_path: Path to the workflow file, or None.
+
+    Returns:
+        The values of `PREPROCESSING_PARAMETERS` set in the workflow.
+    """
+    if workflow_path is None:
+        return {}
+    parameters = read_workflow(workflow_path)
+    return {
+        key: parameters[key] for key in PREPROCESSING_PARAMETERS if key in parameters
+    }
+
+
+def _find_rawfile(directory: pathlib.Path, stem: str) -> pathlib.Path | None:
+    """Return the raw file with the given name stem in a directory, or None."""
+    for candidate in directory.glob(f"{glob.escape(stem)}.*"):
+        if candidate.stem == stem and candidate.suffix.lower() in RAWFILE_EXTENSIONS:
+            return candidate
+    return None
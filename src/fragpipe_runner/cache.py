@@ -0,0 +1,264 @@
+"""Module for caching complete FragPipe runs by the content of their inputs."""
+
+import hashlib
+import logging
+import pathlib
+import time
+from typing import Any
+
+import pandas as pd
+
+from ._lru import EntryCache, clone_file, get_directory_size, link_tree
+from .execute import RunResult, find_latest_log_file, run_fragpipe
+from .fingerprint import FingerprintIndex
+from .workflow import get_database_path, read_workflow
+
+LOGGER = logging.getLogger(__name__)
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+_OUTPUT_DIRNAME = "output"
+
+
+class ResultCache(EntryCache):
+    """Content-addressed cache of FragPipe output directories.
+
+    A cache entry is identified by a fingerprint of the canonicalized workflow, the
+    manifest, the identities of the raw files, the content of the FASTA database and
+    the FragPipe installation. Outputs are copied into and out of the cache with
+    reflinks where the file system supports them, falling back to regular copies, so
+    that later changes to an output directory never affect the cached entry.
+
+    The total size of the cache is bounded by evicting the least recently used
+    entries.
+
+    Example:
+        cache = ResultCache("path/to/cache", max_size_bytes=500 * 1024**3)
+        result = run_fragpipe_cached(cache, fragpipe_root, workflow, manifest, output)
+    """
+
+    entry_description = "FragPipe cache entry"
+
+    def __init__(
+        self,
+        cache_dir: pathlib.Path | str,
+        max_size_bytes: int | None = None,
+        fingerprint_index: FingerprintIndex | None = None,
+    ):
+        """Initialize the cache.
+
+        Args:
+            cache_dir: Directory where cache entries are stored. Created if missing.
+            max_size_bytes: Maximum total size of all cache entries. If None, the
+                cache is not bounded.
+            fingerprint_index: Optional raw file fingerprint index. If provided, raw
+                files are identified by their content hash, so that copies of a raw
+                file with a different mtime produce the same cache key. Otherwise, raw
+                files are identified by their name, size and mtime.
+        """
+        super().__init__(cache_dir, max_size_bytes)
+        self.fingerprint_index = fingerprint_index
+
+    def compute_key(
+        self,
+        fragpipe_root: pathlib.Path | str,
+        workflow_path: pathlib.Path | str,
+        manifest_path: pathlib.Path | str,
+    ) -> str:
+        """Compute the cache key of a FragPipe run.
+
+        Args:
+            fragpipe_root: Path to FragPipe installation directory
+            workflow_path: Path to workflow file
+            manifest_path: Path to manifest file
+
+        Returns:
+            Hexadecimal SHA-256 digest identifying the run.
+        """
+        fingerprint: dict[str, Any] = {
+            "fragpipe": get_fragpipe_fingerprint(fragpipe_root),
+            "workflow": canonicalize_workflow(workflow_path),
+            "manifest": get_manifest_fingerprint(manifest_path, self.fingerprint_index),
+        }
+        database_path = get_database_path(workflow_path)
+        if database_path is not None:
+            fingerprint["database"] = hash_file(database_path)
+        return self.hash_fingerprint(fingerprint)
+
+    def restore(self, key: str, output_dir: pathlib.Path | str) -> bool:
+        """Materialize a cached FragPipe output into an output directory.
+
+        Args:
+            key: Cache key of the run.
+            output_dir: Path to analysis output directory
+
+        Returns:
+            True if the entry was found and restored, False otherwise.
+        """
+        if not self.contains(key):
+            return False
+        LOGGER.info(f"Restoring cached FragPipe output '{key[:12]}' to '{output_dir}'")
+        link_tree(
+            self.entry_dir(key) / _OUTPUT_DIRNAME, pathlib.Path(output_dir), clone_file
+        )
+        self.touch(key)
+        return True
+
+    def store(self, key: str, output_dir: pathlib.Path | str) -> None:
+        """Add the output of a FragPipe run to the cache.
+
+        The entry is assembled in a staging directory and moved into place atomically,
+        so that concurrent runs never observe partial entries.
+
+        Args:
+            key: Cache key of the run.
+            output_dir: Path to analysis output directory
+        """
+        stored = self.store_entry(
+            key,
+            lambda entry_dir: link_tree(
+                pathlib.Path(output_dir), entry_dir / _OUTPUT_DIRNAME, clone_file
+            ),
+        )
+        if stored:
+            LOGGER.info(f"Stored FragPipe output of '{output_dir}' as '{key[:12]}'")
+            self.evict()
+
+
+def run_fragpipe_cached(
+    cache: ResultCache,
+    fragpipe_root: pathlib.Path | str,
+    workflow_path: pathlib.Path | str,
+    manifest_path: pathlib.Path | str,
+    output_dir: pathlib.Path | str,
+    **kwargs: Any,
+) -> RunResult:
+    """Run FragPipe, or restore the output of an identical earlier run from the cache.
+
+    Only successful runs are added to the cache.
+
+    Args:
+        cache: The result cache.
+        fragpipe_root: Path to FragPipe installation directory
+        workflow_path: Path to workflow file
+        manifest_path: Path to manifest file
+        output_dir: Path to analysis output directory
+        **kwargs: Additional keyword arguments passed to `run_fragpipe`.
+
+    Returns:
+        The `RunResult` of the FragPipe run. On a cache hit, 'cached' is True and
+        the result has an empty command and no resource usage.
+    """
+    key = cache.compute_key(fragpipe_root, workflow_path, manifest_path)
+    start_time = time.time()
+    if cache.restore(key, output_dir):
+        output_path = pathlib.Path(output_dir)
+        return RunResult(
+            command=[],
+            exit_code=0,
+            start_time=start_time,
+            end_time=time.time(),
+            output_dir=output_path,
+            log_path=find_latest_log_file(output_path),
+            output_size_bytes=get_directory_size(output_path),
+            cached=True,
+        )
+
+    result = run_fragpipe(
+        fragpipe_root, workflow_path, manifest_path, output_dir, **kwargs
+    )
+    if result.success:
+        cache.store(key, output_dir)
+    return result
+
+
+def canonicalize_workflow(workflow_path: pathlib.Path | str) -> list[list[str]]:
+    """Return the workflow parameters in a canonical, order-independent form.
+
+    The database path is excluded, as the database is identified by its content.
+
+    Args:
+        workflow_path: Path to workflow file
+
+    Returns:
+        Sorted list of [parameter, value] pairs.
+    """
+    parameters = read_workflow(workflow_path)
+    parameters.pop("database.db-path", None)
+    return sorted([key, value] for key, value in parameters.items())
+
+
+def get_fragpipe_fingerprint(fragpipe_root: pathlib.Path | str) -> list[list]:
+    """Return a fingerprint of a FragPipe installation.
+
+    The fingerprint consists of the names and sizes of the files in the 'lib' and
+    'tools' directories, which change with the FragPipe version and the versions of
+    bundled tools like MSFragger, IonQuant and DIA-NN.
+
+    Args:
+        fragpipe_root: Path to FragPipe installation directory
+
+    Returns:
+        Sorted list of [relative path, size] pairs.
+    """
+    fragpipe_root = pathlib.Path(fragpipe_root)
+    fingerprint = []
+    for directory_name in ("lib", "tools"):
+        directory = fragpipe_root / directory_name
+        if not directory.is_dir():
+            continue
+        for path in directory.iterdir():
+            size = path.stat().st_size if path.is_file() else -1
+            fingerprint.append([path.relative_to(fragpipe_root).as_posix(), size])
+    return sorted(fingerprint)
+
+
+def get_rawfile_identity(rawfile_path: pathlib.Path | str) -> list:
+    """Return a cheap identity of a raw file based on its name, size and mtime.
+
+    Bruker '.d' directories are identified by the summed size and latest mtime of
+    the files they contain.
+
+    Args:
+        rawfile_path: Path to the raw file or '.d' directory.
+
+    Returns:
+        A [name, size, mtime_ns] list.
+    """
+    rawfile_path = pathlib.Path(rawfile_path)
+    if rawfile_path.is_dir():
+        files = [p.stat() for p in rawfile_path.rglob("*") if p.is_file()]
+        size = sum(stat.st_size for stat in files)
+        mtime_ns = max((stat.st_mtime_ns for stat in files), default=0)
+    else:
+        stat = rawfile_path.stat()
+        size, mtime_ns = stat.st_size, stat.st_mtime_ns
+    return [rawfile_path.name, size, mtime_ns]
+
+
+def hash_file(path: pathlib.Path | str) -> str:
+    """Return the hexadecimal SHA-256 digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(_HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_manifest_fingerprint(
+    manifest: pathlib.Path | str | pd.DataFrame,
+    fingerprint_index: FingerprintIndex | None,
+) -> list[list]:
+    """Return the manifest rows with raw file paths replaced by raw file identities."""
+    if not isinstance(manifest, pd.DataFrame):
+        manifest = pd.read_csv(
+            manifest, sep="\t", header=None, dtype=str, keep_default_na=False
+        )
+    rows = list(manifest.itertuples(index=False))
+    if fingerprint_index is None:
+        identities = [get_rawfile_identity(row[0]) for row in rows]
+    else:
+        fingerprints = fingerprint_index.get_many(row[0] for row in rows)
+        identities = [
+            [pathlib.Path(f.path).name, f.size, f.fast_hash] for f in fingerprints
+        ]
+    return [[identity, *row[1:]] for identity, row in zip(identities, rows)]
@@ -0,0 +1,667 @@
+"""Module for running DIA quantification in parallel shards.
+
+A single FragPipe run quantifies all DIA files in one DIA-NN process. For large
+cohorts, the run is split into one library job, which searches the 'DIA-Lib',
+'GPF-DIA' and 'DIA' files of the manifest and builds the spectral library, and several
+quantification shards, which run DIA-NN with the library on a part of the 'DIA-Quant'
+and 'DIA' files. The per-shard DIA-NN reports are merged into one report and one
+matrix per matrix type afterwards.
+
+Note that DIA-NN normalizes and infers protein quantities per shard, so merged
+matrices are not identical to those of a single run over all files.
+
+Spectral libraries can be reused across analyses with a `LibraryCache`, so that adding
+quantification files to a cohort does not rebuild the library.
+"""
+
+import dataclasses
+import logging
+import math
+import pathlib
+import time
+from typing import Any
+
+import pandas as pd
+
+from ._lru import EntryCache, clone_file, remove_tree
+from .cache import (
+    canonicalize_workflow,
+    get_fragpipe_fingerprint,
+    get_manifest_fingerprint,
+    hash_file,
+)
+from .execute import RunResult, run_fragpipe
+from .fingerprint import FingerprintIndex
+from .scheduler import FragPipeScheduler, SearchJob
+from .workflow import SLICE_DB_PARAMETER, get_database_path, update_workflow_parameters
+
+LOGGER = logging.getLogger(__name__)
+
+LIBRARY_DATA_TYPES = ("DIA-Lib", "GPF-DIA", "DIA")
+"""Manifest data types of files searched to build the spectral library."""
+
+QUANT_DATA_TYPES = ("DIA-Quant", "DIA")
+"""Manifest data types of files quantified with DIA-NN."""
+
+LIBRARY_FILENAME = "library.tsv"
+"""Name of the spectral library FragPipe writes into the output directory."""
+
+DIANN_OUTPUT_DIRNAME = "diann-output"
+"""Name of the directory FragPipe writes the DIA-NN output to."""
+
+REPORT_FILENAME = "report.tsv"
+"""Name of the main DIA-NN report in long format."""
+
+PARQUET_REPORT_FILENAME = "report.parquet"
+"""Name of the main DIA-NN report written by DIA-NN 1.9 and later."""
+
+MATRIX_ID_COLUMNS = {
+    "report.pg_matrix.tsv": "Protein.Group",
+    "report.pr_matrix.tsv": "Precursor.Id",
+    "report.gg_matrix.tsv": "Genes",
+    "report.unique_genes_matrix.tsv": "Genes",
+}
+"""Names of the DIA-NN matrices with one column per run and their row ID column."""
+
+MATRIX_FILENAMES = tuple(MATRIX_ID_COLUMNS)
+"""Names of the DIA-NN matrices with one column per run."""
+
+LIBRARY_WORKFLOW_PARAMETERS = {
+    "diann.run-dia-nn": "false",
+}
+"""Workflow parameters of the library job, which skips quantification."""
+
+QUANT_WORKFLOW_PARAMETERS = {
+    "msfragger.run-msfragger": "false",
+    "crystalc.run-crystalc": "false",
+    "msbooster.run-msbooster": "false",
+    "peptide-prophet.run-peptide-prophet": "false",
+    "percolator.run-percolator": "false",
+    "ptmprophet.run-ptmprophet": "false",
+    "protein-prophet.run-protein-prophet": "false",
+    "phi-report.run-report": "false",
+    "ionquant.run-ionquant": "false",
+    "speclibgen.run-speclibgen": "false",
+    "diann.run-dia-nn": "true",
+}
+"""Workflow parameters of the quantification shards, which only run DIA-NN."""
+
+LIBRARY_EXCLUDED_PARAMETER_PREFIXES = ("diann.", "ionquant.", "tmtintegrator.")
+"""Prefixes of workflow parameters that do not affect the spectral library."""
+
+_LIBRARY_PARAMETER = "diann.library"
+
+
+class LibraryCache(EntryCache):
+    """Disk-bounded LRU cache of spectral libraries built by FragPipe.
+
+    A library is identified by the raw files it was built from, i.e. the 'DIA-Lib',
+    'GPF-DIA' and 'DIA' files of the manifest, the content of the FASTA database, the
+    workflow parameters except those of the quantification, and the FragPipe
+    installation. Files that are only quantified do not affect the key.
+
+    Example:
+        cache = LibraryCache("path/to/libraries", max_size_bytes=50 * 1024**3)
+        result = run_fragpipe_with_library_cache(
+            cache, fragpipe_root, workflow, manifest, output
+        )
+    """
+
+    entry_description = "spectral library"
+
+    def __init__(
+        self,
+        cache_dir: pathlib.Path | str,
+        max_size_bytes: int | None = None,
+        fingerprint_index: FingerprintIndex | None = None,
+    ):
+        """Initialize the cache.
+
+        Args:
+            cache_dir: Directory where libraries are stored. Created if missing.
+            max_size_bytes: Maximum total size of all cached libraries. If None, the
+                cache is not bounded.
+            fingerprint_index: Optional raw file fingerprint index used to identify
+                raw files by content. Otherwise, raw files are identified by their
+                name, size and mtime.
+        """
+        super().__init__(cache_dir, max_size_bytes)
+        self.fingerprint_index = fingerprint_index
+
+    def compute_key(
+        self,
+        fragpipe_root: pathlib.Path | str,
+        workflow_path: pathlib.Path | str,
+        manifest_path: pathlib.Path | str,
+    ) -> str:
+        """Compute the cache key of the spectral library of a DIA analysis.
+
+        Args:
+            fragpipe_root: Path to FragPipe installation directory
+            workflow_path: Path to workflow file
+            manifest_path: Path to manifest file
+
+        Returns:
+            Hexadecimal SHA-256 digest identifying the spectral library.
+        """
+        library_rows, _ = _split_manifest(manifest_path)
+        fingerprint: dict[str, Any] = {
+            "fragpipe": get_fragpipe_fingerprint(fragpipe_root),
+            "workflow": get_library_parameters(workflow_path),
+            "manifest": get_manifest_fingerprint(library_rows, self.fingerprint_index),
+        }
+        database_path = get_database_path(workflow_path)
+        if database_path is not None:
+            fingerprint["database"] = hash_file(database_path)
+        return self.hash_fingerprint(fingerprint)
+
+    def restore(self, key: str, library_path: pathlib.Path | str) -> bool:
+        """Copy a cached library to a path.
+
+        Args:
+            key: Cache key of the library.
+            library_path: Path to create the library at. Parent directories are
+                created if missing.
+
+        Returns:
+            True if the library was found and restored, False otherwise.
+        """
+        if not self.contains(key):
+            return False
+        library_path = pathlib.Path(library_path)
+        library_path.parent.mkdir(parents=True, exist_ok=True)
+        library_path.unlink(missing_ok=True)
+        clone_file(self.entry_dir(key) / LIBRARY_FILENAME, library_path)
+        LOGGER.info(
+            f"Restored cached spectral library '{key[:12]}' to '{library_path}'"
+        )
+        self.touch(key)
+        return True
+
+    def store(self, key: str, library_path: pathlib.Path | str) -> None:
+        """Add a spectral library to the cache.
+
+        The entry is assembled in a staging directory and moved into place atomically.
+
+        Args:
+            key: Cache key of the library.
+            library_path: Path to the library built by FragPipe.
+        """
+        stored = self.store_entry(
+            key,
+            lambda entry_dir: clone_file(
+                pathlib.Path(library_path), entry_dir / LIBRARY_FILENAME
+            ),
+        )
+        if stored:
+            LOGGER.info(f"Stored spectral library '{library_path}' as '{key[:12]}'")
+            self.evict()
+
+
+@dataclasses.dataclass
+class ShardedDIAPlan:
+    """Input files of a sharded DIA analysis.
+
+    Attributes:
+        library_workflow_path: Workflow file of the library job.
+        library_manifest_path: Manifest file of the library job.
+        library_output_dir: Output directory of the library job.
+        library_path: Path of the spectral library built by the library job.
+        shard_jobs: The quantification shards, which read the library from
+            'library_path'.
+    """
+
+    library_workflow_path: pathlib.Path
+    library_manifest_path: pathlib.Path
+    library_output_dir: pathlib.Path
+    library_path: pathlib.Path
+    shard_jobs: list[SearchJob]
+
+
+@dataclasses.dataclass
+class ShardedDIAResult:
+    """Outcome of a sharded DIA analysis.
+
+    Attributes:
+        library: Result of the library job.
+        shard_jobs: The quantification shards, empty if the library job failed.
+        merged_paths: Paths of the merged DIA-NN report and matrices.
+        merge_error: The exception raised while merging the shard outputs, or None.
+    """
+
+    library: RunResult
+    shard_jobs: list[SearchJob] = dataclasses.field(default_factory=list)
+    merged_paths: list[pathlib.Path] = dataclasses.field(default_factory=list)
+    merge_error: Exception | None = None
+
+    @property
+    def success(self) -> bool:
+        """True if the library job and all shards completed successfully, and their
+        outputs were merged.
+        """
+        return (
+            self.library.success
+            and bool(self.shard_jobs)
+            and all(job.success for job in self.shard_jobs)
+            and self.merge_error is None
+        )
+
+    def __bool__(self) -> bool:
+        return self.success
+
+
+def prepare_sharded_dia(
+    workflow_path: pathlib.Path | str,
+    manifest_path: pathlib.Path | str,
+    output_dir: pathlib.Path | str,
+    shards: int,
+) -> ShardedDIAPlan:
+    """Write the workflows and manifests of a library job and quantification shards.
+
+    The output directory contains a 'library' directory for the library job and a
+    'shards' directory with one subdirectory per shard. The shards can be run on
+    different nodes once the library job has finished.
+
+    Args:
+        workflow_path: Path to a DIA workflow file that builds a spectral library and
+            quantifies with DIA-NN.
+        manifest_path: Path to manifest file
+        output_dir: Path to analysis output directory
+        shards: Number of quantification shards. Fewer shards are created if there
+            are fewer files to quantify.
+
+    Returns:
+        The input files and output directories of the library job and shards.
+
+    Raises:
+        ValueError: If the manifest has no files to build the library from or no files
+            to quantify.
+    """
+    if shards < 1:
+        raise ValueError("'shards' must be at least 1.")
+    output_dir = pathlib.Path(output_dir)
+    library_rows, quant_rows = _split_manifest(manifest_path)
+    if library_rows.empty:
+        raise ValueError(
+            f"Manifest '{manifest_path}' has no files of types {LIBRARY_DATA_TYPES}."
+        )
+    if quant_rows.empty:
+        raise ValueError(
+            f"Manifest '{manifest_path}' has no files of types {QUANT_DATA_TYPES}."
+        )
+
+    library_dir = output_dir / "library"
+    library_dir.mkdir(parents=True, exist_ok=True)
+    library_workflow_path = library_dir / "library.workflow"
+    library_manifest_path = library_dir / "library.fp-manifest"
+    library_output_dir = library_dir / "output"
+    library_path = library_output_dir / LIBRARY_FILENAME
+    update_workflow_parameters(
+        workflow_path, library_workflow_path, LIBRARY_WORKFLOW_PARAMETERS
+    )
+    library_rows.to_csv(library_manifest_path, sep="\t", index=False, header=False)
+
+    shard_jobs = []
+    shard_size = math.ceil(len(quant_rows) / shards)
+    for index, start in enumerate(range(0, len(quant_rows), shard_size), start=1):
+        shard_dir = output_dir / "shards" / f"shard-{index:03d}"
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        shard_workflow_path = shard_dir / "shard.workflow"
+        shard_manifest_path = shard_dir / "shard.fp-manifest"
+        update_workflow_parameters(
+            workflow_path,
+            shard_workflow_path,
+            {
+                **QUANT_WORKFLOW_PARAMETERS,
+                _LIBRARY_PARAMETER: library_path.resolve().as_posix(),
+            },
+        )
+        quant_rows.iloc[start : start + shard_size].to_csv(
+            shard_manifest_path, sep="\t", index=False, header=False
+        )
+        shard_jobs.append(
+            SearchJob(shard_workflow_path, shard_manifest_path, shard_dir / "output")
+        )
+
+    LOGGER.info(
+        f"Prepared sharded DIA analysis with {len(library_rows)} library files and "
+        f"{len(quant_rows)} quantification files in {len(shard_jobs)} shards."
+    )
+    return ShardedDIAPlan(
+        library_workflow_path=library_workflow_path,
+        library_manifest_path=library_manifest_path,
+        library_output_dir=library_output_dir,
+        library_path=library_path,
+        shard_jobs=shard_jobs,
+    )
+
+
+def run_fragpipe_sharded_dia(
+    fragpipe_root: pathlib.Path | str,
+    workflow_path: pathlib.Path | str,
+    manifest_path: pathlib.Path | str,
+    output_dir: pathlib.Path | str,
+    shards: int,
+    scheduler: FragPipeScheduler | None = None,
+    library_cache: LibraryCache | None = None,
+    logger: logging.Logger | None = None,
+    **kwargs: Any,
+) -> ShardedDIAResult:
+    """Build a spectral library once and quantify DIA files in parallel shards.
+
+    Args:
+        fragpipe_root: Path to FragPipe installation directory
+        workflow_path: Path to a DIA workflow file that builds a spectral library and
+            quantifies with DIA-NN.
+        manifest_path: Path to manifest file
+        output_dir: Path to analysis output directory. The merged DIA-NN report and
+            matrices are written to its 'diann-output' directory.
+        shards: Number of quantification shards.
+        scheduler: Scheduler running the shards. Its queue must be empty. If None, a
+            scheduler running all shards in parallel within the resources of this
+            host is used.
+        library_cache: Optional spectral library cache. On a hit, the library job is
+            skipped and the shards use the cached library.
+        logger: Logger for logging messages. If None, the module-level logger is used.
+        **kwargs: Additional keyword arguments passed to `run_fragpipe` for the
+            library job.
+
+    Returns:
+        The results of the library job and shards, and the merged output files.
+    """
+    if logger is None:
+        logger = LOGGER
+    plan = prepare_sharded_dia(workflow_path, manifest_path, output_dir, shards)
+
+    key = ""
+    start_time = time.time()
+    if library_cache is not None:
+        key = library_cache.compute_key(fragpipe_root, workflow_path, manifest_path)
+    if library_cache is not None and library_cache.restore(key, plan.library_path):
+        library_result = RunResult(
+            command=[],
+            exit_code=0,
+            start_time=start_time,
+            end_time=time.time(),
+            output_dir=plan.library_output_dir,
+            cached=True,
+        )
+    else:
+        library_result = run_fragpipe(
+            fragpipe_root,
+            plan.library_workflow_path,
+            plan.library_manifest_path,
+            plan.library_output_dir,
+            logger=logger,
+            **kwargs,
+        )
+        if library_cache is not None and library_result and plan.library_path.exists():
+            library_cache.store(key, plan.library_path)
+    result = ShardedDIAResult(library=library_result)
+    if not library_result.success:
+        logger.error("Building the spectral library failed, skipping quantification.")
+        return result
+    if not plan.library_path.exists():
+        logger.error(f"Spectral library '{plan.library_path}' was not created.")
+        return result
+
+    if scheduler is None:
+        scheduler = FragPipeScheduler(
+            fragpipe_root, max_parallel_jobs=len(plan.shard_jobs), logger=logger
+        )
+    result.shard_jobs = scheduler.run(plan.shard_jobs)
+    if not result.success:
+        failed = [str(job.output_dir) for job in result.shard_jobs if not job.success]
+        logger.error(f"DIA quantification failed for shards: {failed}")
+        return result
+
+    try:
+        result.merged_paths = merge_dia_reports(
+            [job.output_dir for job in result.shard_jobs],
+            pathlib.Path(output_dir) / DIANN_OUTPUT_DIRNAME,
+        )
+    except Exception as e:
+        logger.error(f"Merging the DIA-NN output of the shards failed: {e}")
+        result.merge_error = e
+    return result
+
+
+def run_fragpipe_with_library_cache(
+    cache: LibraryCache,
+    fragpipe_root: pathlib.Path | str,
+    workflow_path: pathlib.Path | str,
+    manifest_path: pathlib.Path | str,
+    output_dir: pathlib.Path | str,
+    **kwargs: Any,
+) -> RunResult:
+    """Run a DIA workflow, reusing a cached spectral library if available.
+
+    On a cache hit, only DIA-NN is run on the 'DIA-Quant' and 'DIA' files of the
+    manifest, with a copy of the workflow pointing at the cached library. Otherwise,
+    the complete workflow is run and the library it builds is added to the cache if
+    the run succeeds.
+
+    Args:
+        cache: The spectral library cache.
+        fragpipe_root: Path to FragPipe installation directory
+        workflow_path: Path to a DIA workflow file that builds a spectral library and
+            quantifies with DIA-NN.
+        manifest_path: Path to manifest file
+        output_dir: Path to analysis output directory
+        **kwargs: Additional keyword arguments passed to `run_fragpipe`.
+
+    Returns:
+        The `RunResult` of the FragPipe run.
+    """
+    key = cache.compute_key(fragpipe_root, workflow_path, manifest_path)
+    _, quant_rows = _split_manifest(manifest_path)
+    if quant_rows.empty or not cache.contains(key):
+        result = run_fragpipe(
+            fragpipe_root, workflow_path, manifest_path, output_dir, **kwargs
+        )
+        library_path = pathlib.Path(output_dir) / LIBRARY_FILENAME
+        if result.success and library_path.exists():
+            cache.store(key, library_path)
+        return result
+
+    job_dir = cache.create_job_dir()
+    try:
+        library_path = job_dir / LIBRARY_FILENAME
+        if not cache.restore(key, library_path):
+            # The entry was evicted in the meantime
+            return run_fragpipe(
+                fragpipe_root, workflow_path, manifest_path, output_dir, **kwargs
+            )
+        quant_workflow_path = job_dir / "quant.workflow"
+        quant_manifest_path = job_dir / pathlib.Path(manifest_path).name
+        update_workflow_parameters(
+            workflow_path,
+            quant_workflow_path,
+            {**QUANT_WORKFLOW_PARAMETERS, _LIBRARY_PARAMETER: library_path.as_posix()},
+        )
+        quant_rows.to_csv(quant_manifest_path, sep="\t", index=False, header=False)
+        return run_fragpipe(
+            fragpipe_root,
+            quant_workflow_path,
+            quant_manifest_path,
+            output_dir,
+            **kwargs,
+        )
+    finally:
+        remove_tree(job_dir)
+
+
+def get_library_parameters(workflow_path: pathlib.Path | str) -> list[list[str]]:
+    """Return the canonicalized workflow parameters that affect the spectral library.
+
+    Args:
+        workflow_path: Path to workflow file
+
+    Returns:
+        Sorted list of [parameter, value] pairs, excluding the database path, the
+        number of database slices and parameters starting with one of
+        `LIBRARY_EXCLUDED_PARAMETER_PREFIXES`.
+    """
+    return [
+        [key, value]
+        for key, value in canonicalize_workflow(workflow_path)
+        if key != SLICE_DB_PARAMETER
+        and not key.startswith(LIBRARY_EXCLUDED_PARAMETER_PREFIXES)
+    ]
+
+
+def merge_dia_reports(
+    shard_output_dirs: list[pathlib.Path | str],
+    merged_dir: pathlib.Path | str,
+) -> list[pathlib.Path]:
+    """Merge the DIA-NN reports and matrices of quantification shards.
+
+    The long format report, 'report.tsv' or 'report.parquet', is concatenated without
+    loading it into memory at once. Matrices are outer joined on their row ID column,
+    e.g. 'Protein.Group', so that the merged matrix has one column per run of all
+    shards. Annotation columns like 'Genes' are taken from the first shard containing
+    the row, as they can differ between shards.
+
+    Args:
+        shard_output_dirs: Output directories of the shards.
+        merged_dir: Directory to write the merged files to. Created if missing.
+
+    Returns:
+        Paths of the merged files. Matrices that no shard wrote are skipped.
+
+    Raises:
+        FileNotFoundError: If no shard wrote a report, or a report or matrix is
+            missing from some of the shards.
+        ValueError: If the reports of the shards have different columns.
+        ImportError: If the reports are Parquet files and pyarrow is not installed.
+    """
+    merged_dir = pathlib.Path(merged_dir)
+    merged_dir.mkdir(parents=True, exist_ok=True)
+    diann_dirs = [pathlib.Path(d) / DIANN_OUTPUT_DIRNAME for d in shard_output_dirs]
+    merged_paths = []
+
+    report_filenames = [
+        filename
+        for filename in (REPORT_FILENAME, PARQUET_REPORT_FILENAME)
+        if any((diann_dir / filename).exists() for diann_dir in diann_dirs)
+    ]
+    if not report_filenames:
+        raise FileNotFoundError(
+            f"No shard wrote a '{REPORT_FILENAME}' or '{PARQUET_REPORT_FILENAME}'."
+        )
+
+    for filename in (*report_filenames, *MATRIX_FILENAMES):
+        shard_paths = [diann_dir / filename for diann_dir in diann_dirs]
+        missing = [path for path in shard_paths if not path.exists()]
+        if len(missing) == len(shard_paths):
+            LOGGER.debug(f"Not merging '{filename}', not written by any shard")
+            continue
+        if missing:
+            raise FileNotFoundError(
+                f"'{filename}' is missing from {len(missing)} shards: "
+                f"{[str(path.parent.parent) for path in missing]}"
+            )
+        merged_path = merged_dir / filename
+        if filename == REPORT_FILENAME:
+            _concatenate_tables(shard_paths, merged_path)
+        elif filename == PARQUET_REPORT_FILENAME:
+            _concatenate_parquet_files(shard_paths, merged_path)
+        else:
+            _join_matrices(shard_paths, merged_path, MATRIX_ID_COLUMNS[filename])
+        merged_paths.append(merged_path)
+
+    LOGGER.info(
+        f"Merged {len(merged_paths)} DIA-NN output files of {len(diann_dirs)} shards "
+        f"into '{merged_dir}'."
+    )
+    return merged_paths
+
+
+def _concatenate_tables(paths: list[pathlib.Path], output_path: pathlib.Path) -> None:
+    """Concatenate tab-separated files with identical headers."""
+    with open(output_path, "w") as output_file:
+        header = None
+        for path in paths:
+            with open(path) as table_file:
+                file_header = table_file.readline()
+                if header is None:
+                    header = file_header
+                    output_file.write(header)
+                elif file_header != header:
+                    raise ValueError(f"Header of '{path}' differs from other shards.")
+                for line in table_file:
+                    output_file.write(line)
+
+
+def _concatenate_parquet_files(
+    paths: list[pathlib.Path], output_path: pathlib.Path
+) -> None:
+    """Concatenate Parquet files with identical schemas row group by row group."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Merging DIA-NN Parquet reports requires pyarrow, install it with "
+            "'pip install fragpipe-runner[parquet]'."
+        ) from e
+
+    writer = None
+    try:
+        for path in paths:
+            parquet_file = pq.ParquetFile(path)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, parquet_file.schema_arrow)
+            elif not parquet_file.schema_arrow.equals(writer.schema):
+                raise ValueError(f"Schema of '{path}' differs from other shards.")
+            for index in range(parquet_file.num_row_groups):
+                writer.write_table(parquet_file.read_row_group(index))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _join_matrices(
+    paths: list[pathlib.Path], output_path: pathlib.Path, id_column: str
+) -> None:
+    """Outer join matrices on their row ID column.
+
+    Columns present in all matrices are annotation columns and taken from the first
+    matrix containing a row, all other columns are the runs of each matrix.
+    """
+    matrices = [pd.read_csv(path, sep="\t") for path in paths]
+    for path, matrix in zip(paths, matrices):
+        if id_column not in matrix.columns:
+            raise ValueError(f"Matrix '{path}' has no '{id_column}' column.")
+    annotation_columns = [
+        column
+        for column in matrices[0].columns
+        if all(column in matrix.columns for matrix in matrices[1:])
+    ]
+    merged = pd.concat(
+        [matrix[annotation_columns] for matrix in matrices], ignore_index=True
+    ).drop_duplicates(id_column)
+    for matrix in matrices:
+        run_columns = [c for c in matrix.columns if c not in annotation_columns]
+        merged = merged.merge(
+            matrix[[id_column, *run_columns]], on=id_column, how="left"
+        )
+    merged.to_csv(output_path, sep="\t", index=False)
+
+
+def _split_manifest(
+    manifest_path: pathlib.Path | str,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Return the library rows and the quantification rows of a manifest.
+
+    Files used for both library and quantification are listed in both tables. In the
+    quantification rows, their data type is changed to 'DIA-Quant', so that they are
+    only quantified.
+    """
+    manifest = pd.read_csv(
+        manifest_path, sep="\t", header=None, dtype=str, keep_default_na=False
+    )
+    data_types = manifest.iloc[:, 3]
+    library_rows = manifest[data_types.isin(LIBRARY_DATA_TYPES)]
+    quant_rows = manifest[data_types.isin(QUANT_DATA_TYPES)].copy()
+    quant_rows.iloc[:, 3] = "DIA-Quant"
+    return library_rows, quant_rows
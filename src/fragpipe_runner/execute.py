@@ -1,30 +1,164 @@
 """Module for executing FragPipe in headless mode."""
 
+import asyncio
+import collections
+import dataclasses
 import logging
 import os
 import pathlib
-import shutil
 import subprocess
+import sys
 import tempfile
+import threading
 import time
+from collections.abc import Awaitable, Callable
+from typing import TYPE_CHECKING, TextIO
+
+from ._lru import get_directory_size
+from .manifest import create_rawfile_view
+from .progress import (
+    FragPipeProgressParser,
+    ProgressCallback,
+    ProgressEvent,
+    StageFinished,
+    StageStarted,
+)
+from .resources import (
+    ProcessTreeSampler,
+    get_auto_ram_and_threads,
+    is_sampling_supported,
+    sample_process_tree,
+)
+from .timing import TimingReport, create_timing_report, write_timing_report
+from .transfer import OutputSync, move_tree
+from .watchdog import CANCELLED, StageTimeout, Watchdog, terminate_process_group
+
+if TYPE_CHECKING:
+    from .artefacts import ArtefactCache
+    from .retry import RetryAttempt
 
 LOGGER = logging.getLogger(__name__)
 
+LineCallback = Callable[[str], Awaitable[None]]
+"""Coroutine function that is awaited with every line of FragPipe output."""
+
+# Maximum length of a single line read from FragPipe output streams, in bytes
+_STREAM_LINE_LIMIT = 1024 * 1024
+# Number of stderr lines kept in memory for error reporting
+_STDERR_TAIL_LINES = 200
+# 'ru_maxrss' is reported in bytes on macOS and in kilobytes on other systems
+_RUSAGE_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+# Unit of the 'ru_inblock' and 'ru_oublock' block I/O counters
+_BLOCK_SIZE = 512
+
+
+@dataclasses.dataclass(slots=True)
+class RunResult:
+    """Outcome and resource usage of a FragPipe run.
+
+    A RunResult evaluates to True if FragPipe completed successfully, so that it can
+    be used like the boolean returned by earlier versions of `run_fragpipe`.
+
+    Attributes:
+        command: The command used to run FragPipe.
+        exit_code: Exit code of the FragPipe process.
+        start_time: POSIX timestamp of when FragPipe was started.
+        end_time: POSIX timestamp of when the run finished, including moving the
+            output from the temporary directory.
+        output_dir: Path to analysis output directory
+        log_path: Path to the FragPipe log file, or None if no log file was found.
+        timing: Per-stage timing report, or None if it could not be created.
+        peak_rss_bytes: Peak resident memory of the largest process in the FragPipe
+            process tree, or None if not available on this platform.
+        cpu_seconds: User and system CPU time of the FragPipe process tree, or None if
+            not available on this platform.
+        read_bytes: Bytes read from the block layer by the FragPipe process tree, or
+            None if not available on this platform.
+        written_bytes: Bytes written to the block layer by the FragPipe process tree,
+            or None if not available on this platform.
+        output_size_bytes: Total size of all files in the output directory.
+        resource_profile_path: Path to the CSV file written by the process tree
+            sampler, or None if resource sampling was not enabled.
+        cached: True if the output was restored from a result cache instead of
+            running FragPipe, see `fragpipe_runner.cache`.
+        termination_reason: Why FragPipe was terminated by the watchdog, e.g.
+            "timeout", "stage_timeout" or "stall", see `fragpipe_runner.watchdog`.
+            None if FragPipe was not terminated.
+        error_output: The last lines FragPipe wrote to stderr, or None if FragPipe
+            did not write to stderr.
+        attempts: Earlier attempts of the run that failed and were retried, see
+            `fragpipe_runner.retry`.
+        rawfile_errors: Errors of processing raw files as they arrived, by raw file
+            name, see `fragpipe_runner.watchfolder`.
+    """
+
+    command: list[str]
+    exit_code: int
+    start_time: float
+    end_time: float
+    output_dir: pathlib.Path
+    log_path: pathlib.Path | None = None
+    timing: TimingReport | None = None
+    peak_rss_bytes: int | None = None
+    cpu_seconds: float | None = None
+    read_bytes: int | None = None
+    written_bytes: int | None = None
+    output_size_bytes: int | None = None
+    resource_profile_path: pathlib.Path | None = None
+    cached: bool = False
+    termination_reason: str | None = None
+    error_output: str | None = None
+    attempts: list["RetryAttempt"] = dataclasses.field(default_factory=list)
+    rawfile_errors: dict[str, str] = dataclasses.field(default_factory=dict)
+
+    @property
+    def success(self) -> bool:
+        """True if FragPipe completed successfully."""
+        return self.exit_code == 0
+
+    @property
+    def wall_seconds(self) -> float:
+        """Wall time of the run in seconds."""
+        return self.end_time - self.start_time
+
+    def __bool__(self) -> bool:
+        return self.success
+
+
+@dataclasses.dataclass
+class _TempOutput:
+    """Temporary FragPipe output directory and its parent temp directory."""
+
+    directory: tempfile.TemporaryDirectory
+    temp_dir_path: pathlib.Path
+    temp_dir_existed: bool
+    sync: OutputSync | None = None
+
 
 def run_fragpipe(
     fragpipe_root: pathlib.Path | str,
     workflow_path: pathlib.Path | str,
     manifest_path: pathlib.Path | str,
     output_dir: pathlib.Path | str,
-    ram: int = 0,
-    threads: int = -1,
+    ram: int | str = 0,
+    threads: int | str = -1,
     temp_dir: pathlib.Path | str | None = None,
+    verify_transfer: bool = False,
+    sync_output: bool = False,
+    isolate_rawfiles: bool = False,
+    auto_ram_headroom: float = 0.2,
     logger: logging.Logger | None = None,
-) -> bool:
+    progress_callback: ProgressCallback | None = None,
+    resource_sampling_interval: float | None = None,
+    timeout: float | None = None,
+    stage_timeout: StageTimeout | None = None,
+    stall_timeout: float | None = None,
+) -> RunResult:
     """Run FragPipe in headless mode with the specified parameters.
 
     If FragPipe fails to create a log file, a log file will be created manually using
-    the redirected stdout.
+    the redirected stdout. After the run, a per-stage timing report is written next to
+    the log file, see `fragpipe_runner.timing`.
 
     Tested with FragPipe v23.
 
@@ -34,126 +168,673 @@ def run_fragpipe(
         manifest_path: Path to manifest file
         output_dir: Path to analysis output directory
         ram: The maximum allowed memory size for FragPipe to use (in GB). Set to 0 to
-            let FragPipe decide.
+            let FragPipe decide, which uses the memory of the host. Set to "auto" to
+            use the cgroup memory limit of the current process minus
+            'auto_ram_headroom', which prevents the JVM from being OOM-killed inside
+            containers and Slurm jobs.
         threads: The number of CPU threads for FragPipe to use. Set to -1 to let
-            FragPipe decide (by default the number of cores - 1).
+            FragPipe decide (by default the number of cores - 1). Set to "auto" to use
+            the cgroup CPU quota and CPU affinity of the current process.
         temp_dir: Path to temporary directory to use for FragPipe output. If None,
             FragPipe output will be written directly to 'output_dir'. If provided,
             FragPipe output will first be written to the temporary directory, and then
             moved to 'output_dir' after FragPipe finishes. This can be useful to avoid
             crashes due to too long file paths on Windows systems. The temporary
-            directory will be deleted after the output has been moved.
+            directory will be deleted after the output has been moved. If both
+            directories are on the same file system, whole subtrees are renamed,
+            otherwise files are copied in parallel.
+        verify_transfer: If True, files copied from 'temp_dir' to 'output_dir' across
+            file systems are verified by checksum before they are removed from
+            'temp_dir'.
+        sync_output: If True and 'temp_dir' is provided, finished files, e.g. the
+            pepXML file of each raw file, are copied from 'temp_dir' to 'output_dir'
+            in the background while FragPipe is still running, see
+            `fragpipe_runner.transfer.OutputSync`. Only the remaining files are moved
+            after FragPipe finishes.
+        isolate_rawfiles: If True, FragPipe searches a temporary directory of
+            symlinks to the raw files of the manifest, created in 'temp_dir' if
+            provided and in 'output_dir' otherwise. The '.mzBIN' and
+            '_uncalibrated.mzML' files FragPipe writes next to the raw files are then
+            confined to this directory and removed after the run, so that concurrent
+            runs can share raw files, see `manifest.create_rawfile_view`.
+        auto_ram_headroom: Fraction of the memory limit that is not assigned to
+            FragPipe when 'ram' is "auto", leaving room for JVM overhead and native
+            tools like DIA-NN.
         logger: Logger for logging messages. If None, the module-level logger is used.
+        progress_callback: Optional function that is called with every progress event
+            parsed from FragPipe stdout while FragPipe is running, see
+            `fragpipe_runner.progress`.
+        resource_sampling_interval: If provided, the RSS, CPU time, thread count and
+            I/O of the FragPipe process tree (including Java, DIA-NN and Philosopher
+            child processes) are sampled through '/proc' every specified number of
+            seconds and written to 'fragpipe_resources.csv' in 'output_dir'. The peak
+            RSS of the result is then the peak of the summed RSS of all processes.
+            Only supported on Linux, ignored with a warning on other systems.
+        timeout: Maximum wall time of the FragPipe run in seconds.
+        stage_timeout: Maximum wall time of a single FragPipe task in seconds, or a
+            mapping of tool names like "MSFragger" to their maximum wall time.
+        stall_timeout: Maximum time in seconds FragPipe may run without writing to
+            stdout, e.g. when a tool hangs or the JVM is stuck in garbage collection.
+
+    If any of the timeouts is exceeded, FragPipe and all its child processes are
+    terminated and the reason is reported as `RunResult.termination_reason`.
 
     Returns:
-        True if FragPipe completed successfully, False otherwise
+        A `RunResult` with the exit code, timings and resource usage of the run. The
+        result evaluates to True if FragPipe completed successfully, False otherwise.
 
     Raises:
         FileNotFoundError: If the FragPipe executable file is not found.
+        ValueError: If 'ram' or 'threads' is a string other than "auto".
     """
 
+    job = start_fragpipe(
+        fragpipe_root,
+        workflow_path,
+        manifest_path,
+        output_dir,
+        ram=ram,
+        threads=threads,
+        temp_dir=temp_dir,
+        verify_transfer=verify_transfer,
+        sync_output=sync_output,
+        isolate_rawfiles=isolate_rawfiles,
+        auto_ram_headroom=auto_ram_headroom,
+        logger=logger,
+        progress_callback=progress_callback,
+        resource_sampling_interval=resource_sampling_interval,
+        timeout=timeout,
+        stage_timeout=stage_timeout,
+        stall_timeout=stall_timeout,
+    )
+    try:
+        return job.wait()
+    except BaseException:
+        # E.g. KeyboardInterrupt, FragPipe runs in its own session and is not
+        # interrupted together with the current process
+        job.cancel()
+        raise
+
+
+def start_fragpipe(
+    fragpipe_root: pathlib.Path | str,
+    workflow_path: pathlib.Path | str,
+    manifest_path: pathlib.Path | str,
+    output_dir: pathlib.Path | str,
+    ram: int | str = 0,
+    threads: int | str = -1,
+    temp_dir: pathlib.Path | str | None = None,
+    verify_transfer: bool = False,
+    sync_output: bool = False,
+    isolate_rawfiles: bool = False,
+    auto_ram_headroom: float = 0.2,
+    logger: logging.Logger | None = None,
+    progress_callback: ProgressCallback | None = None,
+    resource_sampling_interval: float | None = None,
+    timeout: float | None = None,
+    stage_timeout: StageTimeout | None = None,
+    stall_timeout: float | None = None,
+) -> "FragPipeJob":
+    """Start FragPipe in headless mode without waiting for it to finish.
+
+    Takes the same arguments as `run_fragpipe`. FragPipe output is forwarded and the
+    run is finalized in a background thread, e.g. by moving the output from
+    'temp_dir' and writing the timing report.
+
+    Returns:
+        A `FragPipeJob` handle to poll, wait for or cancel the run.
+
+    Raises:
+        FileNotFoundError: If the FragPipe executable file is not found.
+        ValueError: If 'ram' or 'threads' is a string other than "auto".
+    """
     if logger is None:
         logger = LOGGER
 
-    if os.name == "nt":
-        executable_name = "fragpipe.bat"
-    elif os.name == "posix":
-        executable_name = "fragpipe"
-    else:
-        raise OSError(f"Unsupported operating system: {os.name}")
-
-    fragpipe_exec_path = pathlib.Path(fragpipe_root) / "bin" / executable_name
-    if not fragpipe_exec_path.exists():
-        raise FileNotFoundError(
-            f"FragPipe executable file not found at {fragpipe_exec_path}. "
-            "Please check the path."
-        )
+    fragpipe_exec_path = _get_fragpipe_executable(fragpipe_root)
 
     final_output_path = pathlib.Path(output_dir)
     final_output_path.mkdir(parents=True, exist_ok=True)
     logger.info(f"Running FragPipe with output directory '{final_output_path}'")
 
-    if temp_dir is None:
-        output_path = final_output_path
-    else:
-        temp_dir_path = pathlib.Path(temp_dir)
-        temp_dir_existed = temp_dir_path.exists()
-        if not temp_dir_existed:
-            temp_dir_path.mkdir(parents=True, exist_ok=True)
-        temp_output = tempfile.TemporaryDirectory(dir=temp_dir_path)
-        output_path = pathlib.Path(temp_output.name)
-        output_path.mkdir(parents=True, exist_ok=True)
-        logger.debug(f"Using temporary directory '{output_path}' for FragPipe output.")
+    ram, threads = resolve_ram_and_threads(ram, threads, auto_ram_headroom, logger)
+    output_path, temp_output = _setup_output_path(final_output_path, temp_dir, logger)
+    rawfile_view = None
+    try:
+        if temp_output is not None and sync_output:
+            temp_output.sync = OutputSync(
+                output_path, final_output_path, verify_checksums=verify_transfer
+            )
+            temp_output.sync.start()
+        if isolate_rawfiles:
+            manifest_path, rawfile_view = _setup_rawfile_view(
+                manifest_path, final_output_path, temp_dir, logger
+            )
+        cmd = _build_fragpipe_command(
+            fragpipe_exec_path, workflow_path, manifest_path, output_path, ram, threads
+        )
+        return FragPipeJob(
+            cmd,
+            final_output_path,
+            output_path,
+            temp_output,
+            rawfile_view,
+            verify_transfer,
+            progress_callback,
+            resource_sampling_interval,
+            timeout,
+            stage_timeout,
+            stall_timeout,
+            logger,
+        )
+    except BaseException:
+        if rawfile_view is not None:
+            rawfile_view.cleanup()
+        if temp_output is not None:
+            _finalize_temp_output(temp_output, output_path, final_output_path, logger)
+        raise
 
-    cmd = [
-        fragpipe_exec_path.as_posix(),
-        "--headless",
-        "--workflow",
-        pathlib.Path(workflow_path).resolve().as_posix(),
-        "--manifest",
-        pathlib.Path(manifest_path).resolve().as_posix(),
-        "--workdir",
-        pathlib.Path(output_path).resolve().as_posix(),
-        "--ram",
-        str(ram),
-    ]
-    if threads > 0:
-        cmd.extend(["--threads", str(threads)])
 
-    # The redirected log file is never created in the temp output directory
-    redirected_log_path = final_output_path / "fragpipe_stdout_redirect.log"
-    try:
-        start_time = time.time()
-        with open(redirected_log_path, "w") as redirected_log_file:
-            result = subprocess.run(
-                cmd,
-                check=True,
-                stdout=redirected_log_file,
-                stderr=subprocess.PIPE,
+@dataclasses.dataclass(frozen=True)
+class JobStats:
+    """Live statistics of a running FragPipe job.
+
+    Attributes:
+        elapsed_seconds: Wall time since FragPipe was started.
+        current_stage: Name of the FragPipe task that is running, or None.
+        current_tool: Tool of the FragPipe task that is running, or None.
+        finished_stages: Number of FragPipe tasks that have finished.
+        rss_bytes: Summed resident memory of the FragPipe process tree, or None if
+            not available on this platform.
+        cpu_seconds: CPU time consumed by the running processes of the FragPipe
+            process tree, or None if not available on this platform.
+        threads: Number of threads of the FragPipe process tree, or None if not
+            available on this platform.
+    """
+
+    elapsed_seconds: float
+    current_stage: str | None
+    current_tool: str | None
+    finished_stages: int
+    rss_bytes: int | None = None
+    cpu_seconds: float | None = None
+    threads: int | None = None
+
+
+class FragPipeJob:
+    """Handle of a FragPipe run started with `start_fragpipe`.
+
+    Example:
+        job = start_fragpipe(fragpipe_root, workflow, manifest, output_dir)
+        while job.poll() is None:
+            print(job.stats())
+            time.sleep(60)
+        result = job.wait()
+    """
+
+    def __init__(
+        self,
+        command: list[str],
+        final_output_path: pathlib.Path,
+        output_path: pathlib.Path,
+        temp_output: _TempOutput | None,
+        rawfile_view: tempfile.TemporaryDirectory | None,
+        verify_transfer: bool,
+        progress_callback: ProgressCallback | None,
+        resource_sampling_interval: float | None,
+        timeout: float | None,
+        stage_timeout: StageTimeout | None,
+        stall_timeout: float | None,
+        logger: logging.Logger,
+    ):
+        """Start the FragPipe process, use `start_fragpipe` instead."""
+        self.command = command
+        self.output_dir = final_output_path
+        self.logger = logger
+        self._output_path = output_path
+        self._temp_output = temp_output
+        self._rawfile_view = rawfile_view
+        self._verify_transfer = verify_transfer
+        self._progress_callback = progress_callback
+        self._stage_events: list[StageFinished] = []
+        self._current_stage: StageStarted | None = None
+        self._result: RunResult | None = None
+        self._error: BaseException | None = None
+
+        # The redirected log file is never created in the temp output directory
+        self._redirected_log_path = final_output_path / "fragpipe_stdout_redirect.log"
+        self._resource_profile_path = final_output_path / "fragpipe_resources.csv"
+        self.start_time = time.time()
+        self._redirected_log_file = open(self._redirected_log_path, "w")
+        # Stderr is spooled to a file, so that it can't block the stdout pipe
+        self._stderr_file = tempfile.TemporaryFile("w+", errors="replace")
+        try:
+            # A new session allows terminating the whole FragPipe process tree
+            self._process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=self._stderr_file,
                 text=True,
+                errors="replace",
                 shell=False,
+                start_new_session=True,
             )
-        duration = (time.time() - start_time) / 60
-        logger.info(f"FragPipe completed successfully in {duration:.2f} minutes.")
-        if result.stderr:
-            logger.debug(f"FragPipe stderr output:\n{result.stderr}")
-        execution_successful = True
-    except subprocess.CalledProcessError as e:
-        logger.error(
-            f"Error running FragPipe: {e}\nError output:\n{e.stderr}\n"
-            f"A partial log file may be found at '{redirected_log_path}'"
+        except BaseException:
+            self._redirected_log_file.close()
+            self._stderr_file.close()
+            raise
+
+        self._sampler = _start_resource_sampler(
+            self.pid, self._resource_profile_path, resource_sampling_interval, logger
         )
-        execution_successful = False
-    finally:
-        if temp_dir is not None:
-            try:
-                _move_and_replace_folder_contents(output_path, final_output_path)
-            except Exception as e:
-                logger.error(f"Failed to move files from temp directory: {e}")
-            temp_output.cleanup()
-            if not temp_dir_existed:
+        self._watchdog = Watchdog(
+            self.pid, timeout, stage_timeout, stall_timeout, logger=logger
+        )
+        if not (timeout is None and stage_timeout is None and stall_timeout is None):
+            self._watchdog.start()
+        self._thread = threading.Thread(
+            target=self._supervise, name=f"fragpipe-{self.pid}"
+        )
+        self._thread.start()
+
+    @property
+    def pid(self) -> int:
+        """Process ID of the FragPipe process."""
+        return self._process.pid
+
+    def poll(self) -> int | None:
+        """Return the exit code of FragPipe if the job has finished, None otherwise.
+
+        A job has finished once FragPipe has exited and its output was finalized.
+
+        Raises:
+            Exception: Any exception raised while supervising the job.
+        """
+        if self._thread.is_alive():
+            return None
+        return self.wait().exit_code
+
+    def wait(self, timeout: float | None = None) -> RunResult:
+        """Wait for the job to finish.
+
+        Args:
+            timeout: Maximum number of seconds to wait. If None, wait indefinitely.
+
+        Returns:
+            The result of the run, see `run_fragpipe`.
+
+        Raises:
+            subprocess.TimeoutExpired: If the job has not finished within 'timeout'.
+            Exception: Any exception raised while supervising the job.
+        """
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            raise subprocess.TimeoutExpired(self.command, timeout)
+        if self._error is not None:
+            raise self._error
+        assert self._result is not None
+        return self._result
+
+    def cancel(self) -> None:
+        """Terminate FragPipe and all its child processes.
+
+        The job is finalized as usual and its result reports "cancelled" as
+        `RunResult.termination_reason`. Does nothing if the job has finished.
+        """
+        if self._thread.is_alive():
+            self._watchdog.terminate(CANCELLED)
+
+    def stats(self) -> JobStats:
+        """Return live statistics of the job.
+
+        Resource usage is sampled from '/proc' and only available on Linux while
+        FragPipe is running.
+        """
+        current_stage = self._current_stage
+        stats = JobStats(
+            elapsed_seconds=time.time() - self.start_time,
+            current_stage=current_stage.stage if current_stage is not None else None,
+            current_tool=current_stage.tool if current_stage is not None else None,
+            finished_stages=len(self._stage_events),
+        )
+        samples = sample_process_tree(self.pid) if is_sampling_supported() else []
+        if not samples:
+            return stats
+        return dataclasses.replace(
+            stats,
+            rss_bytes=sum(sample.rss_bytes for sample in samples),
+            cpu_seconds=sum(sample.cpu_seconds for sample in samples),
+            threads=sum(sample.threads for sample in samples),
+        )
+
+    def _on_progress(self, event: ProgressEvent) -> None:
+        if isinstance(event, StageStarted):
+            self._current_stage = event
+        elif isinstance(event, StageFinished):
+            self._current_stage = None
+            self._stage_events.append(event)
+        self._watchdog.notify_progress(event)
+        if self._progress_callback is not None:
+            self._progress_callback(event)
+
+    def _supervise(self) -> None:
+        try:
+            self._result = self._finish()
+        except BaseException as e:
+            self.logger.error(f"Supervising FragPipe failed: {e}")
+            self._error = e
+
+    def _finish(self) -> RunResult:
+        """Forward FragPipe output until it exits and finalize the run."""
+        logger = self.logger
+        try:
+            with self._process as process, self._redirected_log_file:
                 try:
-                    temp_dir_path.rmdir()
-                except OSError:
-                    logger.debug(
-                        f"Temporary directory '{temp_dir_path}' could not be removed "
-                        "because it is not empty."
+                    _forward_stdout(
+                        process,
+                        self._redirected_log_file,
+                        self._on_progress,
+                        self._watchdog.notify_output,
                     )
+                    return_code, usage = _wait_with_resource_usage(process)
+                except BaseException:
+                    terminate_process_group(process.pid)
+                    raise
+                finally:
+                    if self._sampler is not None:
+                        self._sampler.stop()
+                    self._watchdog.stop()
+            if self._sampler is not None:
+                usage["peak_rss_bytes"] = max(
+                    self._sampler.peak_rss_bytes, usage.get("peak_rss_bytes") or 0
+                )
+            with self._stderr_file:
+                self._stderr_file.seek(0)
+                stderr_output = self._stderr_file.read()
+            if return_code == 0:
+                duration = (time.time() - self.start_time) / 60
+                logger.info(
+                    f"FragPipe completed successfully in {duration:.2f} minutes."
+                )
+                if stderr_output:
+                    logger.debug(f"FragPipe stderr output:\n{stderr_output}")
+            else:
+                error = subprocess.CalledProcessError(return_code, self.command)
+                if self._watchdog.reason is not None:
+                    error = f"{error} Terminated, reason: {self._watchdog.reason}."
+                logger.error(
+                    f"Error running FragPipe: {error}\nError output:\n"
+                    f"{stderr_output}\nA partial log file may be found at "
+                    f"'{self._redirected_log_path}'"
+                )
+        finally:
+            self._stderr_file.close()
+            if self._rawfile_view is not None:
+                self._rawfile_view.cleanup()
+            if self._temp_output is not None:
+                _finalize_temp_output(
+                    self._temp_output,
+                    self._output_path,
+                    self.output_dir,
+                    logger,
+                    self._verify_transfer,
+                )
 
-    # If a temp directory was used, check the log only after moving the files from temp
-    latest_log_file = _find_latest_log_file(final_output_path)
-    if latest_log_file is None:
-        logger.debug(
-            f"No FragPipe log file found in output directory '{final_output_path}'."
-            " Using redirected log to manually create a log file."
+        # If a temp directory was used, check the log only after moving the files
+        log_path = _finalize_log_file(
+            self.output_dir, self._redirected_log_path, logger
         )
-        time_stamp = time.strftime("%Y-%m-%d_%H-%M-%S")
-        official_log_path = final_output_path / f"log_{time_stamp}.txt"
-        redirected_log_path.rename(official_log_path)
-    else:
-        redirected_log_path.unlink()
+        end_time = time.time()
+        timing = _create_timing_report(
+            log_path, self._stage_events, end_time - self.start_time, logger
+        )
+
+        return RunResult(
+            command=self.command,
+            exit_code=return_code,
+            start_time=self.start_time,
+            end_time=end_time,
+            output_dir=self.output_dir,
+            log_path=log_path,
+            timing=timing,
+            output_size_bytes=get_directory_size(self.output_dir),
+            resource_profile_path=(
+                self._resource_profile_path if self._sampler is not None else None
+            ),
+            termination_reason=self._watchdog.reason,
+            error_output=_get_tail(stderr_output, _STDERR_TAIL_LINES),
+            **usage,
+        )
+
+
+async def run_fragpipe_async(
+    fragpipe_root: pathlib.Path | str,
+    workflow_path: pathlib.Path | str,
+    manifest_path: pathlib.Path | str,
+    output_dir: pathlib.Path | str,
+    ram: int | str = 0,
+    threads: int | str = -1,
+    temp_dir: pathlib.Path | str | None = None,
+    verify_transfer: bool = False,
+    sync_output: bool = False,
+    isolate_rawfiles: bool = False,
+    auto_ram_headroom: float = 0.2,
+    logger: logging.Logger | None = None,
+    stdout_callback: LineCallback | None = None,
+    stderr_callback: LineCallback | None = None,
+    progress_callback: ProgressCallback | None = None,
+    resource_sampling_interval: float | None = None,
+    timeout: float | None = None,
+    stage_timeout: StageTimeout | None = None,
+    stall_timeout: float | None = None,
+) -> RunResult:
+    """Run FragPipe in headless mode as an asyncio subprocess.
+
+    Asynchronous counterpart of `run_fragpipe`, allowing a single event loop to
+    supervise many FragPipe processes. Stdout and stderr are streamed line by line to
+    log files in 'output_dir' instead of being buffered in memory, and each line is
+    optionally passed to an async callback. The stderr log file is removed after the
+    run if FragPipe did not write anything to stderr.
+
+    Args:
+        fragpipe_root: Path to FragPipe installation directory
+        workflow_path: Path to workflow file
+        manifest_path: Path to manifest file
+        output_dir: Path to analysis output directory
+        ram: The maximum allowed memory size for FragPipe to use (in GB). Set to 0 to
+            let FragPipe decide, which uses the memory of the host. Set to "auto" to
+            use the cgroup memory limit of the current process minus
+            'auto_ram_headroom', which prevents the JVM from being OOM-killed inside
+            containers and Slurm jobs.
+        threads: The number of CPU threads for FragPipe to use. Set to -1 to let
+            FragPipe decide (by default the number of cores - 1). Set to "auto" to use
+            the cgroup CPU quota and CPU affinity of the current process.
+        temp_dir: Path to temporary directory to use for FragPipe output, see
+            `run_fragpipe` for details.
+        verify_transfer: If True, files copied from 'temp_dir' to 'output_dir' across
+            file systems are verified by checksum, see `run_fragpipe`.
+        sync_output: If True and 'temp_dir' is provided, finished files are copied to
+            'output_dir' while FragPipe is still running, see `run_fragpipe`.
+        isolate_rawfiles: If True, FragPipe searches a temporary directory of
+            symlinks to the raw files, see `run_fragpipe` for details.
+        auto_ram_headroom: Fraction of the memory limit that is not assigned to
+            FragPipe when 'ram' is "auto".
+        logger: Logger for logging messages. If None, the module-level logger is used.
+        stdout_callback: Optional coroutine function that is awaited with every line
+            FragPipe writes to stdout, without the trailing newline.
+        stderr_callback: Optional coroutine function that is awaited with every line
+            FragPipe writes to stderr, without the trailing newline.
+        progress_callback: Optional function that is called with every progress event
+            parsed from FragPipe stdout, see `fragpipe_runner.progress`.
+        resource_sampling_interval: If provided, the FragPipe process tree is sampled
+            through '/proc' every specified number of seconds, see `run_fragpipe`.
+        timeout: Maximum wall time of the FragPipe run in seconds.
+        stage_timeout: Maximum wall time of a single FragPipe task in seconds, or a
+            mapping of tool names like "MSFragger" to their maximum wall time.
+        stall_timeout: Maximum time in seconds FragPipe may run without writing to
+            stdout.
+
+    If any of the timeouts is exceeded, FragPipe and all its child processes are
+    terminated and the reason is reported as `RunResult.termination_reason`.
+
+    Returns:
+        A `RunResult` with the exit code and timings of the run. The CPU time and I/O
+        of the process tree are not available for asyncio subprocesses, the peak RSS
+        only if 'resource_sampling_interval' is provided. The result evaluates to True
+        if FragPipe completed successfully, False otherwise.
+
+    Raises:
+        FileNotFoundError: If the FragPipe executable file is not found.
+        ValueError: If 'ram' or 'threads' is a string other than "auto".
+    """
+    if logger is None:
+        logger = LOGGER
+
+    fragpipe_exec_path = _get_fragpipe_executable(fragpipe_root)
+
+    final_output_path = pathlib.Path(output_dir)
+    final_output_path.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Running FragPipe with output directory '{final_output_path}'")
+
+    ram, threads = resolve_ram_and_threads(ram, threads, auto_ram_headroom, logger)
+    # Blocking file system operations are run in threads, so that they do not stall
+    # the event loop and other runs supervised by it
+    output_path, temp_output = await asyncio.to_thread(
+        _setup_output_path, final_output_path, temp_dir, logger
+    )
+
+    stage_events: list[StageFinished] = []
+    record_finished_stages = _record_finished_stages(stage_events, progress_callback)
+
+    redirected_log_path = final_output_path / "fragpipe_stdout_redirect.log"
+    stderr_log_path = final_output_path / "fragpipe_stderr_redirect.log"
+    resource_profile_path = final_output_path / "fragpipe_resources.csv"
+    stderr_tail: collections.deque[str] = collections.deque(maxlen=_STDERR_TAIL_LINES)
+    rawfile_view = None
+    sampler = None
+    usage: dict[str, int | float | None] = {}
+    start_time = time.time()
+    try:
+        if temp_output is not None and sync_output:
+            temp_output.sync = OutputSync(
+                output_path, final_output_path, verify_checksums=verify_transfer
+            )
+            temp_output.sync.start()
+        if isolate_rawfiles:
+            manifest_path, rawfile_view = await asyncio.to_thread(
+                _setup_rawfile_view, manifest_path, final_output_path, temp_dir, logger
+            )
+        cmd = _build_fragpipe_command(
+            fragpipe_exec_path, workflow_path, manifest_path, output_path, ram, threads
+        )
+        redirected_log_file = await asyncio.to_thread(open, redirected_log_path, "w")
+        try:
+            stderr_log_file = await asyncio.to_thread(open, stderr_log_path, "w")
+        except BaseException:
+            redirected_log_file.close()
+            raise
+        with redirected_log_file, stderr_log_file:
+            # A new session allows terminating the whole FragPipe process tree
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=_STREAM_LINE_LIMIT,
+                start_new_session=True,
+            )
+            sampler = _start_resource_sampler(
+                process.pid, resource_profile_path, resource_sampling_interval, logger
+            )
+            watchdog = Watchdog(
+                process.pid, timeout, stage_timeout, stall_timeout, logger=logger
+            )
+            if not (
+                timeout is None and stage_timeout is None and stall_timeout is None
+            ):
+                watchdog.start()
+            parse_progress = _add_progress_parsing(
+                stdout_callback,
+                _notify_watchdog(watchdog, record_finished_stages),
+            )
+
+            async def forward_stdout(line: str) -> None:
+                watchdog.notify_output(line)
+                await parse_progress(line)
 
-    return execution_successful
+            try:
+                await asyncio.gather(
+                    _pump_stream(process.stdout, redirected_log_file, forward_stdout),
+                    _pump_stream(
+                        process.stderr, stderr_log_file, stderr_callback, stderr_tail
+                    ),
+                )
+                return_code = await process.wait()
+            except BaseException:
+                if process.returncode is None:
+                    # Killing only the launcher would orphan the Java and DIA-NN
+                    # processes started by it
+                    terminate_process_group(process.pid, grace_seconds=0)
+                    await process.wait()
+                raise
+            finally:
+                if sampler is not None:
+                    await asyncio.to_thread(sampler.stop)
+                    usage["peak_rss_bytes"] = sampler.peak_rss_bytes
+                await asyncio.to_thread(watchdog.stop)
+        if return_code == 0:
+            duration = (time.time() - start_time) / 60
+            logger.info(f"FragPipe completed successfully in {duration:.2f} minutes.")
+        else:
+            stderr_output = "\n".join(stderr_tail)
+            reason = ""
+            if watchdog.reason is not None:
+                reason = f" Terminated, reason: {watchdog.reason}."
+            logger.error(
+                f"Error running FragPipe: Command '{cmd}' returned non-zero exit "
+                f"status {return_code}.{reason}\nError output (last "
+                f"{len(stderr_tail)} lines):\n{stderr_output}\n"
+                f"A partial log file may be found at '{redirected_log_path}'"
+            )
+    finally:
+        if rawfile_view is not None:
+            await asyncio.to_thread(rawfile_view.cleanup)
+        if temp_output is not None:
+            await asyncio.to_thread(
+                _finalize_temp_output,
+                temp_output,
+                output_path,
+                final_output_path,
+                logger,
+                verify_transfer,
+            )
+
+    log_path = await asyncio.to_thread(
+        _finalize_async_log_files,
+        final_output_path,
+        redirected_log_path,
+        stderr_log_path,
+        logger,
+    )
+    end_time = time.time()
+    timing = await asyncio.to_thread(
+        _create_timing_report, log_path, stage_events, end_time - start_time, logger
+    )
+    output_size_bytes = await asyncio.to_thread(get_directory_size, final_output_path)
+
+    return RunResult(
+        command=cmd,
+        exit_code=return_code,
+        start_time=start_time,
+        end_time=end_time,
+        output_dir=final_output_path,
+        log_path=log_path,
+        timing=timing,
+        output_size_bytes=output_size_bytes,
+        resource_profile_path=resource_profile_path if sampler is not None else None,
+        termination_reason=watchdog.reason,
+        error_output="\n".join(stderr_tail) or None,
+        **usage,
+    )
 
 
 def search_results_exist(output_dir: pathlib.Path | str) -> bool:
@@ -172,7 +853,7 @@ def search_results_exist(output_dir: pathlib.Path | str) -> bool:
     if not output_dir.exists() or not output_dir.is_dir():
         return False
 
-    if _find_latest_log_file(output_dir) is not None:
+    if find_latest_log_file(output_dir) is not None:
         return True
     elif combined_protein_file.exists():
         LOGGER.debug(
@@ -183,13 +864,23 @@ def search_results_exist(output_dir: pathlib.Path | str) -> bool:
         return False
 
 
-def clean_up_rawfile_directory(rawfile_dir: pathlib.Path):
+def clean_up_rawfile_directory(
+    rawfile_dir: pathlib.Path,
+    artefact_cache: "ArtefactCache | None" = None,
+    workflow_path: pathlib.Path | str | None = None,
+):
     """Clean up FragPipe temporary files in the specified rawfile directory.
 
     Removes temporary files with extensions such as '.mzBIN' and '_uncalibrated.mzML'.
+    If an artefact cache is provided, the files are moved into the cache instead, so
+    that later searches of the same raw files can skip the conversion.
 
     Args:
         rawfile_dir: The rawfile directory to clean up.
+        artefact_cache: Optional cache the temporary files are moved to, see
+            `fragpipe_runner.artefacts.ArtefactCache`.
+        workflow_path: Path to the workflow file the temporary files were created
+            with. Only used if 'artefact_cache' is provided.
     """
     temp_file_patterns = [
         ".mzBIN",
@@ -202,6 +893,10 @@ def clean_up_rawfile_directory(rawfile_dir: pathlib.Path):
         LOGGER.warning(f"Raw directory {rawfile_dir} is not a directory.")
         return
 
+    if artefact_cache is not None:
+        artefact_cache.collect(rawfile_dir, workflow_path)
+        return
+
     temp_files: list[pathlib.Path] = []
     for pattern in temp_file_patterns:
         temp_files.extend(rawfile_dir.rglob(f"*{pattern}"))
@@ -217,7 +912,7 @@ def clean_up_rawfile_directory(rawfile_dir: pathlib.Path):
     LOGGER.info(f"Deleted {len(temp_files)} temporary FragPipe files in {rawfile_dir}.")
 
 
-def _find_latest_log_file(output_dir: pathlib.Path) -> pathlib.Path | None:
+def find_latest_log_file(output_dir: pathlib.Path) -> pathlib.Path | None:
     """Find the latest FragPipe log file in the specified output directory.
 
     Args:
@@ -232,34 +927,429 @@ def _find_latest_log_file(output_dir: pathlib.Path) -> pathlib.Path | None:
     return None
 
 
+def _get_fragpipe_executable(fragpipe_root: pathlib.Path | str) -> pathlib.Path:
+    """Return the path of the FragPipe executable for the current operating system.
+
+    Args:
+        fragpipe_root: Path to FragPipe installation directory
+
+    Returns:
+        Path to the FragPipe executable
+
+    Raises:
+        OSError: If the operating system is not supported.
+        FileNotFoundError: If the FragPipe executable file is not found.
+    """
+    if os.name == "nt":
+        executable_name = "fragpipe.bat"
+    elif os.name == "posix":
+        executable_name = "fragpipe"
+    else:
+        raise OSError(f"Unsupported operating system: {os.name}")
+
+    fragpipe_exec_path = pathlib.Path(fragpipe_root) / "bin" / executable_name
+    if not fragpipe_exec_path.exists():
+        raise FileNotFoundError(
+            f"FragPipe executable file not found at {fragpipe_exec_path}. "
+            "Please check the path."
+        )
+    return fragpipe_exec_path
+
+
+def _build_fragpipe_command(
+    fragpipe_exec_path: pathlib.Path,
+    workflow_path: pathlib.Path | str,
+    manifest_path: pathlib.Path | str,
+    workdir: pathlib.Path | str,
+    ram: int,
+    threads: int,
+) -> list[str]:
+    """Build the command line for running FragPipe in headless mode."""
+    cmd = [
+        fragpipe_exec_path.as_posix(),
+        "--headless",
+        "--workflow",
+        pathlib.Path(workflow_path).resolve().as_posix(),
+        "--manifest",
+        pathlib.Path(manifest_path).resolve().as_posix(),
+        "--workdir",
+        pathlib.Path(workdir).resolve().as_posix(),
+        "--ram",
+        str(ram),
+    ]
+    if threads > 0:
+        cmd.extend(["--threads", str(threads)])
+    return cmd
+
+
+def resolve_ram_and_threads(
+    ram: int | str,
+    threads: int | str,
+    auto_ram_headroom: float,
+    logger: logging.Logger,
+) -> tuple[int, int]:
+    """Replace "auto" values of 'ram' and 'threads' with limit-respecting values.
+
+    Raises:
+        ValueError: If 'ram' or 'threads' is a string other than "auto".
+    """
+    for name, value in [("ram", ram), ("threads", threads)]:
+        if isinstance(value, str) and value != "auto":
+            raise ValueError(f"'{name}' must be an integer or 'auto', not '{value}'.")
+    if ram != "auto" and threads != "auto":
+        return int(ram), int(threads)
+
+    auto_ram, auto_threads = get_auto_ram_and_threads(auto_ram_headroom)
+    if ram == "auto":
+        ram = auto_ram
+        logger.debug(f"Using {ram} GB RAM for FragPipe based on resource limits.")
+    if threads == "auto":
+        threads = auto_threads
+        logger.debug(f"Using {threads} threads for FragPipe based on resource limits.")
+    return int(ram), int(threads)
+
+
+def _setup_output_path(
+    final_output_path: pathlib.Path,
+    temp_dir: pathlib.Path | str | None,
+    logger: logging.Logger,
+) -> tuple[pathlib.Path, _TempOutput | None]:
+    """Set up the directory FragPipe writes its output to.
+
+    Args:
+        final_output_path: Path to the final analysis output directory.
+        temp_dir: Path to the temporary directory, or None to write directly to
+            'final_output_path'.
+        logger: Logger for logging messages.
+
+    Returns:
+        A tuple of the FragPipe output path and the temporary output that has to be
+        finalized after FragPipe finishes, or None if no temporary directory is used.
+    """
+    if temp_dir is None:
+        return final_output_path, None
+
+    temp_dir_path = pathlib.Path(temp_dir)
+    temp_dir_existed = temp_dir_path.exists()
+    if not temp_dir_existed:
+        temp_dir_path.mkdir(parents=True, exist_ok=True)
+    temp_output = _TempOutput(
+        tempfile.TemporaryDirectory(dir=temp_dir_path), temp_dir_path, temp_dir_existed
+    )
+    output_path = pathlib.Path(temp_output.directory.name)
+    output_path.mkdir(parents=True, exist_ok=True)
+    logger.debug(f"Using temporary directory '{output_path}' for FragPipe output.")
+    return output_path, temp_output
+
+
+def _setup_rawfile_view(
+    manifest_path: pathlib.Path | str,
+    final_output_path: pathlib.Path,
+    temp_dir: pathlib.Path | str | None,
+    logger: logging.Logger,
+) -> tuple[pathlib.Path, tempfile.TemporaryDirectory]:
+    """Create a temporary rawfile view for a FragPipe run.
+
+    Returns:
+        A tuple of the path to the manifest pointing at the view and the temporary
+        directory containing the view, which has to be cleaned up after the run.
+    """
+    view_parent = pathlib.Path(temp_dir) if temp_dir is not None else final_output_path
+    rawfile_view = tempfile.TemporaryDirectory(
+        prefix="fragpipe_rawfiles_", dir=view_parent
+    )
+    logger.debug(f"Isolating FragPipe raw files in '{rawfile_view.name}'.")
+    try:
+        return create_rawfile_view(manifest_path, rawfile_view.name), rawfile_view
+    except BaseException:
+        rawfile_view.cleanup()
+        raise
+
+
+def _finalize_temp_output(
+    temp_output: _TempOutput,
+    output_path: pathlib.Path,
+    final_output_path: pathlib.Path,
+    logger: logging.Logger,
+    verify_checksums: bool = False,
+) -> None:
+    """Move FragPipe output from the temporary to the final output directory and
+    remove the temporary directory.
+
+    If the output was synced while FragPipe was running, only files that were not
+    synced yet or changed since are moved.
+    """
+    synced_files = None
+    try:
+        if temp_output.sync is not None:
+            temp_output.sync.stop()
+            synced_files = temp_output.sync.synced_files
+        _move_and_replace_folder_contents(
+            output_path, final_output_path, verify_checksums, synced_files
+        )
+    except Exception as e:
+        logger.error(f"Failed to move files from temp directory: {e}")
+    temp_output.directory.cleanup()
+    if not temp_output.temp_dir_existed:
+        try:
+            temp_output.temp_dir_path.rmdir()
+        except OSError:
+            logger.debug(
+                f"Temporary directory '{temp_output.temp_dir_path}' could not be "
+                "removed because it is not empty."
+            )
+
+
+def _finalize_log_file(
+    final_output_path: pathlib.Path,
+    redirected_log_path: pathlib.Path,
+    logger: logging.Logger,
+) -> pathlib.Path:
+    """Replace a missing FragPipe log file with the redirected stdout, or remove the
+    redirected stdout if FragPipe created its own log file.
+
+    Returns:
+        Path to the FragPipe log file.
+    """
+    latest_log_file = find_latest_log_file(final_output_path)
+    if latest_log_file is None:
+        logger.debug(
+            f"No FragPipe log file found in output directory '{final_output_path}'."
+            " Using redirected log to manually create a log file."
+        )
+        time_stamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+        official_log_path = final_output_path / f"log_{time_stamp}.txt"
+        redirected_log_path.rename(official_log_path)
+        return official_log_path
+    redirected_log_path.unlink()
+    return latest_log_file
+
+
+def _finalize_async_log_files(
+    final_output_path: pathlib.Path,
+    redirected_log_path: pathlib.Path,
+    stderr_log_path: pathlib.Path,
+    logger: logging.Logger,
+) -> pathlib.Path:
+    """Remove an empty stderr log file and finalize the log file of an async run.
+
+    Returns:
+        Path to the FragPipe log file.
+    """
+    if stderr_log_path.exists() and stderr_log_path.stat().st_size == 0:
+        stderr_log_path.unlink()
+    return _finalize_log_file(final_output_path, redirected_log_path, logger)
+
+
+def _create_timing_report(
+    log_path: pathlib.Path,
+    stage_events: list[StageFinished],
+    wall_seconds: float,
+    logger: logging.Logger,
+) -> TimingReport | None:
+    """Create the per-stage timing report of a run and write it next to the log.
+
+    Returns:
+        The timing report, or None if the report could not be created.
+    """
+    try:
+        report = create_timing_report(log_path, stage_events, wall_seconds)
+        report_path = write_timing_report(report)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to create FragPipe timing report: {e}")
+        return None
+    tool_summary = ", ".join(
+        f"{tool} {seconds / 60:.2f}"
+        for tool, seconds in sorted(
+            report.tool_seconds().items(), key=lambda item: item[1], reverse=True
+        )
+    )
+    logger.debug(f"FragPipe stage timings in minutes: {tool_summary}")
+    logger.debug(f"FragPipe timing report written to '{report_path}'")
+    return report
+
+
+def _start_resource_sampler(
+    pid: int,
+    output_path: pathlib.Path,
+    interval: float | None,
+    logger: logging.Logger,
+) -> ProcessTreeSampler | None:
+    """Start sampling the process tree of FragPipe if an interval is specified.
+
+    Returns:
+        The started sampler, or None if sampling is disabled or not supported.
+    """
+    if interval is None:
+        return None
+    if not is_sampling_supported():
+        logger.warning(
+            "Resource sampling is only supported on Linux, continuing without it."
+        )
+        return None
+    sampler = ProcessTreeSampler(pid, output_path, interval)
+    sampler.start()
+    logger.debug(f"Sampling FragPipe resource usage to '{output_path}'")
+    return sampler
+
+
+def _wait_with_resource_usage(
+    process: subprocess.Popen,
+) -> tuple[int, dict[str, int | float | None]]:
+    """Wait for a process to finish and collect the resource usage of its tree.
+
+    On POSIX systems the process is reaped with 'os.wait4', which reports the
+    resource usage of the process and all descendants it waited for. On other
+    systems no resource usage is collected.
+
+    Returns:
+        The exit code of the process and a dictionary with the 'peak_rss_bytes',
+        'cpu_seconds', 'read_bytes' and 'written_bytes' fields of `RunResult`.
+    """
+    usage: dict[str, int | float | None] = {}
+    if not hasattr(os, "wait4"):
+        return process.wait(), usage
+
+    _, status, rusage = os.wait4(process.pid, 0)
+    # Popen does not know the process was reaped, so the return code is set manually
+    process.returncode = os.waitstatus_to_exitcode(status)
+    usage["peak_rss_bytes"] = rusage.ru_maxrss * _RUSAGE_MAXRSS_UNIT
+    usage["cpu_seconds"] = rusage.ru_utime + rusage.ru_stime
+    usage["read_bytes"] = rusage.ru_inblock * _BLOCK_SIZE
+    usage["written_bytes"] = rusage.ru_oublock * _BLOCK_SIZE
+    return process.returncode, usage
+
+
+def _get_tail(text: str, max_lines: int) -> str | None:
+    """Return the last lines of a text, or None if the text is empty."""
+    lines = text.rstrip("\n").splitlines()[-max_lines:]
+    return "\n".join(lines) or None
+
+
+def _record_finished_stages(
+    stage_events: list[StageFinished],
+    progress_callback: ProgressCallback | None,
+) -> ProgressCallback:
+    """Return a progress callback that appends finished stages to 'stage_events'
+    before calling the original callback.
+    """
+
+    def callback(event: ProgressEvent) -> None:
+        if isinstance(event, StageFinished):
+            stage_events.append(event)
+        if progress_callback is not None:
+            progress_callback(event)
+
+    return callback
+
+
+def _forward_stdout(
+    process: subprocess.Popen,
+    log_file: TextIO,
+    progress_callback: ProgressCallback,
+    line_callback: Callable[[str], None] | None = None,
+) -> None:
+    """Copy FragPipe stdout to the log file while parsing progress events."""
+    assert process.stdout is not None
+    parser = FragPipeProgressParser()
+    for line in process.stdout:
+        if line_callback is not None:
+            line_callback(line)
+        log_file.write(line)
+        log_file.flush()
+        for event in parser.feed(line):
+            progress_callback(event)
+
+
+def _notify_watchdog(
+    watchdog: Watchdog, progress_callback: ProgressCallback
+) -> ProgressCallback:
+    """Return a progress callback that passes every event to the watchdog before
+    calling the original callback.
+    """
+
+    def callback(event: ProgressEvent) -> None:
+        watchdog.notify_progress(event)
+        progress_callback(event)
+
+    return callback
+
+
+def _add_progress_parsing(
+    stdout_callback: LineCallback | None,
+    progress_callback: ProgressCallback,
+) -> LineCallback:
+    """Return a stdout line callback that parses progress events before calling the
+    original callback.
+    """
+    parser = FragPipeProgressParser()
+
+    async def callback(line: str) -> None:
+        for event in parser.feed(line):
+            progress_callback(event)
+        if stdout_callback is not None:
+            await stdout_callback(line)
+
+    return callback
+
+
+async def _pump_stream(
+    stream: asyncio.StreamReader | None,
+    log_file: TextIO,
+    callback: LineCallback | None,
+    tail: collections.deque[str] | None = None,
+) -> None:
+    """Copy lines from a subprocess stream to a log file and an optional callback.
+
+    Args:
+        stream: The subprocess stream to read from.
+        log_file: The text file every line is written to.
+        callback: Optional coroutine function awaited with every line.
+        tail: Optional bounded deque that collects the most recent lines.
+    """
+    if stream is None:
+        return
+    while True:
+        try:
+            raw_line = await stream.readline()
+        except ValueError:
+            # Lines exceeding the stream limit are discarded by asyncio
+            continue
+        if not raw_line:
+            break
+        line = raw_line.decode(errors="replace")
+        log_file.write(line)
+        log_file.flush()
+        line = line.rstrip("\r\n")
+        if tail is not None:
+            tail.append(line)
+        if callback is not None:
+            await callback(line)
+
+
 def _move_and_replace_folder_contents(
     source_dir: pathlib.Path | str,
     destination_dir: pathlib.Path | str,
+    verify_checksums: bool = False,
+    synced_files: dict[pathlib.Path, tuple[int, int]] | None = None,
 ) -> None:
     """Moves the source directory to the destination directory, replacing existing
     files and merging folders as needed.
 
+    Whole subtrees are renamed if both directories are on the same file system,
+    otherwise files are copied in parallel, see `fragpipe_runner.transfer.move_tree`.
+
     Args:
         source_dir: Path of the source directory.
         destination_dir: Path of the destination directory.
+        verify_checksums: If True, files copied between file systems are verified by
+            checksum before the source files are removed.
+        synced_files: Files already copied to the destination by `OutputSync`, which
+            are not copied again if unchanged.
     """
-    source_path = pathlib.Path(source_dir)
-    destination_path = pathlib.Path(destination_dir)
-    destination_path.mkdir(parents=True, exist_ok=True)
-
-    for item_path in source_path.iterdir():
-        dest_item_path = destination_path / item_path.name
-
-        if item_path.is_dir() and dest_item_path.is_dir():
-            _move_and_replace_folder_contents(item_path, dest_item_path)
-            item_path.rmdir()
-            continue
-
-        if dest_item_path.exists():
-            if dest_item_path.is_dir():
-                shutil.rmtree(dest_item_path)
-            else:
-                dest_item_path.unlink()
-
-        shutil.move(item_path, dest_item_path)
-    source_path.rmdir()
+    move_tree(
+        source_dir,
+        destination_dir,
+        verify_checksums=verify_checksums,
+        synced_files=synced_files,
+    )
@@ -0,0 +1,300 @@
+"""Module for a persistent index of raw file fingerprints.
+
+Hashing multi-GB raw files on every call is too slow, so fingerprints are stored in
+an SQLite database keyed by path, inode, size and mtime. A fingerprint is only
+recomputed when one of these changes. The fast hash covers the file size and a fixed
+number of sampled blocks, while the full hash of the complete content is computed on
+demand.
+"""
+
+import concurrent.futures
+import dataclasses
+import hashlib
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+from collections.abc import Iterable
+
+import pandas as pd
+
+from .manifest import read_rawfile_paths
+
+LOGGER = logging.getLogger(__name__)
+
+SAMPLE_BLOCK_SIZE = 1024 * 1024
+"""Size in bytes of each block read for the fast hash."""
+
+SAMPLE_BLOCK_COUNT = 16
+"""Number of evenly spaced blocks read for the fast hash."""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    path TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    fast_hash TEXT NOT NULL,
+    full_hash TEXT
+)
+"""
+_HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+@dataclasses.dataclass(frozen=True)
+class Fingerprint:
+    """Fingerprint of a raw file or Bruker '.d' directory.
+
+    Attributes:
+        path: Resolved path of the raw file.
+        inode: Inode number of the raw file.
+        size: Size in bytes, summed over all files for directories.
+        mtime_ns: Modification time in nanoseconds, the latest of all files for
+            directories.
+        fast_hash: Hash of the size and sampled blocks of the content.
+        full_hash: Hash of the complete content, or None if not computed yet.
+    """
+
+    path: str
+    inode: int
+    size: int
+    mtime_ns: int
+    fast_hash: str
+    full_hash: str | None = None
+
+
+class FingerprintIndex:
+    """Persistent SQLite index of raw file fingerprints.
+
+    The index can be shared between processes and is safe to use from multiple
+    threads.
+
+    Example:
+        index = FingerprintIndex("path/to/fingerprints.sqlite")
+        fingerprints = index.fingerprint_manifest("path/to/manifest.fp-manifest")
+    """
+
+    def __init__(
+        self,
+        database_path: pathlib.Path | str,
+        max_workers: int | None = None,
+    ):
+        """Open or create the index.
+
+        Args:
+            database_path: Path of the SQLite database file.
+            max_workers: Number of threads used to compute new fingerprints. If None,
+                the default of `concurrent.futures.ThreadPoolExecutor` is used.
+        """
+        self.database_path = pathlib.Path(database_path)
+        self.max_workers = max_workers
+        self.database_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.database_path, timeout=60, check_same_thread=False
+        )
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self) -> "FingerprintIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def get(self, path: pathlib.Path | str, full_hash: bool = False) -> Fingerprint:
+        """Return the fingerprint of a raw file, computing it if necessary.
+
+        Args:
+            path: Path to the raw file or '.d' directory.
+            full_hash: If True, the hash of the complete content is computed as well.
+
+        Returns:
+            The fingerprint of the raw file.
+        """
+        return self.get_many([path], full_hash=full_hash)[0]
+
+    def get_many(
+        self,
+        paths: Iterable[pathlib.Path | str],
+        full_hash: bool = False,
+    ) -> list[Fingerprint]:
+        """Return the fingerprints of multiple raw files.
+
+        Fingerprints missing from the index or outdated are computed in parallel.
+
+        Args:
+            paths: Paths to the raw files or '.d' directories.
+            full_hash: If True, the hash of the complete content is computed as well.
+
+        Returns:
+            The fingerprints in the order of 'paths'.
+
+        Raises:
+            FileNotFoundError: If a raw file does not exist.
+        """
+        resolved_paths = [pathlib.Path(p).resolve() for p in paths]
+        fingerprints: dict[pathlib.Path, Fingerprint] = {}
+        missing = []
+        for path in resolved_paths:
+            inode, size, mtime_ns = _stat_rawfile(path)
+            fingerprint = self._lookup(path, inode, size, mtime_ns)
+            if fingerprint is None or (full_hash and fingerprint.full_hash is None):
+                missing.append(path)
+            else:
+                fingerprints[path] = fingerprint
+
+        if missing:
+            LOGGER.debug(f"Computing fingerprints of {len(missing)} raw files.")
+            with concurrent.futures.ThreadPoolExecutor(self.max_workers) as executor:
+                computed = executor.map(
+                    lambda path: compute_fingerprint(path, full_hash), missing
+                )
+                for fingerprint in computed:
+                    self._store(fingerprint)
+                    fingerprints[pathlib.Path(fingerprint.path)] = fingerprint
+        return [fingerprints[path] for path in resolved_paths]
+
+    def fingerprint_manifest(
+        self,
+        manifest: pathlib.Path | str | pd.DataFrame,
+        full_hash: bool = False,
+    ) -> dict[pathlib.Path, Fingerprint]:
+        """Return the fingerprints of all raw files listed in a FragPipe manifest.
+
+        Args:
+            manifest: Path to a FragPipe manifest file, e.g. created by
+                `sdrf_to_manifest`, or a manifest table as returned by
+                `update_rawfile_paths_in_manifest`.
+            full_hash: If True, the hash of the complete content is computed as well.
+
+        Returns:
+            A dictionary mapping the raw file paths of the manifest to fingerprints.
+        """
+        rawfile_paths = read_rawfile_paths(manifest)
+        return dict(zip(rawfile_paths, self.get_many(rawfile_paths, full_hash)))
+
+    def prune(self) -> int:
+        """Remove entries of raw files that no longer exist.
+
+        Returns:
+            The number of removed entries.
+        """
+        with self._lock:
+            paths = [
+                row[0]
+                for row in self._connection.execute("SELECT path FROM fingerprints")
+            ]
+        removed = [(path,) for path in paths if not os.path.exists(path)]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM fingerprints WHERE path = ?", removed
+            )
+        return len(removed)
+
+    def _lookup(
+        self,
+        path: pathlib.Path,
+        inode: int,
+        size: int,
+        mtime_ns: int,
+    ) -> Fingerprint | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT fast_hash, full_hash FROM fingerprints "
+                "WHERE path = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+                (path.as_posix(), inode, size, mtime_ns),
+            ).fetchone()
+        if row is None:
+            return None
+        return Fingerprint(path.as_posix(), inode, size, mtime_ns, row[0], row[1])
+
+    def _store(self, fingerprint: Fingerprint) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)",
+                dataclasses.astuple(fingerprint),
+            )
+
+
+def compute_fingerprint(
+    path: pathlib.Path | str,
+    full_hash: bool = False,
+) -> Fingerprint:
+    """Compute the fingerprint of a raw file without using an index.
+
+    Args:
+        path: Path to the raw file or '.d' directory.
+        full_hash: If True, the hash of the complete content is computed as well.
+
+    Returns:
+        The fingerprint of the raw file.
+    """
+    path = pathlib.Path(path).resolve()
+    inode, size, mtime_ns = _stat_rawfile(path)
+    files = _list_rawfile_contents(path)
+
+    fast_digest = hashlib.blake2b(digest_size=16)
+    for relative_name, file_path in files:
+        fast_digest.update(relative_name.encode())
+        _update_sampled(fast_digest, file_path)
+
+    full_digest = None
+    if full_hash:
+        digest = hashlib.blake2b()
+        for relative_name, file_path in files:
+            digest.update(relative_name.encode())
+            with open(file_path, "rb") as file:
+                while chunk := file.read(_HASH_CHUNK_SIZE):
+                    digest.update(chunk)
+        full_digest = digest.hexdigest()
+
+    return Fingerprint(
+        path.as_posix(), inode, size, mtime_ns, fast_digest.hexdigest(), full_digest
+    )
+
+
+def _stat_rawfile(path: pathlib.Path) -> tuple[int, int, int]:
+    """Return the inode, size and mtime of a raw file or '.d' directory."""
+    stat = path.stat()
+    if not path.is_dir():
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+    size = 0
+    mtime_ns = stat.st_mtime_ns
+    for _, file_path in _list_rawfile_contents(path):
+        file_stat = file_path.stat()
+        size += file_stat.st_size
+        mtime_ns = max(mtime_ns, file_stat.st_mtime_ns)
+    return stat.st_ino, size, mtime_ns
+
+
+def _list_rawfile_contents(path: pathlib.Path) -> list[tuple[str, pathlib.Path]]:
+    """Return (relative name, path) tuples of the files making up a raw file."""
+    if not path.is_dir():
+        return [(path.name, path)]
+    return sorted(
+        (file_path.relative_to(path).as_posix(), file_path)
+        for file_path in path.rglob("*")
+        if file_path.is_file()
+    )
+
+
+def _update_sampled(digest: "hashlib._Hash", file_path: pathlib.Path) -> None:
+    """Update a digest with the size and evenly spaced blocks of a file."""
+    size = file_path.stat().st_size
+    digest.update(size.to_bytes(8, "little"))
+    with open(file_path, "rb") as file:
+        if size <= SAMPLE_BLOCK_SIZE * SAMPLE_BLOCK_COUNT:
+            digest.update(file.read())
+            return
+        step = (size - SAMPLE_BLOCK_SIZE) // (SAMPLE_BLOCK_COUNT - 1)
+        for block_index in range(SAMPLE_BLOCK_COUNT):
+            file.seek(block_index * step)
+            digest.update(file.read(SAMPLE_BLOCK_SIZE))
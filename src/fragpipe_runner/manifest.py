@@ -68,6 +68,9 @@ def update_rawfile_paths_in_manifest(
         manifest_filepath: Path to the FragPipe manifest file.
         rawfile_directory: Directory where the rawfiles are located. If None, uses the
             directory of the manifest file.
+
+    Returns:
+        The updated manifest table.
     """
     logger.info(f"Updating rawfile paths in manifest '{manifest_filepath}'")
     if rawfile_directory is None:
@@ -78,9 +81,82 @@ def update_rawfile_paths_in_manifest(
         )
     rawfile_directory = pathlib.Path(rawfile_directory).resolve()
 
-    manifest = pd.read_csv(manifest_filepath, sep="\t", header=None)
+    # Read all columns as strings, so that e.g. bioreplicates are not written as floats
+    manifest = pd.read_csv(
+        manifest_filepath, sep="\t", header=None, dtype=str, keep_default_na=False
+    )
     rawfile_paths = [
         rawfile_directory / pathlib.Path(p).name for p in manifest.iloc[:, 0]
     ]
     manifest.iloc[:, 0] = [p.as_posix() for p in rawfile_paths]
     manifest.to_csv(manifest_filepath, sep="\t", index=False, header=False)
+    return manifest
+
+
+def read_rawfile_paths(
+    manifest: pathlib.Path | str | pd.DataFrame,
+) -> list[pathlib.Path]:
+    """Read the rawfile paths from a FragPipe manifest.
+
+    Args:
+        manifest: Path to the FragPipe manifest file, or a manifest table as returned
+            by `update_rawfile_paths_in_manifest`.
+
+    Returns:
+        The rawfile paths in the order they are listed in the manifest.
+    """
+    if not isinstance(manifest, pd.DataFrame):
+        manifest = pd.read_csv(manifest, sep="\t", header=None)
+    return [pathlib.Path(p) for p in manifest.iloc[:, 0]]
+
+
+def create_rawfile_view(
+    manifest_filepath: pathlib.Path | str,
+    view_directory: pathlib.Path | str,
+) -> pathlib.Path:
+    """Create a directory of symlinks to the rawfiles of a FragPipe manifest.
+
+    FragPipe writes '.mzBIN' and '_uncalibrated.mzML' files next to the rawfile paths
+    listed in the manifest. Searching a copy of the manifest pointing at the symlinks
+    confines these files to the view directory, so that concurrent FragPipe runs on
+    the same rawfiles do not interfere with each other.
+
+    Args:
+        manifest_filepath: Path to the FragPipe manifest file. Relative rawfile paths
+            in the manifest are resolved against its directory.
+        view_directory: Directory in which the symlinks and a copy of the manifest are
+            created. Created if missing.
+
+    Returns:
+        Path to the manifest copy in the view directory.
+
+    Raises:
+        ValueError: If two rawfiles of the manifest have the same file name.
+    """
+    manifest_filepath = pathlib.Path(manifest_filepath)
+    view_directory = pathlib.Path(view_directory)
+    view_directory.mkdir(parents=True, exist_ok=True)
+    logger.debug(f"Creating rawfile view of '{manifest_filepath}' in {view_directory}")
+
+    for rawfile_path in read_unique_rawfile_paths(manifest_filepath):
+        link_path = view_directory / rawfile_path.name
+        # Relative rawfile paths are relative to the manifest, not the working directory
+        target_path = (manifest_filepath.parent / rawfile_path).resolve()
+        if not link_path.is_symlink():
+            link_path.symlink_to(target_path, target_is_directory=target_path.is_dir())
+
+    view_manifest_filepath = view_directory / manifest_filepath.name
+    view_manifest_filepath.write_bytes(manifest_filepath.read_bytes())
+    update_rawfile_paths_in_manifest(view_manifest_filepath, view_directory)
+    return view_manifest_filepath
+
+
+def read_unique_rawfile_paths(manifest_filepath: pathlib.Path) -> list[pathlib.Path]:
+    """Read the rawfile paths of a manifest, which must have unique file names."""
+    rawfile_paths = read_rawfile_paths(manifest_filepath)
+    names = [p.name for p in rawfile_paths]
+    if len(set(names)) != len(names):
+        raise ValueError(
+            f"Rawfiles in '{manifest_filepath}' must have unique file names."
+        )
+    return rawfile_paths
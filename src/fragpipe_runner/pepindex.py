@@ -0,0 +1,260 @@
+"""Module for reusing MSFragger peptide index files across runs.
+
+MSFragger builds an index of all candidate peptides of the FASTA database before each
+search and writes it as '.pepindex' files next to the database. Searches of many
+batches against the same database and parameters rebuild the same index every time.
+
+`run_fragpipe_with_pepindex` runs FragPipe on a private copy of the database in a job
+directory of the cache. Index files of an earlier run with the same database content,
+index-relevant parameters and FragPipe installation are copied next to the copy
+before the run, where MSFragger picks them up, and new index files are stored in the
+cache afterwards.
+"""
+
+import logging
+import pathlib
+from typing import Any
+
+from ._lru import EntryCache, clone_file, link_file, remove_tree
+from .cache import get_fragpipe_fingerprint, hash_file
+from .execute import RunResult, run_fragpipe
+from .workflow import (
+    get_database_path,
+    prepare_workflow_from_template,
+    read_workflow,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+INDEX_PARAMETER_PREFIXES = (
+    "msfragger.search_enzyme_",
+    "msfragger.allowed_missed_cleavage_",
+    "msfragger.digest_",
+    "msfragger.add_",
+    "msfragger.variable_mod_",
+    "msfragger.table.",
+)
+"""Prefixes of workflow parameters that affect the MSFragger peptide index."""
+
+INDEX_PARAMETERS = (
+    "database.decoy-tag",
+    "msfragger.num_enzyme_termini",
+    "msfragger.clip_nTerm_M",
+    "msfragger.max_variable_mods_per_peptide",
+    "msfragger.max_variable_mods_combinations",
+    "msfragger.allow_multiple_variable_mods_on_residue",
+    "msfragger.max_fragment_charge",
+    "msfragger.fragment_ion_series",
+    "msfragger.ion_series_definitions",
+    "msfragger.fragment_mass_tolerance",
+    "msfragger.fragment_mass_units",
+    "msfragger.precursor_mass_lower",
+    "msfragger.precursor_mass_upper",
+    "msfragger.precursor_mass_units",
+    "msfragger.mass_offsets",
+    "msfragger.misc.slice-db",
+)
+"""Workflow parameters that affect the MSFragger peptide index."""
+
+_INDEX_DIRNAME = "index"
+
+
+class PepindexCache(EntryCache):
+    """Disk-bounded LRU cache of MSFragger peptide index files.
+
+    An entry is identified by the content of the FASTA database, the index-relevant
+    workflow parameters and the FragPipe installation. Cached index files are
+    read-only and are copied into job directories with reflinks where the file system
+    supports them, so that MSFragger rewriting an index never affects the cache.
+
+    Example:
+        cache = PepindexCache("path/to/pepindex", max_size_bytes=100 * 1024**3)
+        result = run_fragpipe_with_pepindex(
+            cache, fragpipe_root, workflow, manifest, output
+        )
+    """
+
+    entry_description = "MSFragger index files"
+
+    def __init__(
+        self,
+        cache_dir: pathlib.Path | str,
+        max_size_bytes: int | None = None,
+    ):
+        """Initialize the cache.
+
+        Args:
+            cache_dir: Directory where index files are stored. Created if missing. Job
+                directories are created inside, so that new index files can be
+                hardlinked into the cache.
+            max_size_bytes: Maximum total size of all cached index files. If None, the
+                cache is not bounded.
+        """
+        super().__init__(cache_dir, max_size_bytes)
+
+    def compute_key(
+        self,
+        fragpipe_root: pathlib.Path | str,
+        workflow_path: pathlib.Path | str,
+        database_path: pathlib.Path | str,
+    ) -> str:
+        """Compute the cache key of a peptide index.
+
+        Args:
+            fragpipe_root: Path to FragPipe installation directory
+            workflow_path: Path to workflow file
+            database_path: Path to the FASTA database
+
+        Returns:
+            Hexadecimal SHA-256 digest identifying the peptide index.
+        """
+        fingerprint = {
+            "fragpipe": get_fragpipe_fingerprint(fragpipe_root),
+            "parameters": get_index_parameters(workflow_path),
+            "database": hash_file(database_path),
+        }
+        return self.hash_fingerprint(fingerprint)
+
+    def restore(self, key: str, database_path: pathlib.Path) -> int:
+        """Copy cached index files next to a database.
+
+        Args:
+            key: Cache key of the peptide index.
+            database_path: Path to the database the index files are named after.
+
+        Returns:
+            The number of restored index files.
+        """
+        if not self.contains(key):
+            return 0
+        restored = 0
+        for index_path in (self.entry_dir(key) / _INDEX_DIRNAME).iterdir():
+            destination = database_path.with_name(database_path.stem + index_path.name)
+            if not destination.exists():
+                clone_file(index_path, destination)
+                restored += 1
+        LOGGER.info(f"Restored {restored} cached MSFragger index files '{key[:12]}'")
+        self.touch(key)
+        return restored
+
+    def store(self, key: str, database_path: pathlib.Path) -> None:
+        """Add the index files MSFragger wrote next to a database to the cache.
+
+        Index files are all files in the directory of the database whose name starts
+        with the name stem of the database. The entry is assembled in a staging
+        directory and moved into place atomically.
+
+        Args:
+            key: Cache key of the peptide index.
+            database_path: Path to the database the index was built from.
+        """
+        if self.contains(key):
+            return
+        index_paths = find_index_files(database_path)
+        if not index_paths:
+            return
+
+        def populate(entry_dir: pathlib.Path) -> None:
+            (entry_dir / _INDEX_DIRNAME).mkdir()
+            for index_path in index_paths:
+                suffix = index_path.name[len(database_path.stem) :]
+                link_file(index_path, entry_dir / _INDEX_DIRNAME / suffix)
+
+        if self.store_entry(key, populate, {"database": database_path.name}):
+            LOGGER.info(
+                f"Stored {len(index_paths)} MSFragger index files as '{key[:12]}'"
+            )
+            self.evict()
+
+
+def run_fragpipe_with_pepindex(
+    cache: PepindexCache,
+    fragpipe_root: pathlib.Path | str,
+    workflow_path: pathlib.Path | str,
+    manifest_path: pathlib.Path | str,
+    output_dir: pathlib.Path | str,
+    **kwargs: Any,
+) -> RunResult:
+    """Run FragPipe, reusing the MSFragger peptide index of earlier runs.
+
+    FragPipe is run with a copy of the workflow that points to a private copy of the
+    database in a job directory of the cache, so that concurrent runs with different
+    parameters do not overwrite each other's index files and the original database
+    directory may be read-only. Index files are only stored after successful runs.
+
+    Args:
+        cache: The peptide index cache.
+        fragpipe_root: Path to FragPipe installation directory
+        workflow_path: Path to workflow file
+        manifest_path: Path to manifest file
+        output_dir: Path to analysis output directory
+        **kwargs: Additional keyword arguments passed to `run_fragpipe`.
+
+    Returns:
+        The `RunResult` of the FragPipe run.
+    """
+    database_path = get_database_path(workflow_path)
+    if database_path is None:
+        LOGGER.warning(f"Workflow '{workflow_path}' does not specify a database.")
+        return run_fragpipe(
+            fragpipe_root, workflow_path, manifest_path, output_dir, **kwargs
+        )
+
+    key = cache.compute_key(fragpipe_root, workflow_path, database_path)
+    job_dir = cache.create_job_dir()
+    try:
+        (job_dir / "database").mkdir()
+        (job_dir / "workflow").mkdir()
+        job_database_path = job_dir / "database" / database_path.name
+        clone_file(database_path, job_database_path)
+        job_workflow_path = job_dir / "workflow" / pathlib.Path(workflow_path).name
+        prepare_workflow_from_template(
+            workflow_path, job_workflow_path, job_database_path
+        )
+        cache.restore(key, job_database_path)
+
+        result = run_fragpipe(
+            fragpipe_root, job_workflow_path, manifest_path, output_dir, **kwargs
+        )
+        if result.success:
+            cache.store(key, job_database_path)
+        return result
+    finally:
+        remove_tree(job_dir)
+
+
+def find_index_files(database_path: pathlib.Path | str) -> list[pathlib.Path]:
+    """Find the MSFragger index files written next to a database.
+
+    Args:
+        database_path: Path to the FASTA database.
+
+    Returns:
+        Paths of all files next to the database whose name starts with the name stem
+        of the database, excluding the database itself.
+    """
+    database_path = pathlib.Path(database_path)
+    return sorted(
+        path
+        for path in database_path.parent.iterdir()
+        if path.is_file()
+        and path.name not in (database_path.name, database_path.stem)
+        and path.name.startswith(database_path.stem)
+    )
+
+
+def get_index_parameters(workflow_path: pathlib.Path | str) -> dict[str, str]:
+    """Return the workflow parameters that affect the MSFragger peptide index.
+
+    Args:
+        workflow_path: Path to the workflow file.
+
+    Returns:
+        The values of `INDEX_PARAMETERS` and of parameters starting with one of
+        `INDEX_PARAMETER_PREFIXES` set in the workflow.
+    """
+    return {
+        key: value
+        for key, value in read_workflow(workflow_path).items()
+        if key in INDEX_PARAMETERS or key.startswith(INDEX_PARAMETER_PREFIXES)
+    }
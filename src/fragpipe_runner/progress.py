@@ -0,0 +1,283 @@
+"""Module for parsing live progress events from the FragPipe headless stdout.
+
+FragPipe announces every task it executes with a header line followed by the command
+line of the task, and reports the exit code when the task has finished, e.g.:
+
+    MSFragger [Work dir: /path/to/output]
+    java -jar MSFragger-4.1.jar ... /data/file1.mzML /data/file2.mzML
+    ...
+        001. file1.mzML 12.3 s | deisotoping 1.0 s
+    ...
+    Process 'MSFragger' finished, exit code: 0
+
+`FragPipeProgressParser` turns these lines into typed `ProgressEvent` objects.
+"""
+
+import dataclasses
+import re
+import time
+from collections.abc import Callable, Iterable, Iterator
+
+ProgressCallback = Callable[["ProgressEvent"], None]
+"""Function that is called with every progress event parsed from FragPipe stdout."""
+
+RAWFILE_EXTENSIONS = (".raw", ".d", ".mzml", ".mzxml", ".mgf", ".wiff", ".dia")
+"""Lowercase file extensions of spectral files recognised in task command lines."""
+
+_STAGE_START_PATTERN = re.compile(
+    r"^(?P<stage>\S.*?) \[Work dir: (?P<workdir>.*)\]\s*$"
+)
+_STAGE_FINISHED_PATTERN = re.compile(
+    r"^Process '(?P<stage>.+)' finished, exit code: (?P<exit_code>-?\d+)"
+)
+_ALL_DONE_PATTERN = re.compile(r"ALL JOBS DONE IN (?P<minutes>[\d.]+) MINUTES")
+_MSFRAGGER_FILE_PATTERN = re.compile(r"^\s*(?P<index>\d{3,})\. (?P<file>\S.*?)(\s|$)")
+
+# Maps FragPipe task names to the tool they belong to, the first match is used
+_TOOL_PATTERNS: tuple[tuple[re.Pattern, str], ...] = tuple(
+    (re.compile(pattern, re.IGNORECASE), tool)
+    for pattern, tool in [
+        (r"^MSFragger", "MSFragger"),
+        (r"^Crystal-?C", "Crystal-C"),
+        (r"^MSBooster", "MSBooster"),
+        (r"^Percolator", "Percolator"),
+        (r"PeptideProphet", "PeptideProphet"),
+        (r"ProteinProphet", "ProteinProphet"),
+        (r"^PTMProphet", "PTMProphet"),
+        (r"^Philosopher ?Filter", "Philosopher filter"),
+        (r"^Philosopher ?Report", "Philosopher report"),
+        (r"^Philosopher", "Philosopher"),
+        (r"^IonQuant", "IonQuant"),
+        (r"^DIA-?NN", "DIA-NN"),
+        (r"^(EasyPQP|SpecLib)", "Spectral library"),
+        (r"^TMT-?Integrator", "TMT-Integrator"),
+        (r"^PTM-?Shepherd", "PTM-Shepherd"),
+        (r"^FreeQuant", "FreeQuant"),
+    ]
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class ProgressEvent:
+    """Base class of all FragPipe progress events.
+
+    Attributes:
+        elapsed: Seconds since the parser was created when the event was parsed.
+    """
+
+    elapsed: float
+
+
+@dataclasses.dataclass(frozen=True)
+class StageStarted(ProgressEvent):
+    """A FragPipe task has started.
+
+    Attributes:
+        stage: Task name as reported by FragPipe, e.g. "PhilosopherFilter".
+        tool: Tool the task belongs to, e.g. "Philosopher filter", or the task name
+            for unknown tasks.
+        workdir: Working directory of the task.
+    """
+
+    stage: str
+    tool: str
+    workdir: str
+
+
+@dataclasses.dataclass(frozen=True)
+class StageFinished(ProgressEvent):
+    """A FragPipe task has finished.
+
+    Attributes:
+        stage: Task name as reported by FragPipe.
+        tool: Tool the task belongs to.
+        exit_code: Exit code of the task.
+        duration: Seconds between the start and the end of the task, or None if the
+            start of the task was not observed.
+    """
+
+    stage: str
+    tool: str
+    exit_code: int
+    duration: float | None
+
+
+@dataclasses.dataclass(frozen=True)
+class FileProgress(ProgressEvent):
+    """A task has started processing a spectral file.
+
+    Attributes:
+        stage: Task name as reported by FragPipe.
+        tool: Tool the task belongs to.
+        file: Name of the spectral file.
+        index: One-based index of the file.
+        total: Number of spectral files processed by the task, or None if unknown.
+    """
+
+    stage: str
+    tool: str
+    file: str
+    index: int
+    total: int | None
+
+
+@dataclasses.dataclass(frozen=True)
+class RunFinished(ProgressEvent):
+    """FragPipe reported that all tasks are done.
+
+    Attributes:
+        reported_minutes: Total run time in minutes as reported by FragPipe.
+    """
+
+    reported_minutes: float
+
+
+class FragPipeProgressParser:
+    """Incremental parser turning FragPipe stdout lines into progress events.
+
+    Example:
+        parser = FragPipeProgressParser()
+        for line in stdout_lines:
+            for event in parser.feed(line):
+                print(event)
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        """Initialize the parser.
+
+        Args:
+            clock: Function returning the current time in seconds, used to compute
+                the elapsed time of events.
+        """
+        self._clock = clock
+        self._start_time = clock()
+        self._stage: str | None = None
+        self._tool: str | None = None
+        self._stage_start: float | None = None
+        self._expect_command = False
+        self._stage_files: list[str] = []
+        self._file_index = 0
+
+    @property
+    def current_stage(self) -> str | None:
+        """Name of the task that is currently running, or None."""
+        return self._stage
+
+    @property
+    def current_tool(self) -> str | None:
+        """Tool of the task that is currently running, or None."""
+        return self._tool
+
+    def feed(self, line: str) -> list[ProgressEvent]:
+        """Parse a single line of FragPipe stdout.
+
+        Args:
+            line: A line of FragPipe stdout, with or without the trailing newline.
+
+        Returns:
+            The progress events recognised in the line, usually none or one.
+        """
+        line = line.rstrip("\r\n")
+        elapsed = self._clock() - self._start_time
+
+        if self._expect_command:
+            # The line following a task header is the command line of the task
+            self._expect_command = False
+            self._stage_files = _find_rawfile_arguments(line)
+            return []
+
+        if match := _STAGE_FINISHED_PATTERN.match(line):
+            stage = match["stage"]
+            duration = None
+            if self._stage_start is not None and stage == self._stage:
+                duration = elapsed - self._stage_start
+            self._stage = None
+            self._tool = None
+            self._stage_start = None
+            return [
+                StageFinished(
+                    elapsed,
+                    stage,
+                    classify_stage(stage),
+                    int(match["exit_code"]),
+                    duration,
+                )
+            ]
+
+        if match := _STAGE_START_PATTERN.match(line):
+            self._stage = match["stage"]
+            self._tool = classify_stage(self._stage)
+            self._stage_start = elapsed
+            self._expect_command = True
+            self._stage_files = []
+            self._file_index = 0
+            return [StageStarted(elapsed, self._stage, self._tool, match["workdir"])]
+
+        if match := _ALL_DONE_PATTERN.search(line):
+            return [RunFinished(elapsed, float(match["minutes"]))]
+
+        if self._tool == "MSFragger":
+            if match := _MSFRAGGER_FILE_PATTERN.match(line):
+                return [
+                    self._file_progress(elapsed, match["file"], int(match["index"]))
+                ]
+        elif self._stage is not None and len(self._stage_files) > 1:
+            # Tools processing files one by one log the file name before processing
+            event = self._match_next_file(elapsed, line)
+            if event is not None:
+                return [event]
+
+        return []
+
+    def _file_progress(self, elapsed: float, file: str, index: int) -> FileProgress:
+        self._file_index = index
+        total = len(self._stage_files) if self._stage_files else None
+        assert self._stage is not None and self._tool is not None
+        return FileProgress(elapsed, self._stage, self._tool, file, index, total)
+
+    def _match_next_file(self, elapsed: float, line: str) -> FileProgress | None:
+        for index in range(self._file_index, len(self._stage_files)):
+            file = self._stage_files[index]
+            if file in line:
+                return self._file_progress(elapsed, file, index + 1)
+        return None
+
+
+def classify_stage(stage: str) -> str:
+    """Return the tool a FragPipe task belongs to.
+
+    Args:
+        stage: Task name as reported by FragPipe, e.g. "PhilosopherReport".
+
+    Returns:
+        The tool name, e.g. "Philosopher report", or the task name if the task does
+        not belong to a known tool.
+    """
+    for pattern, tool in _TOOL_PATTERNS:
+        if pattern.search(stage):
+            return tool
+    return stage
+
+
+def iter_progress_events(lines: Iterable[str]) -> Iterator[ProgressEvent]:
+    """Parse progress events from FragPipe stdout lines.
+
+    Args:
+        lines: Lines of FragPipe stdout, e.g. an open log file.
+
+    Yields:
+        The parsed progress events.
+    """
+    parser = FragPipeProgressParser()
+    for line in lines:
+        yield from parser.feed(line)
+
+
+def _find_rawfile_arguments(command_line: str) -> list[str]:
+    """Return the names of spectral files passed as arguments in a command line."""
+    file_names = []
+    for argument in command_line.split():
+        argument = argument.strip("\"'").rstrip("/\\")
+        if argument.lower().endswith(RAWFILE_EXTENSIONS):
+            file_names.append(re.split(r"[/\\]", argument)[-1])
+    return file_names
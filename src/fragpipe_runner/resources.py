@@ -0,0 +1,439 @@
+"""Module for monitoring the resource usage of FragPipe process trees."""
+
+import csv
+import dataclasses
+import logging
+import math
+import os
+import pathlib
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+PROC_PATH = pathlib.Path("/proc")
+CGROUP_PATH = pathlib.Path("/sys/fs/cgroup")
+
+# Memory limits at or above this value are treated as unlimited by cgroup v1
+_CGROUP_V1_UNLIMITED = 2**60
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+_CSV_COLUMNS = [
+    "elapsed",
+    "pid",
+    "ppid",
+    "name",
+    "rss_bytes",
+    "cpu_seconds",
+    "threads",
+    "read_bytes",
+    "write_bytes",
+]
+
+
+@dataclasses.dataclass
+class ProcessSample:
+    """Resource usage of a single process at one point in time.
+
+    Attributes:
+        pid: Process ID.
+        ppid: Parent process ID.
+        name: Executable name of the process, e.g. "java".
+        rss_bytes: Resident set size in bytes.
+        cpu_seconds: User and system CPU time consumed so far in seconds.
+        threads: Number of threads.
+        read_bytes: Bytes read from storage so far, or None if not accessible.
+        write_bytes: Bytes written to storage so far, or None if not accessible.
+    """
+
+    pid: int
+    ppid: int
+    name: str
+    rss_bytes: int
+    cpu_seconds: float
+    threads: int
+    read_bytes: int | None
+    write_bytes: int | None
+
+
+class ProcessTreeSampler:
+    """Background sampler of the resource usage of a process and its descendants.
+
+    Walks the process tree below 'root_pid' through '/proc' at a fixed interval and
+    writes one CSV row per process and sample. Only available on Linux.
+
+    Example:
+        with ProcessTreeSampler(process.pid, "resources.csv", interval=5):
+            process.wait()
+    """
+
+    def __init__(
+        self,
+        root_pid: int,
+        output_path: pathlib.Path | str,
+        interval: float = 1.0,
+    ):
+        """Initialize the sampler.
+
+        Args:
+            root_pid: Process ID of the root of the sampled process tree.
+            output_path: Path of the CSV file the samples are written to.
+            interval: Seconds between two samples.
+        """
+        self.root_pid = root_pid
+        self.output_path = pathlib.Path(output_path)
+        self.interval = interval
+        self.peak_rss_bytes = 0
+        self.peak_threads = 0
+        self.cpu_seconds = 0.0
+        self.read_bytes = 0
+        self.write_bytes = 0
+
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        # Counters of processes that already exited are kept with their last value
+        self._cumulative: dict[int, ProcessSample] = {}
+
+    def __enter__(self) -> "ProcessTreeSampler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Start sampling in a background thread.
+
+        Raises:
+            OSError: If '/proc' is not available on this system.
+        """
+        if not is_sampling_supported():
+            raise OSError(
+                "Process tree sampling requires the Linux '/proc' file system."
+            )
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the background thread to finish."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        start_time = time.monotonic()
+        with open(self.output_path, "w", newline="") as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(_CSV_COLUMNS)
+            while True:
+                elapsed = round(time.monotonic() - start_time, 3)
+                samples = sample_process_tree(self.root_pid)
+                self._update_summary(samples)
+                writer.writerows(
+                    [
+                        elapsed,
+                        s.pid,
+                        s.ppid,
+                        s.name,
+                        s.rss_bytes,
+                        round(s.cpu_seconds, 2),
+                        s.threads,
+                        "" if s.read_bytes is None else s.read_bytes,
+                        "" if s.write_bytes is None else s.write_bytes,
+                    ]
+                    for s in samples
+                )
+                output_file.flush()
+                if not samples or self._stop_event.wait(self.interval):
+                    break
+
+    def _update_summary(self, samples: list[ProcessSample]) -> None:
+        self.peak_rss_bytes = max(
+            self.peak_rss_bytes, sum(s.rss_bytes for s in samples)
+        )
+        self.peak_threads = max(self.peak_threads, sum(s.threads for s in samples))
+        for sample in samples:
+            self._cumulative[sample.pid] = sample
+        cumulative = self._cumulative.values()
+        self.cpu_seconds = sum(s.cpu_seconds for s in cumulative)
+        self.read_bytes = sum(s.read_bytes or 0 for s in cumulative)
+        self.write_bytes = sum(s.write_bytes or 0 for s in cumulative)
+
+
+def is_sampling_supported() -> bool:
+    """Return True if process trees can be sampled through '/proc'."""
+    return (PROC_PATH / "self" / "stat").exists()
+
+
+def sample_process_tree(root_pid: int) -> list[ProcessSample]:
+    """Return the resource usage of a process and all of its descendants.
+
+    Args:
+        root_pid: Process ID of the root of the process tree.
+
+    Returns:
+        One sample per process in the tree, or an empty list if the root process does
+        not exist anymore.
+    """
+    samples = {}
+    children: dict[int, list[int]] = {}
+    for entry in os.scandir(PROC_PATH):
+        if not entry.name.isdigit():
+            continue
+        sample = _read_process_stat(int(entry.name))
+        if sample is not None:
+            samples[sample.pid] = sample
+            children.setdefault(sample.ppid, []).append(sample.pid)
+
+    tree = []
+    pending = [root_pid] if root_pid in samples else []
+    while pending:
+        pid = pending.pop()
+        sample = samples[pid]
+        sample.read_bytes, sample.write_bytes = _read_process_io(pid)
+        tree.append(sample)
+        pending.extend(children.get(pid, []))
+    return tree
+
+
+def _read_process_stat(pid: int) -> ProcessSample | None:
+    """Parse '/proc/<pid>/stat', returns None if the process has exited."""
+    try:
+        with open(PROC_PATH / str(pid) / "stat", "rb") as stat_file:
+            stat = stat_file.read().decode(errors="replace")
+    except OSError:
+        return None
+    # The process name is enclosed in parentheses and may contain spaces
+    name_start = stat.find("(")
+    name_end = stat.rfind(")")
+    fields = stat[name_end + 2 :].split()
+    return ProcessSample(
+        pid=pid,
+        ppid=int(fields[1]),
+        name=stat[name_start + 1 : name_end],
+        rss_bytes=int(fields[21]) * _PAGE_SIZE,
+        cpu_seconds=(int(fields[11]) + int(fields[12])) / _CLOCK_TICKS,
+        threads=int(fields[17]),
+        read_bytes=None,
+        write_bytes=None,
+    )
+
+
+def _read_process_io(pid: int) -> tuple[int | None, int | None]:
+    """Parse read and written bytes from '/proc/<pid>/io'."""
+    counters = {}
+    try:
+        with open(PROC_PATH / str(pid) / "io") as io_file:
+            for line in io_file:
+                key, _, value = line.partition(":")
+                counters[key] = int(value)
+    except (OSError, ValueError):
+        return None, None
+    return counters.get("read_bytes"), counters.get("write_bytes")
+
+
+def get_auto_ram_and_threads(ram_headroom: float = 0.2) -> tuple[int, int]:
+    """Return 'ram' and 'threads' values for FragPipe that respect resource limits.
+
+    The memory and CPU limits are taken from the cgroup of the current process
+    (cgroup v2, with a fallback to cgroup v1) and the CPU affinity, so that FragPipe
+    does not size itself from the host resources when running in a Kubernetes pod or a
+    Slurm job.
+
+    Args:
+        ram_headroom: Fraction of the memory limit that is not assigned to the FragPipe
+            JVM, leaving room for JVM overhead and native tools like DIA-NN.
+
+    Returns:
+        The memory in GB (at least 1) and the number of threads (at least 1).
+
+    Raises:
+        ValueError: If 'ram_headroom' is not in the range [0, 1).
+        OSError: If the memory limit cannot be determined.
+    """
+    if not 0 <= ram_headroom < 1:
+        raise ValueError("'ram_headroom' must be in the range [0, 1).")
+    memory_limit = get_memory_limit_bytes()
+    ram = max(int(memory_limit * (1 - ram_headroom) // 1024**3), 1)
+    threads = max(math.floor(get_cpu_limit()), 1)
+    return ram, threads
+
+
+def get_memory_limit_bytes() -> int:
+    """Return the memory available to the current process in bytes.
+
+    This is the physical memory of the host, or the cgroup memory limit if it is lower.
+
+    Raises:
+        OSError: If the physical memory of the host cannot be determined.
+    """
+    memory_bytes = _get_physical_memory_bytes()
+    cgroup_limit = get_cgroup_memory_limit()
+    if cgroup_limit is not None:
+        memory_bytes = min(memory_bytes, cgroup_limit)
+    return memory_bytes
+
+
+def _get_physical_memory_bytes() -> int:
+    """Return the physical memory of the host in bytes.
+
+    Raises:
+        OSError: If the physical memory of the host cannot be determined.
+    """
+    if os.name == "nt":
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            raise OSError("Could not determine the physical memory of the host.")
+        return status.ullTotalPhys
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError) as e:
+        raise OSError("Could not determine the physical memory of the host.") from e
+
+
+def get_cpu_limit() -> float:
+    """Return the number of CPUs available to the current process.
+
+    This is the number of CPUs in the CPU affinity mask of the process, or the cgroup
+    CPU quota if it is lower. The quota may be fractional, e.g. 2.5 CPUs.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpu_count: float = len(os.sched_getaffinity(0))
+    else:
+        cpu_count = os.cpu_count() or 1
+    cgroup_limit = get_cgroup_cpu_limit()
+    if cgroup_limit is not None:
+        cpu_count = min(cpu_count, cgroup_limit)
+    return cpu_count
+
+
+def get_cgroup_memory_limit() -> int | None:
+    """Return the cgroup memory limit of the current process in bytes.
+
+    For cgroup v2, the lowest 'memory.max' of the cgroup and its ancestors is used.
+    For cgroup v1, 'memory.limit_in_bytes' is used.
+
+    Returns:
+        The memory limit in bytes, or None if there is no limit or no cgroup.
+    """
+    limits = []
+    for cgroup_dir in _iter_cgroup_v2_dirs():
+        value = _read_cgroup_value(cgroup_dir / "memory.max")
+        if value is not None and value != "max":
+            limits.append(int(value))
+    if limits:
+        return min(limits)
+
+    cgroup_dir = _find_cgroup_v1_dir("memory")
+    if cgroup_dir is not None:
+        value = _read_cgroup_value(cgroup_dir / "memory.limit_in_bytes")
+        if value is not None and int(value) < _CGROUP_V1_UNLIMITED:
+            return int(value)
+    return None
+
+
+def get_cgroup_cpu_limit() -> float | None:
+    """Return the cgroup CPU quota of the current process as a number of CPUs.
+
+    For cgroup v2, the lowest 'cpu.max' quota of the cgroup and its ancestors is used.
+    For cgroup v1, 'cpu.cfs_quota_us' and 'cpu.cfs_period_us' are used.
+
+    Returns:
+        The CPU quota, or None if there is no quota or no cgroup.
+    """
+    limits = []
+    for cgroup_dir in _iter_cgroup_v2_dirs():
+        value = _read_cgroup_value(cgroup_dir / "cpu.max")
+        if value is None:
+            continue
+        quota, _, period = value.partition(" ")
+        if quota != "max" and period:
+            limits.append(int(quota) / int(period))
+    if limits:
+        return min(limits)
+
+    cgroup_dir = _find_cgroup_v1_dir("cpu")
+    if cgroup_dir is not None:
+        quota = _read_cgroup_value(cgroup_dir / "cpu.cfs_quota_us")
+        period = _read_cgroup_value(cgroup_dir / "cpu.cfs_period_us")
+        if quota is not None and period is not None and int(quota) > 0:
+            return int(quota) / int(period)
+    return None
+
+
+def _read_proc_cgroup() -> list[tuple[str, str]]:
+    """Return (controllers, path) tuples from '/proc/self/cgroup'."""
+    try:
+        with open(PROC_PATH / "self" / "cgroup") as cgroup_file:
+            lines = cgroup_file.read().splitlines()
+    except OSError:
+        return []
+    entries = []
+    for line in lines:
+        parts = line.split(":", 2)
+        if len(parts) == 3:
+            entries.append((parts[1], parts[2]))
+    return entries
+
+
+def _iter_cgroup_v2_dirs() -> list[pathlib.Path]:
+    """Return the cgroup v2 directory of the current process and its ancestors.
+
+    Inside a container with a private cgroup namespace, the cgroup path of the process
+    is not visible below the mount point and the root of the mount is used instead.
+    """
+    if not (CGROUP_PATH / "cgroup.controllers").exists():
+        return []
+    relative_path = next(
+        (path for controllers, path in _read_proc_cgroup() if controllers == ""), "/"
+    )
+    cgroup_dir = CGROUP_PATH / relative_path.lstrip("/")
+    if not cgroup_dir.is_dir():
+        cgroup_dir = CGROUP_PATH
+    directories = [cgroup_dir]
+    while cgroup_dir != CGROUP_PATH and CGROUP_PATH in cgroup_dir.parents:
+        cgroup_dir = cgroup_dir.parent
+        directories.append(cgroup_dir)
+    return directories
+
+
+def _find_cgroup_v1_dir(controller: str) -> pathlib.Path | None:
+    """Return the cgroup v1 directory of the current process for a controller."""
+    for controllers, relative_path in _read_proc_cgroup():
+        if controller not in controllers.split(","):
+            continue
+        for mount_name in (controllers, controller, "cpu,cpuacct"):
+            mount_dir = CGROUP_PATH / mount_name
+            if not mount_dir.is_dir():
+                continue
+            cgroup_dir = mount_dir / relative_path.lstrip("/")
+            return cgroup_dir if cgroup_dir.is_dir() else mount_dir
+    return None
+
+
+def _read_cgroup_value(path: pathlib.Path) -> str | None:
+    """Return the stripped content of a cgroup interface file, or None."""
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return None
@@ -0,0 +1,302 @@
+"""Module for retrying FragPipe runs that ran out of memory.
+
+When the JVM or a native tool runs out of memory, the run is retried with adapted
+settings: 'ram' is raised up to the memory limit of the host or cgroup first. Once it
+cannot be raised any further, 'threads' is reduced and, if MSFragger failed, the
+database is split into more slices with 'msfragger.misc.slice-db'.
+
+The output of each failed attempt is moved to a '.attempt-<n>' subdirectory of the
+output directory before the next attempt, so that retries start from an empty output
+directory and the logs of failed attempts are kept. Inputs of the run inside the
+output directory, e.g. the workflow or manifest, stay in place.
+"""
+
+import dataclasses
+import logging
+import math
+import os
+import pathlib
+import re
+import shutil
+import tempfile
+from collections.abc import Sequence
+from typing import Any
+
+from .execute import RunResult, resolve_ram_and_threads, run_fragpipe
+from .manifest import read_rawfile_paths
+from .resources import get_cpu_limit, get_memory_limit_bytes
+from .timing import write_timing_report
+from .workflow import (
+    SLICE_DB_PARAMETER,
+    get_database_path,
+    read_workflow,
+    update_workflow_parameters,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+OUT_OF_MEMORY_PATTERN = re.compile(
+    r"OutOfMemoryError|Java heap space|GC overhead limit exceeded|std::bad_alloc"
+    r"|Cannot allocate memory|Not enough memory|insufficient memory",
+    re.IGNORECASE,
+)
+"""Pattern of out-of-memory messages in the FragPipe log and stderr."""
+
+# Exit codes of a process killed with SIGKILL, e.g. by the kernel OOM killer, either
+# directly or reported by the shell script launching FragPipe
+_SIGKILL_EXIT_CODES = (-9, 137)
+# Number of bytes read from the end of the log file to find out-of-memory errors
+_LOG_TAIL_BYTES = 1024 * 1024
+_ATTEMPT_DIR_PREFIX = ".attempt-"
+
+
+@dataclasses.dataclass
+class RetryPolicy:
+    """Settings for retrying FragPipe runs that ran out of memory.
+
+    Attributes:
+        max_attempts: Maximum number of runs, including the first one.
+        ram_factor: Factor 'ram' is multiplied with on each retry.
+        max_ram: Maximum memory in GB. If None, the physical memory of the host or
+            the cgroup memory limit, whichever is lower, minus 1 GB is used.
+        thread_factor: Factor 'threads' is multiplied with once 'ram' cannot be
+            raised any further.
+        min_threads: Minimum number of threads.
+        slice_db_factor: Factor the number of MSFragger database slices is multiplied
+            with once 'ram' cannot be raised any further.
+        max_slice_db: Maximum number of MSFragger database slices.
+    """
+
+    max_attempts: int = 3
+    ram_factor: float = 1.5
+    max_ram: int | None = None
+    thread_factor: float = 0.5
+    min_threads: int = 1
+    slice_db_factor: int = 2
+    max_slice_db: int = 64
+
+
+@dataclasses.dataclass
+class RetryAttempt:
+    """A failed FragPipe run that was retried.
+
+    Attributes:
+        ram: Memory in GB passed to FragPipe.
+        threads: CPU threads passed to FragPipe.
+        slice_db: Number of MSFragger database slices.
+        result: Result of the run. Its paths point into the '.attempt-<n>'
+            subdirectory the output of the run was moved to.
+    """
+
+    ram: int
+    threads: int
+    slice_db: int
+    result: RunResult
+
+
+def run_fragpipe_with_retry(
+    fragpipe_root: pathlib.Path | str,
+    workflow_path: pathlib.Path | str,
+    manifest_path: pathlib.Path | str,
+    output_dir: pathlib.Path | str,
+    ram: int | str = 0,
+    threads: int | str = -1,
+    policy: RetryPolicy | None = None,
+    logger: logging.Logger | None = None,
+    **kwargs: Any,
+) -> RunResult:
+    """Run FragPipe and retry with adapted settings if it runs out of memory.
+
+    Args:
+        fragpipe_root: Path to FragPipe installation directory
+        workflow_path: Path to workflow file
+        manifest_path: Path to manifest file
+        output_dir: Path to analysis output directory
+        ram: Memory in GB for the first attempt, see `run_fragpipe`. If 0, FragPipe
+            decides and 'ram' is not raised on retries.
+        threads: CPU threads for the first attempt, see `run_fragpipe`.
+        policy: Retry settings. If None, the defaults of `RetryPolicy` are used.
+        logger: Logger for logging messages. If None, the module-level logger is used.
+        **kwargs: Additional keyword arguments passed to `run_fragpipe`.
+
+    Returns:
+        The result of the last attempt. Earlier attempts are listed in its `attempts`.
+    """
+    if logger is None:
+        logger = LOGGER
+    if policy is None:
+        policy = RetryPolicy()
+    ram, threads = resolve_ram_and_threads(
+        ram, threads, kwargs.get("auto_ram_headroom", 0.2), logger
+    )
+    max_ram = policy.max_ram
+    if max_ram is None:
+        max_ram = max(get_memory_limit_bytes() // 1024**3 - 1, 1)
+    slice_db = int(read_workflow(workflow_path).get(SLICE_DB_PARAMETER) or 1)
+
+    attempts: list[RetryAttempt] = []
+    retry_workflow_path: pathlib.Path | None = None
+    try:
+        while True:
+            result = run_fragpipe(
+                fragpipe_root,
+                retry_workflow_path or workflow_path,
+                manifest_path,
+                output_dir,
+                ram=ram,
+                threads=threads,
+                logger=logger,
+                **kwargs,
+            )
+            settings = None
+            if is_out_of_memory(result) and len(attempts) + 1 < policy.max_attempts:
+                settings = _get_retry_settings(
+                    ram, threads, slice_db, _get_failed_tool(result), max_ram, policy
+                )
+                if settings is None:
+                    logger.error(
+                        "FragPipe ran out of memory, no setting left to adapt."
+                    )
+            if settings is None:
+                result.attempts = attempts
+                return result
+
+            _move_attempt_output(
+                result,
+                len(attempts) + 1,
+                _get_input_paths(workflow_path, manifest_path),
+            )
+            attempts.append(RetryAttempt(ram, threads, slice_db, result))
+            ram, threads, slice_db = settings
+            logger.warning(
+                f"FragPipe ran out of memory, retrying with {ram} GB RAM, {threads} "
+                f"threads and {slice_db} database slices (attempt "
+                f"{len(attempts) + 1} of {policy.max_attempts})."
+            )
+            if retry_workflow_path is None:
+                fd, path = tempfile.mkstemp(suffix=".workflow")
+                os.close(fd)
+                retry_workflow_path = pathlib.Path(path)
+            update_workflow_parameters(
+                workflow_path, retry_workflow_path, {SLICE_DB_PARAMETER: str(slice_db)}
+            )
+    finally:
+        if retry_workflow_path is not None:
+            retry_workflow_path.unlink(missing_ok=True)
+
+
+def is_out_of_memory(result: RunResult) -> bool:
+    """Return True if a failed FragPipe run ran out of memory.
+
+    Out-of-memory errors are detected from messages in stderr and the end of the log
+    file, and from processes killed with SIGKILL, e.g. by the kernel OOM killer.
+
+    Args:
+        result: Result of the FragPipe run.
+
+    Returns:
+        True if the run failed because it ran out of memory.
+    """
+    if result.success or result.termination_reason is not None:
+        return False
+    if result.exit_code in _SIGKILL_EXIT_CODES:
+        return True
+    if result.error_output and OUT_OF_MEMORY_PATTERN.search(result.error_output):
+        return True
+    if result.log_path is not None and result.log_path.exists():
+        with open(result.log_path, "rb") as log_file:
+            log_file.seek(max(result.log_path.stat().st_size - _LOG_TAIL_BYTES, 0))
+            log_tail = log_file.read().decode(errors="replace")
+        return OUT_OF_MEMORY_PATTERN.search(log_tail) is not None
+    return False
+
+
+def _get_input_paths(
+    workflow_path: pathlib.Path | str,
+    manifest_path: pathlib.Path | str,
+) -> list[pathlib.Path]:
+    """Return the resolved paths of the workflow, manifest, FASTA and raw files."""
+    manifest_path = pathlib.Path(manifest_path)
+    input_paths = [pathlib.Path(workflow_path), manifest_path]
+    input_paths.extend(
+        manifest_path.parent / p for p in read_rawfile_paths(manifest_path)
+    )
+    database_path = get_database_path(workflow_path)
+    if database_path is not None:
+        input_paths.append(database_path)
+    return [path.resolve() for path in input_paths]
+
+
+def _move_attempt_output(
+    result: RunResult,
+    attempt: int,
+    input_paths: Sequence[pathlib.Path] = (),
+) -> None:
+    """Move the output of a failed attempt to a subdirectory of the output directory
+    and update the paths of its result.
+
+    Files and directories of the output directory that are or contain one of
+    'input_paths' are not moved.
+    """
+    output_path = result.output_dir
+    if not output_path.is_dir():
+        return
+    attempt_path = output_path / f"{_ATTEMPT_DIR_PREFIX}{attempt}"
+    attempt_path.mkdir(exist_ok=True)
+    for path in output_path.iterdir():
+        if path.name.startswith(_ATTEMPT_DIR_PREFIX):
+            continue
+        resolved_path = path.resolve()
+        if any(p.is_relative_to(resolved_path) for p in input_paths):
+            continue
+        shutil.move(path, attempt_path / path.name)
+
+    def relocate(path: pathlib.Path | None) -> pathlib.Path | None:
+        if path is None or not path.is_relative_to(output_path):
+            return path
+        return attempt_path / path.relative_to(output_path)
+
+    result.output_dir = attempt_path
+    result.log_path = relocate(result.log_path)
+    result.resource_profile_path = relocate(result.resource_profile_path)
+    if result.timing is not None:
+        result.timing.log_path = relocate(
+            pathlib.Path(result.timing.log_path)
+        ).as_posix()
+        # The moved report still refers to the log file at its old path
+        write_timing_report(result.timing)
+
+
+def _get_failed_tool(result: RunResult) -> str | None:
+    """Return the tool of the last FragPipe task that did not finish successfully."""
+    if result.timing is None:
+        return None
+    for stage in reversed(result.timing.stages):
+        if stage.exit_code != 0:
+            return stage.tool
+    return None
+
+
+def _get_retry_settings(
+    ram: int,
+    threads: int,
+    slice_db: int,
+    failed_tool: str | None,
+    max_ram: int,
+    policy: RetryPolicy,
+) -> tuple[int, int, int] | None:
+    """Return the 'ram', 'threads' and slice-db for the next attempt, or None if no
+    setting can be adapted any further.
+    """
+    if 0 < ram < max_ram:
+        return min(math.ceil(ram * policy.ram_factor), max_ram), threads, slice_db
+
+    new_slice_db = slice_db
+    if failed_tool in (None, "MSFragger"):
+        new_slice_db = min(slice_db * policy.slice_db_factor, policy.max_slice_db)
+    if threads <= 0:
+        threads = max(math.floor(get_cpu_limit()) - 1, 1)
+    new_threads = max(math.floor(threads * policy.thread_factor), policy.min_threads)
+    if new_slice_db == slice_db and new_threads >= threads:
+        return None
+    return ram, min(new_threads, threads), new_slice_db
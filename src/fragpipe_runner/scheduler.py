@@ -0,0 +1,334 @@
+"""Module for running multiple FragPipe jobs in parallel within a resource budget."""
+
+import collections
+import dataclasses
+import functools
+import logging
+import math
+import pathlib
+import threading
+from collections.abc import Collection, Iterable
+
+from .execute import RunResult, run_fragpipe
+from .progress import ProgressEvent, StageStarted
+from .resources import get_cpu_limit, get_memory_limit_bytes
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_LOW_CPU_TOOLS = (
+    "Philosopher",
+    "Philosopher filter",
+    "Philosopher report",
+    "ProteinProphet",
+    "TMT-Integrator",
+)
+"""Tools of FragPipe tasks that use only a few CPU cores, as named by
+`fragpipe_runner.progress.classify_stage`.
+"""
+
+
+@dataclasses.dataclass
+class SearchJob:
+    """A FragPipe search queued in a `FragPipeScheduler`.
+
+    Attributes:
+        workflow_path: Path to workflow file
+        manifest_path: Path to manifest file
+        output_dir: Path to analysis output directory
+        ram: Memory in GB requested by the job. If None, the scheduler default is used.
+        threads: CPU threads requested by the job. If None, the scheduler default is
+            used.
+        temp_dir: Path to temporary directory for FragPipe output, see `run_fragpipe`.
+        isolate_rawfiles: If True, FragPipe artefacts written next to the raw files
+            are confined to a per-job directory, see `run_fragpipe`. Required to run
+            jobs sharing raw files in parallel.
+        allocated_ram: Memory in GB that was passed to FragPipe.
+        allocated_threads: CPU threads that were passed to FragPipe.
+        released_threads: CPU threads returned to the budget while the job is in a
+            low-CPU stage, see `FragPipeScheduler`.
+        result: Result of the FragPipe run, or None if the job has not finished yet or
+            raised an exception.
+        error: Exception raised while running the job, if any.
+    """
+
+    workflow_path: pathlib.Path | str
+    manifest_path: pathlib.Path | str
+    output_dir: pathlib.Path | str
+    ram: int | None = None
+    threads: int | None = None
+    temp_dir: pathlib.Path | str | None = None
+    isolate_rawfiles: bool = False
+    allocated_ram: int | None = dataclasses.field(default=None, init=False)
+    allocated_threads: int | None = dataclasses.field(default=None, init=False)
+    released_threads: int = dataclasses.field(default=0, init=False)
+    result: RunResult | None = dataclasses.field(default=None, init=False)
+    error: Exception | None = dataclasses.field(default=None, init=False)
+
+    @property
+    def success(self) -> bool | None:
+        """True if FragPipe completed successfully, False if it failed, None if the
+        job has not finished yet.
+        """
+        if self.result is not None:
+            return self.result.success
+        if self.error is not None:
+            return False
+        return None
+
+
+class FragPipeScheduler:
+    """Run a queue of FragPipe jobs in parallel within a host-wide RAM and CPU budget.
+
+    Each job is started with explicit 'ram' and 'threads' values, and a job is only
+    started once its allocation fits into the remaining budget, so that concurrent
+    FragPipe instances never oversubscribe the machine. Jobs are started in the order
+    they were submitted.
+
+    With 'low_cpu_tools', the scheduler follows the tasks of running jobs on their
+    stdout. While a job runs a task of one of these tools, e.g. Philosopher, only
+    'low_cpu_threads' of its threads are counted against the budget, so that the next
+    job can start. Once the job leaves the low-CPU stage, its threads are counted
+    again, and no further jobs are started until enough threads are free. Memory is
+    never released, as the JVM keeps its heap. Because FragPipe's thread count is
+    fixed at start, the machine may be oversubscribed for a while when several jobs
+    leave their low-CPU stages at the same time.
+
+    Example:
+        scheduler = FragPipeScheduler("path/to/fragpipe", ram_budget=120, job_ram=40)
+        scheduler.submit("workflow.workflow", "a.fp-manifest", "output/a")
+        scheduler.submit("workflow.workflow", "b.fp-manifest", "output/b")
+        jobs = scheduler.run()
+    """
+
+    def __init__(
+        self,
+        fragpipe_root: pathlib.Path | str,
+        ram_budget: int | None = None,
+        thread_budget: int | None = None,
+        job_ram: int | None = None,
+        job_threads: int | None = None,
+        max_parallel_jobs: int = 2,
+        low_cpu_tools: Collection[str] | None = None,
+        low_cpu_threads: int = 1,
+        min_job_threads: int | None = None,
+        logger: logging.Logger | None = None,
+    ):
+        """Initialize the scheduler.
+
+        Args:
+            fragpipe_root: Path to FragPipe installation directory
+            ram_budget: Total memory in GB available to all concurrent jobs. If None,
+                the physical memory of the host or the cgroup memory limit, whichever
+                is lower, minus 1 GB is used.
+            thread_budget: Total number of CPU threads available to all concurrent
+                jobs. If None, the number of CPUs available to the current process,
+                respecting the cgroup CPU quota and CPU affinity, is used.
+            job_ram: Default memory in GB allocated to a job. If None, the RAM budget
+                is split evenly between 'max_parallel_jobs'.
+            job_threads: Default number of CPU threads allocated to a job. If None, the
+                thread budget is split evenly between 'max_parallel_jobs'.
+            max_parallel_jobs: Maximum number of jobs running at the same time.
+            low_cpu_tools: Tools of FragPipe tasks during which a job only uses
+                'low_cpu_threads' CPU threads, e.g. `DEFAULT_LOW_CPU_TOOLS`. If None,
+                jobs always use all of their allocated threads.
+            low_cpu_threads: CPU threads counted for a job in a low-CPU stage.
+            min_job_threads: Minimum number of CPU threads a job may be started with
+                if fewer threads than requested are free. If None, jobs are only
+                started with the requested number of threads.
+            logger: Logger for logging messages. If None, the module-level logger is
+                used.
+
+        Raises:
+            ValueError: If 'max_parallel_jobs' is less than 1, or if 'ram_budget' is
+                None and the memory of the host cannot be determined.
+        """
+        if max_parallel_jobs < 1:
+            raise ValueError("'max_parallel_jobs' must be at least 1.")
+        if ram_budget is None:
+            try:
+                ram_budget = max(get_memory_limit_bytes() // 1024**3 - 1, 1)
+            except OSError as e:
+                raise ValueError(
+                    f"'ram_budget' must be specified on this platform: {e}"
+                ) from e
+        if thread_budget is None:
+            thread_budget = max(math.floor(get_cpu_limit()), 1)
+
+        self.fragpipe_root = fragpipe_root
+        self.ram_budget = ram_budget
+        self.thread_budget = thread_budget
+        self.job_ram = job_ram or max(ram_budget // max_parallel_jobs, 1)
+        self.job_threads = job_threads or max(thread_budget // max_parallel_jobs, 1)
+        self.max_parallel_jobs = max_parallel_jobs
+        self.low_cpu_tools = frozenset(low_cpu_tools or ())
+        self.low_cpu_threads = low_cpu_threads
+        self.min_job_threads = min_job_threads
+        self.logger = logger if logger is not None else LOGGER
+
+        self._queue: collections.deque[SearchJob] = collections.deque()
+        self._condition = threading.Condition()
+        self._available_ram = ram_budget
+        self._available_threads = thread_budget
+        self._running: list[SearchJob] = []
+
+    def submit(
+        self,
+        workflow_path: pathlib.Path | str,
+        manifest_path: pathlib.Path | str,
+        output_dir: pathlib.Path | str,
+        ram: int | None = None,
+        threads: int | None = None,
+        temp_dir: pathlib.Path | str | None = None,
+        isolate_rawfiles: bool = False,
+    ) -> SearchJob:
+        """Add a FragPipe job to the queue.
+
+        Args:
+            workflow_path: Path to workflow file
+            manifest_path: Path to manifest file
+            output_dir: Path to analysis output directory
+            ram: Memory in GB for this job. If None, 'job_ram' is used.
+            threads: CPU threads for this job. If None, 'job_threads' is used.
+            temp_dir: Path to temporary directory for FragPipe output, see
+                `run_fragpipe`.
+            isolate_rawfiles: If True, FragPipe artefacts written next to the raw
+                files are confined to a per-job directory, see `run_fragpipe`.
+
+        Returns:
+            The queued job.
+        """
+        job = SearchJob(
+            workflow_path,
+            manifest_path,
+            output_dir,
+            ram,
+            threads,
+            temp_dir,
+            isolate_rawfiles,
+        )
+        self._queue.append(job)
+        return job
+
+    def run(self, jobs: Iterable[SearchJob] = ()) -> list[SearchJob]:
+        """Run all queued jobs and block until they have finished.
+
+        Args:
+            jobs: Additional jobs that are appended to the queue before running.
+
+        Returns:
+            The finished jobs in the order they were queued.
+        """
+        self._queue.extend(jobs)
+        finished_jobs = list(self._queue)
+        workers: list[threading.Thread] = []
+
+        with self._condition:
+            while self._queue or self._running:
+                while self._queue and self._can_start(self._queue[0]):
+                    job = self._queue.popleft()
+                    self._allocate(job)
+                    worker = threading.Thread(target=self._run_job, args=(job,))
+                    workers.append(worker)
+                    worker.start()
+                self._condition.wait()
+
+        for worker in workers:
+            worker.join()
+        return finished_jobs
+
+    def _can_start(self, job: SearchJob) -> bool:
+        """Return True if the job fits into the currently available resources."""
+        if not self._running:
+            return True
+        if len(self._running) >= self.max_parallel_jobs:
+            return False
+        ram, threads = self._requested_resources(job)
+        if self.min_job_threads is not None:
+            threads = min(threads, self.min_job_threads)
+        return ram <= self._available_ram and threads <= self._available_threads
+
+    def _requested_resources(self, job: SearchJob) -> tuple[int, int]:
+        """Return the RAM and threads requested by a job, limited to the budget."""
+        ram = min(job.ram or self.job_ram, self.ram_budget)
+        threads = min(job.threads or self.job_threads, self.thread_budget)
+        return ram, threads
+
+    def _allocate(self, job: SearchJob) -> None:
+        ram, threads = self._requested_resources(job)
+        if (
+            self.min_job_threads is not None
+            and self._available_threads >= self.min_job_threads
+        ):
+            threads = min(threads, self._available_threads)
+        job.allocated_ram = ram
+        job.allocated_threads = threads
+        self._available_ram -= ram
+        self._available_threads -= threads
+        if self._available_threads < 0:
+            self.logger.warning(
+                f"FragPipe job '{job.output_dir}' oversubscribes the thread budget by "
+                f"{-self._available_threads} threads."
+            )
+        self._running.append(job)
+        self.logger.info(
+            f"Starting FragPipe job '{job.output_dir}' with {ram} GB RAM and "
+            f"{threads} threads ({len(self._queue)} jobs queued)."
+        )
+
+    def _release(self, job: SearchJob) -> None:
+        self._available_ram += job.allocated_ram or 0
+        self._available_threads += (job.allocated_threads or 0) - job.released_threads
+        job.released_threads = 0
+        self._running.remove(job)
+
+    def _on_progress(self, job: SearchJob, event: ProgressEvent) -> None:
+        """Release or reclaim the threads of a job when it enters or leaves a low-CPU
+        stage.
+        """
+        if not isinstance(event, StageStarted):
+            return
+        with self._condition:
+            if event.tool in self.low_cpu_tools:
+                if job.released_threads == 0:
+                    release = (job.allocated_threads or 0) - self.low_cpu_threads
+                    if release > 0:
+                        job.released_threads = release
+                        self._available_threads += release
+                        self.logger.debug(
+                            f"FragPipe job '{job.output_dir}' entered low-CPU stage "
+                            f"'{event.stage}', releasing {release} threads."
+                        )
+                        self._condition.notify_all()
+            elif job.released_threads:
+                self._available_threads -= job.released_threads
+                self.logger.debug(
+                    f"FragPipe job '{job.output_dir}' entered stage '{event.stage}', "
+                    f"reclaiming {job.released_threads} threads."
+                )
+                job.released_threads = 0
+
+    def _run_job(self, job: SearchJob) -> None:
+        try:
+            job.result = run_fragpipe(
+                self.fragpipe_root,
+                job.workflow_path,
+                job.manifest_path,
+                job.output_dir,
+                ram=job.allocated_ram or 0,
+                threads=job.allocated_threads or -1,
+                temp_dir=job.temp_dir,
+                isolate_rawfiles=job.isolate_rawfiles,
+                logger=self.logger,
+                progress_callback=(
+                    functools.partial(self._on_progress, job)
+                    if self.low_cpu_tools
+                    else None
+                ),
+            )
+        except Exception as e:
+            self.logger.error(f"FragPipe job '{job.output_dir}' failed: {e}")
+            job.error = e
+        finally:
+            with self._condition:
+                self._release(job)
+                self._condition.notify_all()
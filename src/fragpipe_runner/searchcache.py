@@ -0,0 +1,426 @@
+"""Module for caching MSFragger search results per raw file.
+
+Growing a cohort by a few raw files otherwise searches all raw files again. MSFragger
+searches each raw file independently and writes one '.pepXML' and '.pin' file per raw
+file, so these results can be reused for raw files that were searched before with the
+same database and search parameters.
+
+`run_fragpipe_incremental` first runs MSFragger alone on the raw files without cached
+results, adds their results to the cache, materializes the results of all raw files
+into the output directory, and then runs the downstream FDR and quantification stages
+over all raw files with MSFragger disabled.
+"""
+
+import logging
+import pathlib
+import uuid
+from typing import Any
+
+import pandas as pd
+
+from ._lru import EntryCache, clone_file, link_file, remove_tree
+from .cache import get_fragpipe_fingerprint, get_rawfile_identity, hash_file
+from .execute import RunResult, run_fragpipe
+from .fingerprint import FingerprintIndex
+from .workflow import (
+    SLICE_DB_PARAMETER,
+    get_database_path,
+    read_workflow,
+    update_workflow_parameters,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+RESULT_SUFFIXES = (".pepXML", ".pin")
+"""Suffixes of the per raw file result files written by MSFragger."""
+
+SEARCH_PARAMETER_PREFIXES = ("msfragger.",)
+"""Prefixes of workflow parameters that affect the MSFragger results."""
+
+SEARCH_PARAMETERS = ("database.decoy-tag",)
+"""Workflow parameters that affect the MSFragger results."""
+
+MSFRAGGER_RUN_PARAMETER = "msfragger.run-msfragger"
+"""Workflow parameter enabling MSFragger."""
+
+DOWNSTREAM_RUN_PARAMETERS = (
+    "crystalc.run-crystalc",
+    "msbooster.run-msbooster",
+    "peptide-prophet.run-peptide-prophet",
+    "percolator.run-percolator",
+    "ptmprophet.run-ptmprophet",
+    "ptmshepherd.run-shepherd",
+    "protein-prophet.run-protein-prophet",
+    "phi-report.run-report",
+    "ionquant.run-ionquant",
+    "freequant.run-freequant",
+    "tmtintegrator.run-tmtintegrator",
+    "speclibgen.run-speclibgen",
+    "diann.run-dia-nn",
+)
+"""Workflow parameters enabling the stages after MSFragger, which are disabled when
+searching raw files without cached results.
+"""
+
+_RESULTS_DIRNAME = "results"
+# Workflow parameters that do not change the MSFragger results
+_IGNORED_PARAMETERS = (MSFRAGGER_RUN_PARAMETER, SLICE_DB_PARAMETER)
+
+
+class SearchResultCache(EntryCache):
+    """Disk-bounded LRU cache of MSFragger results per raw file.
+
+    An entry is identified by the raw file, its manifest row, the content of the
+    FASTA database, the MSFragger search parameters and the FragPipe installation.
+    The manifest row is part of the key, as the experiment and bioreplicate determine
+    the output subdirectory the results are written to. Each entry records the paths
+    of its result files relative to the output directory, and cached results are
+    restored to the same paths. They are copied with reflinks where the file system
+    supports them, falling back to regular copies, so that downstream tools rewriting
+    them never affect the cache.
+
+    Example:
+        cache = SearchResultCache("path/to/results", max_size_bytes=500 * 1024**3)
+        result = run_fragpipe_incremental(
+            cache, fragpipe_root, workflow, manifest, output
+        )
+    """
+
+    entry_description = "MSFragger results"
+    key_version = 2
+
+    def __init__(
+        self,
+        cache_dir: pathlib.Path | str,
+        max_size_bytes: int | None = None,
+        fingerprint_index: FingerprintIndex | None = None,
+    ):
+        """Initialize the cache.
+
+        Args:
+            cache_dir: Directory where results are stored. Created if missing.
+            max_size_bytes: Maximum total size of all cached results. If None, the
+                cache is not bounded.
+            fingerprint_index: Optional raw file fingerprint index used to identify
+                raw files by content. Otherwise, raw files are identified by their
+                name, size and mtime.
+        """
+        super().__init__(cache_dir, max_size_bytes)
+        self.fingerprint_index = fingerprint_index
+
+    def compute_keys(
+        self,
+        fragpipe_root: pathlib.Path | str,
+        workflow_path: pathlib.Path | str,
+        manifest: pd.DataFrame,
+    ) -> list[str]:
+        """Compute the cache keys of the raw files of a manifest.
+
+        Args:
+            fragpipe_root: Path to FragPipe installation directory
+            workflow_path: Path to workflow file
+            manifest: The manifest table with all columns read as strings.
+
+        Returns:
+            Hexadecimal SHA-256 digests, one per manifest row.
+        """
+        rawfile_paths = [pathlib.Path(path) for path in manifest.iloc[:, 0]]
+        if self.fingerprint_index is None:
+            identities = [get_rawfile_identity(path) for path in rawfile_paths]
+        else:
+            fingerprints = self.fingerprint_index.get_many(rawfile_paths)
+            identities = [
+                [pathlib.Path(f.path).name, f.size, f.fast_hash] for f in fingerprints
+            ]
+
+        fingerprint: dict[str, Any] = {
+            "fragpipe": get_fragpipe_fingerprint(fragpipe_root),
+            "parameters": get_search_parameters(workflow_path),
+        }
+        database_path = get_database_path(workflow_path)
+        if database_path is not None:
+            fingerprint["database"] = hash_file(database_path)
+
+        keys = []
+        for identity, (_, experiment, bioreplicate, data_type) in zip(
+            identities, manifest.iloc[:, :4].itertuples(index=False)
+        ):
+            fingerprint["rawfile"] = identity
+            fingerprint["experiment"] = experiment
+            fingerprint["bioreplicate"] = bioreplicate
+            fingerprint["data_type"] = data_type
+            keys.append(self.hash_fingerprint(fingerprint))
+        return keys
+
+    def restore(self, key: str, output_dir: pathlib.Path) -> int:
+        """Materialize the cached results of a raw file into an output directory.
+
+        Args:
+            key: Cache key of the raw file.
+            output_dir: Path to analysis output directory. The result files are
+                created at the paths they had in the output directory of the search.
+
+        Returns:
+            The number of restored result files, 0 if the cache does not contain the
+            results of the raw file.
+        """
+        results_dir = self.entry_dir(key) / _RESULTS_DIRNAME
+        try:
+            relative_paths = self.read_metadata(key)["files"]
+            for relative_path in relative_paths:
+                destination = output_dir / relative_path
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                destination.unlink(missing_ok=True)
+                clone_file(results_dir / relative_path, destination)
+        except (OSError, ValueError, KeyError) as e:
+            LOGGER.debug(f"Could not restore {self.entry_description} '{key}': {e}")
+            return 0
+        self.touch(key)
+        return len(relative_paths)
+
+    def store(
+        self,
+        key: str,
+        output_dir: pathlib.Path,
+        result_paths: list[pathlib.Path],
+    ) -> None:
+        """Add the MSFragger results of a raw file to the cache.
+
+        The entry is assembled in a staging directory and moved into place atomically.
+
+        Args:
+            key: Cache key of the raw file.
+            output_dir: Output directory of the search the results were written to.
+            result_paths: Paths of the result files of the raw file within
+                'output_dir'.
+        """
+        if self.contains(key) or not result_paths:
+            return
+        relative_paths = [path.relative_to(output_dir) for path in result_paths]
+
+        def populate(entry_dir: pathlib.Path) -> None:
+            for result_path, relative_path in zip(result_paths, relative_paths):
+                destination = entry_dir / _RESULTS_DIRNAME / relative_path
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                link_file(result_path, destination)
+
+        self.store_entry(
+            key, populate, {"files": [path.as_posix() for path in relative_paths]}
+        )
+
+
+def run_fragpipe_incremental(
+    cache: SearchResultCache,
+    fragpipe_root: pathlib.Path | str,
+    workflow_path: pathlib.Path | str,
+    manifest_path: pathlib.Path | str,
+    output_dir: pathlib.Path | str,
+    logger: logging.Logger | None = None,
+    **kwargs: Any,
+) -> RunResult:
+    """Run FragPipe, searching only raw files without cached MSFragger results.
+
+    Raw files without cached results are searched in a separate MSFragger-only run,
+    whose results are added to the cache. The results of all raw files are then
+    materialized into the output directory, and FragPipe is run over all raw files
+    with MSFragger disabled, so that the FDR and quantification stages use the
+    combined set of results.
+
+    The downstream run writes directly into 'output_dir', as it reads the
+    materialized results from there, so 'temp_dir' is only used for the MSFragger-only
+    run. The cached results of the manifest are protected from eviction until they
+    are restored. If results were evicted by another process in the meantime, the
+    affected raw files are searched again once.
+
+    Args:
+        cache: The search result cache.
+        fragpipe_root: Path to FragPipe installation directory
+        workflow_path: Path to workflow file
+        manifest_path: Path to manifest file
+        output_dir: Path to analysis output directory
+        logger: Logger for logging messages. If None, the module-level logger is used.
+        **kwargs: Additional keyword arguments passed to `run_fragpipe`.
+
+    Returns:
+        The `RunResult` of the downstream run, or of the MSFragger-only run if it
+        failed.
+
+    Raises:
+        FileNotFoundError: If the results of a raw file are missing from the cache
+            after searching it again.
+    """
+    if logger is None:
+        logger = LOGGER
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _read_manifest(manifest_path)
+    keys = cache.compute_keys(fragpipe_root, workflow_path, manifest)
+
+    missing = list(range(len(keys)))
+    for attempt in range(2):
+        search_result = search_uncached_rawfiles(
+            cache, fragpipe_root, workflow_path, manifest_path, logger=logger, **kwargs
+        )
+        if search_result is not None and not search_result.success:
+            return search_result
+        missing = [
+            index for index in missing if not cache.restore(keys[index], output_dir)
+        ]
+        if not missing or attempt > 0:
+            break
+        logger.warning(
+            f"MSFragger results of {len(missing)} raw files are missing from the "
+            "cache, searching them again."
+        )
+    cache.evict()
+    if missing:
+        rawfile_paths = [manifest.iat[index, 0] for index in missing]
+        raise FileNotFoundError(f"No MSFragger results found for {rawfile_paths}")
+
+    downstream_workflow_path = output_dir / f".downstream-{uuid.uuid4().hex}.workflow"
+    try:
+        update_workflow_parameters(
+            workflow_path, downstream_workflow_path, {MSFRAGGER_RUN_PARAMETER: "false"}
+        )
+        downstream_kwargs = {k: v for k, v in kwargs.items() if k != "temp_dir"}
+        return run_fragpipe(
+            fragpipe_root,
+            downstream_workflow_path,
+            manifest_path,
+            output_dir,
+            logger=logger,
+            **downstream_kwargs,
+        )
+    finally:
+        downstream_workflow_path.unlink(missing_ok=True)
+
+
+def search_uncached_rawfiles(
+    cache: SearchResultCache,
+    fragpipe_root: pathlib.Path | str,
+    workflow_path: pathlib.Path | str,
+    manifest_path: pathlib.Path | str,
+    logger: logging.Logger | None = None,
+    **kwargs: Any,
+) -> RunResult | None:
+    """Search the raw files without cached results and add their results to the cache.
+
+    The raw files are searched in an MSFragger-only run in a job directory of the
+    cache, with all stages after MSFragger disabled. Cached results of the manifest
+    are marked as used and are not evicted to make room for the new results.
+
+    Args:
+        cache: The search result cache.
+        fragpipe_root: Path to FragPipe installation directory
+        workflow_path: Path to workflow file
+        manifest_path: Path to manifest file
+        logger: Logger for logging messages. If None, the module-level logger is used.
+        **kwargs: Additional keyword arguments passed to `run_fragpipe`.
+
+    Returns:
+        The `RunResult` of the MSFragger-only run, or None if the results of all raw
+        files were cached.
+    """
+    if logger is None:
+        logger = LOGGER
+    manifest = _read_manifest(manifest_path)
+    keys = cache.compute_keys(fragpipe_root, workflow_path, manifest)
+    missing = []
+    for index, key in enumerate(keys):
+        if cache.contains(key):
+            cache.touch(key)
+        else:
+            missing.append(index)
+    logger.info(
+        f"Found cached MSFragger results for {len(keys) - len(missing)} of "
+        f"{len(keys)} raw files."
+    )
+    if not missing:
+        return None
+
+    job_dir = cache.create_job_dir()
+    try:
+        search_workflow_path = job_dir / "search.workflow"
+        search_manifest_path = job_dir / pathlib.Path(manifest_path).name
+        search_output_dir = job_dir / "output"
+        update_workflow_parameters(
+            workflow_path,
+            search_workflow_path,
+            {
+                MSFRAGGER_RUN_PARAMETER: "true",
+                **{key: "false" for key in DOWNSTREAM_RUN_PARAMETERS},
+            },
+        )
+        manifest.iloc[missing].to_csv(
+            search_manifest_path, sep="\t", index=False, header=False
+        )
+        search_result = run_fragpipe(
+            fragpipe_root,
+            search_workflow_path,
+            search_manifest_path,
+            search_output_dir,
+            logger=logger,
+            **kwargs,
+        )
+        if not search_result.success:
+            logger.error("MSFragger search of uncached raw files failed.")
+            return search_result
+        for index in missing:
+            rawfile_path = pathlib.Path(manifest.iat[index, 0])
+            result_paths = find_results(search_output_dir, rawfile_path)
+            if not result_paths:
+                logger.warning(f"MSFragger wrote no results for '{rawfile_path}'.")
+            cache.store(keys[index], search_output_dir, result_paths)
+        cache.evict(protected=keys)
+        return search_result
+    finally:
+        remove_tree(job_dir)
+
+
+def find_results(
+    output_dir: pathlib.Path | str,
+    rawfile_path: pathlib.Path | str,
+) -> list[pathlib.Path]:
+    """Find the MSFragger result files of a raw file in a FragPipe output directory.
+
+    Args:
+        output_dir: Path to analysis output directory, including experiment
+            subdirectories.
+        rawfile_path: Path to the raw file.
+
+    Returns:
+        Paths of the '.pepXML' and '.pin' files named after the raw file, including
+        the '_rank' files written for DIA data.
+    """
+    stem = pathlib.Path(rawfile_path).stem
+    result_paths = []
+    for suffix in RESULT_SUFFIXES:
+        for path in pathlib.Path(output_dir).rglob(f"*{suffix}"):
+            name_stem = path.name[: -len(suffix)]
+            if name_stem == stem or name_stem.startswith(f"{stem}_rank"):
+                result_paths.append(path)
+    return sorted(result_paths)
+
+
+def get_search_parameters(workflow_path: pathlib.Path | str) -> dict[str, str]:
+    """Return the workflow parameters that affect the MSFragger results.
+
+    Args:
+        workflow_path: Path to the workflow file.
+
+    Returns:
+        The values of `SEARCH_PARAMETERS` and of parameters starting with one of
+        `SEARCH_PARAMETER_PREFIXES` set in the workflow.
+    """
+    return {
+        key: value
+        for key, value in read_workflow(workflow_path).items()
+        if key not in _IGNORED_PARAMETERS
+        and (key in SEARCH_PARAMETERS or key.startswith(SEARCH_PARAMETER_PREFIXES))
+    }
+
+
+def _read_manifest(manifest_path: pathlib.Path | str) -> pd.DataFrame:
+    return pd.read_csv(
+        manifest_path, sep="\t", header=None, dtype=str, keep_default_na=False
+    )
@@ -0,0 +1,475 @@
+"""Module for planning the number of MSFragger database slices.
+
+MSFragger keeps a fragment ion index of all candidate peptides in memory. If the index
+does not fit into the memory assigned to FragPipe, the search runs out of memory, while
+too many slices ('msfragger.misc.slice-db') make the search much slower. The planner
+estimates the size of the index with an in-silico digestion of the FASTA database using
+the digestion rules and variable modifications of the workflow, and chooses the lowest
+number of slices for which each slice fits into the available memory.
+
+The estimate counts peptides per protein without removing duplicates, and is therefore
+conservative for databases with many shared peptides.
+"""
+
+import dataclasses
+import logging
+import math
+import pathlib
+import re
+from collections.abc import Iterator
+
+import numpy as np
+
+from .resources import get_auto_ram_and_threads, get_memory_limit_bytes
+from .workflow import (
+    SLICE_DB_PARAMETER,
+    get_database_path,
+    read_workflow,
+    update_workflow_parameters,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+RESIDUE_MASSES = {
+    "G": 57.02146,
+    "A": 71.03711,
+    "S": 87.03203,
+    "P": 97.05276,
+    "V": 99.06841,
+    "T": 101.04768,
+    "C": 103.00919,
+    "L": 113.08406,
+    "I": 113.08406,
+    "N": 114.04293,
+    "D": 115.02694,
+    "Q": 128.05858,
+    "K": 128.09496,
+    "E": 129.04259,
+    "M": 131.04049,
+    "H": 137.05891,
+    "F": 147.06841,
+    "U": 150.95364,
+    "R": 156.10111,
+    "Y": 163.06333,
+    "W": 186.07931,
+    "O": 237.14773,
+}
+"""Monoisotopic residue masses of amino acids."""
+
+WATER_MASS = 18.01056
+"""Monoisotopic mass of water added to the residue masses of a peptide."""
+
+BYTES_PER_PEPTIDE = 48
+"""Approximate memory of a peptide entry in the MSFragger index."""
+
+BYTES_PER_FRAGMENT = 8
+"""Approximate memory of a fragment ion entry in the MSFragger index."""
+
+_CHUNK_RESIDUES = 4 * 1024 * 1024
+_VARIABLE_MOD_PATTERN = re.compile(r"^msfragger\.variable_mod_\d+$")
+_FIXED_MOD_PATTERN = re.compile(r"^msfragger\.add_([A-Z])_")
+
+
+@dataclasses.dataclass
+class DigestionRules:
+    """Digestion rules and modifications of an MSFragger search.
+
+    Attributes:
+        cut: Residues after or before which the enzyme cleaves.
+        nocut: Residues that prevent cleavage when adjacent to the cleavage site.
+        sense: "C" if the enzyme cleaves C-terminal of 'cut', "N" for N-terminal.
+        missed_cleavages: Maximum number of missed cleavages.
+        enzyme_termini: Number of enzymatic termini, 2 for enzymatic, 1 for
+            semi-enzymatic and 0 for nonspecific searches.
+        min_length: Minimum peptide length.
+        max_length: Maximum peptide length.
+        min_mass: Minimum peptide mass.
+        max_mass: Maximum peptide mass.
+        fixed_masses: Mass added to each residue by fixed modifications.
+        variable_mods: Sites of each enabled variable modification, as in MSFragger
+            parameters, e.g. "M" or "nQ".
+        max_variable_mods: Maximum number of variable modifications per peptide.
+        max_combinations: Maximum number of modified forms per peptide.
+    """
+
+    cut: str = "KR"
+    nocut: str = "P"
+    sense: str = "C"
+    missed_cleavages: int = 2
+    enzyme_termini: int = 2
+    min_length: int = 7
+    max_length: int = 50
+    min_mass: float = 500.0
+    max_mass: float = 5000.0
+    fixed_masses: dict[str, float] = dataclasses.field(default_factory=dict)
+    variable_mods: list[str] = dataclasses.field(default_factory=list)
+    max_variable_mods: int = 3
+    max_combinations: int = 5000
+
+    @classmethod
+    def from_workflow(cls, workflow_path: pathlib.Path | str) -> "DigestionRules":
+        """Read the digestion rules from a FragPipe workflow file.
+
+        Only the first enzyme of the workflow is considered. Parameters missing from
+        the workflow keep the defaults of MSFragger. Empty cut and nocut residues are
+        kept, e.g. for nonspecific searches, empty numeric parameters are ignored.
+        """
+        parameters = read_workflow(workflow_path)
+        rules = cls()
+
+        def get(key: str, default):
+            value = parameters.get(f"msfragger.{key}")
+            if value is None:
+                return default
+            if isinstance(default, str):
+                return value
+            return type(default)(value) if value.strip() else default
+
+        rules.cut = get("search_enzyme_cut_1", rules.cut)
+        rules.nocut = get("search_enzyme_nocut_1", rules.nocut)
+        rules.sense = get("search_enzyme_sense_1", rules.sense).upper()
+        rules.missed_cleavages = get(
+            "allowed_missed_cleavage_1", rules.missed_cleavages
+        )
+        rules.enzyme_termini = get("num_enzyme_termini", rules.enzyme_termini)
+        rules.min_length = get("digest_min_length", rules.min_length)
+        rules.max_length = get("digest_max_length", rules.max_length)
+        mass_range = parameters.get("msfragger.digest_mass_range", "").split()
+        if len(mass_range) == 2:
+            rules.min_mass, rules.max_mass = map(float, mass_range)
+        rules.max_variable_mods = get(
+            "max_variable_mods_per_peptide", rules.max_variable_mods
+        )
+        rules.max_combinations = get(
+            "max_variable_mods_combinations", rules.max_combinations
+        )
+
+        for key, value in parameters.items():
+            if match := _FIXED_MOD_PATTERN.match(key):
+                rules.fixed_masses[match.group(1)] = float(value or 0)
+        rules.variable_mods = _parse_variable_mods(parameters)
+        return rules
+
+
+@dataclasses.dataclass
+class SlicePlan:
+    """Estimated size of the MSFragger peptide index and the planned slices.
+
+    Attributes:
+        peptides: Number of unmodified candidate peptides.
+        peptide_forms: Number of candidate peptides including modified forms.
+        fragments: Number of fragment ions in the index.
+        index_bytes: Estimated memory of the index in bytes.
+        available_bytes: Memory available for the index in bytes.
+        slices: Number of database slices, so that each slice fits into the available
+            memory.
+    """
+
+    peptides: int
+    peptide_forms: int
+    fragments: int
+    index_bytes: int
+    available_bytes: int
+    slices: int
+
+
+def plan_slices(
+    workflow_path: pathlib.Path | str,
+    ram: int | str = 0,
+    database_path: pathlib.Path | str | None = None,
+    index_memory_fraction: float = 0.5,
+) -> SlicePlan:
+    """Estimate the MSFragger index size and the number of database slices.
+
+    Args:
+        workflow_path: Path to the workflow file.
+        ram: Memory in GB assigned to FragPipe, see `run_fragpipe`. If 0, the memory
+            limit of the host or cgroup is used.
+        database_path: Path to the FASTA database. If None, the database of the
+            workflow is used.
+        index_memory_fraction: Fraction of 'ram' available to the peptide index, the
+            remaining memory is used for spectra and by the JVM.
+
+    Returns:
+        The estimated index size and planned number of slices.
+
+    Raises:
+        ValueError: If no database is specified.
+    """
+    if database_path is None:
+        database_path = get_database_path(workflow_path)
+        if database_path is None:
+            raise ValueError(f"Workflow '{workflow_path}' does not specify a database.")
+    if ram == "auto":
+        ram = get_auto_ram_and_threads()[0]
+    ram_bytes = int(ram) * 1024**3 if int(ram) > 0 else get_memory_limit_bytes()
+
+    rules = DigestionRules.from_workflow(workflow_path)
+    digester = _Digester(rules)
+    for sequences in read_fasta_sequences(database_path):
+        digester.digest(sequences)
+
+    index_bytes = (
+        digester.peptide_forms * BYTES_PER_PEPTIDE
+        + digester.fragments * BYTES_PER_FRAGMENT
+    )
+    available_bytes = int(ram_bytes * index_memory_fraction)
+    plan = SlicePlan(
+        peptides=digester.peptides,
+        peptide_forms=digester.peptide_forms,
+        fragments=digester.fragments,
+        index_bytes=index_bytes,
+        available_bytes=available_bytes,
+        slices=max(math.ceil(index_bytes / available_bytes), 1),
+    )
+    LOGGER.info(
+        f"Estimated MSFragger index of {plan.peptide_forms} peptides and "
+        f"{index_bytes / 1024**3:.1f} GB, using {plan.slices} database slices."
+    )
+    return plan
+
+
+def set_slice_db(
+    workflow_path: pathlib.Path | str,
+    ram: int | str = 0,
+    workflow_output: pathlib.Path | str | None = None,
+    database_path: pathlib.Path | str | None = None,
+    index_memory_fraction: float = 0.5,
+) -> SlicePlan:
+    """Set 'msfragger.misc.slice-db' in a workflow to fit the peptide index into 'ram'.
+
+    Args:
+        workflow_path: Path to the workflow file.
+        ram: Memory in GB assigned to FragPipe, see `plan_slices`.
+        workflow_output: Path to save the updated workflow file. If None, the
+            workflow file is updated in place.
+        database_path: Path to the FASTA database. If None, the database of the
+            workflow is used.
+        index_memory_fraction: Fraction of 'ram' available to the peptide index.
+
+    Returns:
+        The slice plan that was applied.
+    """
+    plan = plan_slices(workflow_path, ram, database_path, index_memory_fraction)
+    update_workflow_parameters(
+        workflow_path,
+        workflow_output if workflow_output is not None else workflow_path,
+        {SLICE_DB_PARAMETER: str(plan.slices)},
+    )
+    return plan
+
+
+def read_fasta_sequences(
+    fasta_path: pathlib.Path | str,
+    chunk_residues: int = _CHUNK_RESIDUES,
+) -> Iterator[list[str]]:
+    """Stream the protein sequences of a FASTA file in chunks.
+
+    Args:
+        fasta_path: Path to the FASTA file.
+        chunk_residues: Approximate number of residues per chunk.
+
+    Yields:
+        Lists of uppercase protein sequences.
+    """
+    chunk: list[str] = []
+    chunk_size = 0
+    sequence_lines: list[str] = []
+    with open(fasta_path) as fasta_file:
+        for line in fasta_file:
+            if line.startswith(">"):
+                if sequence_lines:
+                    sequence = "".join(sequence_lines).upper()
+                    chunk.append(sequence)
+                    chunk_size += len(sequence)
+                    sequence_lines = []
+                if chunk_size >= chunk_residues:
+                    yield chunk
+                    chunk, chunk_size = [], 0
+            else:
+                sequence_lines.append(line.strip().replace("*", ""))
+    if sequence_lines:
+        chunk.append("".join(sequence_lines).upper())
+    if chunk:
+        yield chunk
+
+
+class _Digester:
+    """Vectorized in-silico digestion counting peptides, modified forms and
+    fragments.
+    """
+
+    def __init__(self, rules: DigestionRules):
+        self.rules = rules
+        self.peptides = 0
+        self.peptide_forms = 0
+        self.fragments = 0
+
+        self._mass_table = np.zeros(256, dtype=np.float64)
+        for residue, mass in RESIDUE_MASSES.items():
+            self._mass_table[ord(residue)] = mass + rules.fixed_masses.get(residue, 0)
+        self._cut_table = _residue_table(rules.cut)
+        self._nocut_table = _residue_table(rules.nocut)
+        self._mod_site_table = np.zeros(256, dtype=np.int64)
+        self._terminal_mod_sites = 0
+        for sites in rules.variable_mods:
+            for residue in set(sites) & set(RESIDUE_MASSES):
+                self._mod_site_table[ord(residue)] += 1
+            self._terminal_mod_sites += ("n" in sites) + ("c" in sites)
+        self._forms_table = _get_forms_table(
+            rules.max_length + self._terminal_mod_sites + 1,
+            rules.max_variable_mods,
+            rules.max_combinations,
+        )
+
+    def digest(self, sequences: list[str]) -> None:
+        """Count the peptides of a chunk of protein sequences."""
+        sequences = [sequence for sequence in sequences if sequence]
+        if not sequences:
+            return
+        residues = np.frombuffer(
+            "".join(sequences).encode("ascii", errors="replace"), dtype=np.uint8
+        )
+        lengths = np.array([len(sequence) for sequence in sequences])
+        protein_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        protein_ids = np.repeat(np.arange(len(sequences)), lengths)
+
+        self._cum_mass = np.concatenate(([0.0], np.cumsum(self._mass_table[residues])))
+        self._cum_mod_sites = np.concatenate(
+            ([0], np.cumsum(self._mod_site_table[residues]))
+        )
+
+        # Cleavage sites between residue i and i + 1 of the same protein
+        if self.rules.sense == "N":
+            cut_after = (
+                self._cut_table[residues[1:]] & ~self._nocut_table[residues[:-1]]
+            )
+        else:
+            cut_after = (
+                self._cut_table[residues[:-1]] & ~self._nocut_table[residues[1:]]
+            )
+        cut_after &= protein_ids[:-1] == protein_ids[1:]
+        cut_after = np.append(cut_after, False)
+
+        can_end = cut_after.copy()
+        can_end[protein_starts + lengths - 1] = True
+        can_start = np.zeros(residues.size, dtype=bool)
+        can_start[protein_starts] = True
+        can_start[1:] |= cut_after[:-1]
+
+        if self.rules.enzyme_termini >= 2:
+            self._digest_enzymatic(can_start, can_end, protein_ids)
+        else:
+            self._digest_by_length(can_start, can_end, cut_after, protein_ids)
+
+    def _digest_enzymatic(
+        self,
+        can_start: np.ndarray,
+        can_end: np.ndarray,
+        protein_ids: np.ndarray,
+    ) -> None:
+        """Count fully enzymatic peptides by combining consecutive cleavage sites."""
+        starts = np.flatnonzero(can_start)
+        ends = np.flatnonzero(can_end)
+        first_end = np.searchsorted(ends, starts)
+        for missed in range(self.rules.missed_cleavages + 1):
+            end_index = first_end + missed
+            valid = end_index < ends.size
+            peptide_starts = starts[valid]
+            peptide_ends = ends[end_index[valid]]
+            same_protein = protein_ids[peptide_starts] == protein_ids[peptide_ends]
+            self._count(peptide_starts[same_protein], peptide_ends[same_protein] + 1)
+
+    def _digest_by_length(
+        self,
+        can_start: np.ndarray,
+        can_end: np.ndarray,
+        cut_after: np.ndarray,
+        protein_ids: np.ndarray,
+    ) -> None:
+        """Count semi-enzymatic or nonspecific peptides for each peptide length."""
+        cum_cuts = np.concatenate(([0], np.cumsum(cut_after)))
+        size = protein_ids.size
+        for length in range(self.rules.min_length, self.rules.max_length + 1):
+            if length > size:
+                break
+            starts = np.arange(size - length + 1)
+            ends = starts + length
+            valid = protein_ids[starts] == protein_ids[ends - 1]
+            if self.rules.enzyme_termini == 1:
+                missed = cum_cuts[ends - 1] - cum_cuts[starts]
+                valid &= missed <= self.rules.missed_cleavages
+                valid &= can_start[starts] | can_end[ends - 1]
+            self._count(starts[valid], ends[valid])
+
+    def _count(self, starts: np.ndarray, ends: np.ndarray) -> None:
+        """Count the peptides between start and exclusive end positions."""
+        lengths = ends - starts
+        masses = self._cum_mass[ends] - self._cum_mass[starts] + WATER_MASS
+        valid = (
+            (lengths >= self.rules.min_length)
+            & (lengths <= self.rules.max_length)
+            & (masses >= self.rules.min_mass)
+            & (masses <= self.rules.max_mass)
+        )
+        lengths = lengths[valid]
+        mod_sites = (
+            self._cum_mod_sites[ends[valid]]
+            - self._cum_mod_sites[starts[valid]]
+            + self._terminal_mod_sites
+        )
+        forms = self._forms_table[np.minimum(mod_sites, self._forms_table.size - 1)]
+        self.peptides += int(lengths.size)
+        self.peptide_forms += int(forms.sum())
+        self.fragments += int((forms * 2 * (lengths - 1)).sum())
+
+
+def _residue_table(residues: str) -> np.ndarray:
+    table = np.zeros(256, dtype=bool)
+    for residue in residues.upper():
+        table[ord(residue)] = True
+    return table
+
+
+def _get_forms_table(
+    max_sites: int,
+    max_variable_mods: int,
+    max_combinations: int,
+) -> np.ndarray:
+    """Return the number of modified forms of a peptide by its number of mod sites."""
+    return np.array(
+        [
+            min(
+                sum(
+                    math.comb(sites, k)
+                    for k in range(min(sites, max_variable_mods) + 1)
+                ),
+                max_combinations,
+            )
+            for sites in range(max_sites + 1)
+        ],
+        dtype=np.int64,
+    )
+
+
+def _parse_variable_mods(parameters: dict[str, str]) -> list[str]:
+    """Return the sites of all enabled variable modifications of a workflow.
+
+    FragPipe stores variable modifications in 'msfragger.table.var-mods' as
+    "mass,sites,enabled,max occurrences" entries separated by semicolons, while
+    MSFragger parameters use "msfragger.variable_mod_01=mass sites max occurrences".
+    Protein terminal sites, marked with '[' and ']', are ignored.
+    """
+    variable_mods = []
+    table = parameters.get("msfragger.table.var-mods")
+    if table:
+        for entry in table.split(";"):
+            fields = [field.strip() for field in entry.split(",")]
+            if len(fields) >= 3 and fields[2].lower() == "true":
+                variable_mods.append(fields[1])
+    else:
+        for key, value in parameters.items():
+            fields = value.split()
+            if _VARIABLE_MOD_PATTERN.match(key) and len(fields) >= 2:
+                variable_mods.append(fields[1])
+    return [re.sub(r"[\[\]]\^?", "", sites) for sites in variable_mods]
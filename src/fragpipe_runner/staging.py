@@ -0,0 +1,394 @@
+"""Module for staging raw files to local scratch storage before FragPipe searches.
+
+Reading raw files over NFS during MSFragger is slow, and FragPipe writes '.mzBIN' files
+next to the raw files. Staging copies the raw files of a manifest to a local directory
+and points a copy of the manifest at them, so that FragPipe reads from and writes to
+local storage only. In a batch, the raw files of the next job are staged while the
+current job is searching.
+
+Jobs searching the same raw files can share a node-local `RawfileCache`, in which case
+each job gets a directory of hardlinks into the cache instead of its own copies.
+"""
+
+import concurrent.futures
+import hashlib
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+from collections.abc import Collection, Iterable
+from typing import Any
+
+from ._lru import EntryCache, remove_tree
+from .cache import get_rawfile_identity
+from .execute import run_fragpipe
+from .fingerprint import FingerprintIndex
+from .manifest import read_unique_rawfile_paths, update_rawfile_paths_in_manifest
+from .scheduler import SearchJob
+from .transfer import DEFAULT_TRANSFER_WORKERS, copy_file
+
+LOGGER = logging.getLogger(__name__)
+
+_PARTIAL_SUFFIX = ".staging"
+_REFERENCES_DIRNAME = ".references"
+
+
+class RawfileCache(EntryCache):
+    """Node-local LRU cache of raw files with per-job views of hardlinks.
+
+    Raw files are copied into the cache once per raw file identity and shared by all
+    jobs searching them. Each job gets its own directory of hardlinks into the cache,
+    so that FragPipe artefacts written next to the raw files stay separate per job.
+    Staging records a reference from each entry to the job directory, and entries
+    referenced by an existing job directory are never evicted. References are
+    removed by `release`, or once the job directory no longer exists.
+
+    Example:
+        cache = RawfileCache("/local/scratch/rawfiles", max_size_bytes=2 * 1024**4)
+        manifest_path = cache.stage("path/to/manifest.fp-manifest", "/local/job_a")
+        run_fragpipe(..., manifest_path=manifest_path, ...)
+        shutil.rmtree("/local/job_a")
+        cache.release("/local/job_a")
+    """
+
+    entry_description = "cached raw file"
+
+    def __init__(
+        self,
+        cache_dir: pathlib.Path | str,
+        max_size_bytes: int | None = None,
+        fingerprint_index: FingerprintIndex | None = None,
+        max_workers: int = DEFAULT_TRANSFER_WORKERS,
+    ):
+        """Initialize the cache.
+
+        Args:
+            cache_dir: Directory on local storage where raw files are cached. Created
+                if missing. Job directories should be on the same file system, so
+                that raw files can be hardlinked instead of symlinked.
+            max_size_bytes: Maximum total size of all cached raw files. If None, the
+                cache is not bounded.
+            fingerprint_index: Optional raw file fingerprint index used to identify
+                raw files by content. Otherwise, raw files are identified by their
+                name, size and mtime.
+            max_workers: Number of raw files copied into the cache at the same time.
+        """
+        super().__init__(cache_dir, max_size_bytes)
+        self.fingerprint_index = fingerprint_index
+        self.max_workers = max_workers
+
+    def stage(
+        self,
+        manifest_path: pathlib.Path | str,
+        job_dir: pathlib.Path | str,
+    ) -> pathlib.Path:
+        """Create a job directory with the raw files of a manifest.
+
+        Raw files missing from the cache are copied in parallel. The job directory
+        contains hardlinks to the cached raw files, or symlinks if the job directory
+        is on a different file system, and a copy of the manifest pointing at them.
+
+        Args:
+            manifest_path: Path to the FragPipe manifest file.
+            job_dir: Directory the raw files are linked into. Created if missing. It
+                should be removed and released with `release` after the job.
+
+        Returns:
+            Path to the manifest file in the job directory.
+
+        Raises:
+            ValueError: If two raw files of the manifest have the same file name.
+        """
+        manifest_path = pathlib.Path(manifest_path)
+        job_path = pathlib.Path(job_dir)
+        job_path.mkdir(parents=True, exist_ok=True)
+        rawfile_paths = read_unique_rawfile_paths(manifest_path)
+
+        keys = self._compute_keys(rawfile_paths)
+        with self.lock():
+            for key in keys:
+                self._add_reference(key, job_path)
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as executor:
+            cached_paths = list(executor.map(self._get, rawfile_paths, keys))
+        for rawfile_path, cached_path in zip(rawfile_paths, cached_paths):
+            _link_rawfile(cached_path, job_path / rawfile_path.name)
+
+        staged_manifest_path = job_path / manifest_path.name
+        shutil.copyfile(manifest_path, staged_manifest_path)
+        update_rawfile_paths_in_manifest(staged_manifest_path, job_path)
+        self.evict()
+        return staged_manifest_path
+
+    def release(self, job_dir: pathlib.Path | str) -> None:
+        """Remove the references of a job directory, so that its raw files can be
+        evicted.
+
+        Args:
+            job_dir: Job directory previously passed to `stage`.
+        """
+        reference_name = _get_reference_name(pathlib.Path(job_dir))
+        with self.lock():
+            for reference_path in self._references_dir.glob(f"*/{reference_name}"):
+                reference_path.unlink(missing_ok=True)
+                _remove_empty_dir(reference_path.parent)
+
+    def evict(self, protected: Collection[str] = ()) -> None:
+        """Remove the least recently used raw files that are not referenced by a job.
+
+        Args:
+            protected: Keys of entries that must not be evicted.
+        """
+        with self.lock():
+            super().evict(protected)
+
+    @property
+    def _references_dir(self) -> pathlib.Path:
+        return self.cache_dir / _REFERENCES_DIRNAME
+
+    def _add_reference(self, key: str, job_path: pathlib.Path) -> None:
+        """Record that a job directory uses an entry. Must be called with the lock."""
+        reference_dir = self._references_dir / key
+        reference_dir.mkdir(parents=True, exist_ok=True)
+        reference_path = reference_dir / _get_reference_name(job_path)
+        reference_path.write_text(str(job_path.resolve()))
+
+    def _get(self, rawfile_path: pathlib.Path, key: str) -> pathlib.Path:
+        """Return the path of a cached raw file, copying it into the cache if needed.
+
+        Concurrent copies of the same raw file are assembled in separate staging
+        directories, the first one moved into place is kept.
+        """
+        if self.contains(key):
+            LOGGER.debug(f"Raw file '{rawfile_path.name}' found in cache.")
+            self.touch(key)
+        else:
+            LOGGER.info(f"Copying raw file '{rawfile_path}' into cache.")
+            self.store_entry(
+                key,
+                lambda entry_dir: _stage_rawfile(
+                    rawfile_path, entry_dir / rawfile_path.name
+                ),
+                {"rawfile": rawfile_path.name},
+            )
+        return self.entry_dir(key) / rawfile_path.name
+
+    def _is_in_use(self, entry_dir: pathlib.Path) -> bool:
+        """Return True if an existing job directory references the entry.
+
+        References of job directories that no longer exist are removed.
+        """
+        reference_dir = self._references_dir / entry_dir.name
+        if not reference_dir.is_dir():
+            return False
+        in_use = False
+        for reference_path in reference_dir.iterdir():
+            try:
+                job_path = pathlib.Path(reference_path.read_text())
+            except OSError:
+                continue
+            if job_path.exists():
+                in_use = True
+            else:
+                reference_path.unlink(missing_ok=True)
+        if not in_use:
+            _remove_empty_dir(reference_dir)
+        return in_use
+
+    def _compute_keys(self, rawfile_paths: list[pathlib.Path]) -> list[str]:
+        if self.fingerprint_index is None:
+            identities = [get_rawfile_identity(path) for path in rawfile_paths]
+        else:
+            identities = [
+                [pathlib.Path(f.path).name, f.size, f.fast_hash]
+                for f in self.fingerprint_index.get_many(rawfile_paths)
+            ]
+        return [self.hash_fingerprint({"rawfile": identity}) for identity in identities]
+
+
+def stage_rawfiles(
+    manifest_path: pathlib.Path | str,
+    staging_dir: pathlib.Path | str,
+    max_workers: int = DEFAULT_TRANSFER_WORKERS,
+) -> pathlib.Path:
+    """Copy the raw files of a manifest to a staging directory in parallel.
+
+    A copy of the manifest pointing at the staged raw files is written to the staging
+    directory, the original manifest is not modified. Raw files that were already
+    staged completely are not copied again.
+
+    Args:
+        manifest_path: Path to the FragPipe manifest file.
+        staging_dir: Directory on local storage the raw files are copied to. Created
+            if missing.
+        max_workers: Number of raw files copied at the same time.
+
+    Returns:
+        Path to the manifest file in the staging directory.
+
+    Raises:
+        ValueError: If two raw files of the manifest have the same file name.
+    """
+    manifest_path = pathlib.Path(manifest_path)
+    staging_path = pathlib.Path(staging_dir)
+    staging_path.mkdir(parents=True, exist_ok=True)
+
+    rawfile_paths = read_unique_rawfile_paths(manifest_path)
+    LOGGER.info(f"Staging {len(rawfile_paths)} raw files to '{staging_path}'")
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = [
+            executor.submit(_stage_rawfile, path, staging_path / path.name)
+            for path in rawfile_paths
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+
+    staged_manifest_path = staging_path / manifest_path.name
+    shutil.copyfile(manifest_path, staged_manifest_path)
+    update_rawfile_paths_in_manifest(staged_manifest_path, staging_path)
+    return staged_manifest_path
+
+
+def run_fragpipe_batch(
+    fragpipe_root: pathlib.Path | str,
+    jobs: Iterable[SearchJob],
+    staging_dir: pathlib.Path | str,
+    max_workers: int = DEFAULT_TRANSFER_WORKERS,
+    rawfile_cache: RawfileCache | None = None,
+    logger: logging.Logger | None = None,
+    **kwargs: Any,
+) -> list[SearchJob]:
+    """Run FragPipe jobs one after another on raw files staged to local storage.
+
+    While a job is searching, the raw files of the next job are staged in the
+    background, so that at most two jobs are staged at the same time. The staged raw
+    files and FragPipe artefacts of a job are removed after the job has finished.
+
+    Args:
+        fragpipe_root: Path to FragPipe installation directory
+        jobs: The jobs to run, in order. The 'ram', 'threads', 'temp_dir' and
+            'isolate_rawfiles' of each job are passed to `run_fragpipe`.
+        staging_dir: Directory on local storage, e.g. NVMe scratch, in which a
+            temporary staging directory is created for each job.
+        max_workers: Number of raw files copied at the same time.
+        rawfile_cache: Optional raw file cache. If provided, raw files are copied into
+            the cache only once and hardlinked into the staging directory of each
+            job.
+        logger: Logger for logging messages. If None, the module-level logger is used.
+        **kwargs: Additional keyword arguments passed to `run_fragpipe`.
+
+    Returns:
+        The finished jobs with their results or errors.
+    """
+    if logger is None:
+        logger = LOGGER
+    jobs = list(jobs)
+    staging_root = pathlib.Path(staging_dir)
+    staging_root.mkdir(parents=True, exist_ok=True)
+
+    def release(job_staging_path: pathlib.Path) -> None:
+        remove_tree(job_staging_path)
+        if rawfile_cache is not None:
+            rawfile_cache.release(job_staging_path)
+
+    def stage(job: SearchJob) -> tuple[pathlib.Path, pathlib.Path]:
+        job_staging_path = pathlib.Path(
+            tempfile.mkdtemp(prefix="fragpipe_staging_", dir=staging_root)
+        )
+        try:
+            if rawfile_cache is not None:
+                manifest = rawfile_cache.stage(job.manifest_path, job_staging_path)
+            else:
+                manifest = stage_rawfiles(
+                    job.manifest_path, job_staging_path, max_workers
+                )
+        except BaseException:
+            release(job_staging_path)
+            raise
+        return job_staging_path, manifest
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as prefetcher:
+        next_staging = prefetcher.submit(stage, jobs[0]) if jobs else None
+        for index, job in enumerate(jobs):
+            assert next_staging is not None
+            staging = next_staging
+            if index + 1 < len(jobs):
+                next_staging = prefetcher.submit(stage, jobs[index + 1])
+            try:
+                job_staging_path, staged_manifest_path = staging.result()
+            except Exception as e:
+                logger.error(f"Staging raw files of '{job.manifest_path}' failed: {e}")
+                job.error = e
+                continue
+            try:
+                job.result = run_fragpipe(
+                    fragpipe_root,
+                    job.workflow_path,
+                    staged_manifest_path,
+                    job.output_dir,
+                    ram=job.ram or 0,
+                    threads=job.threads or -1,
+                    temp_dir=job.temp_dir,
+                    isolate_rawfiles=job.isolate_rawfiles,
+                    logger=logger,
+                    **kwargs,
+                )
+            except Exception as e:
+                logger.error(f"FragPipe job '{job.output_dir}' failed: {e}")
+                job.error = e
+            finally:
+                release(job_staging_path)
+    return jobs
+
+
+def _stage_rawfile(source: pathlib.Path, destination: pathlib.Path) -> None:
+    """Copy a raw file or '.d' directory, renaming it into place once complete."""
+    if destination.exists() and (
+        destination.is_dir() or _is_same_file_version(source, destination)
+    ):
+        LOGGER.debug(f"Raw file '{source.name}' is already staged.")
+        return
+    partial_path = destination.with_name(destination.name + _PARTIAL_SUFFIX)
+    if partial_path.is_dir():
+        shutil.rmtree(partial_path)
+    if source.is_dir():
+        shutil.copytree(source, partial_path, copy_function=copy_file)
+    else:
+        copy_file(source, partial_path)
+    os.replace(partial_path, destination)
+
+
+def _link_rawfile(cached_path: pathlib.Path, destination: pathlib.Path) -> None:
+    """Hardlink a cached raw file or '.d' directory, falling back to a symlink."""
+    if destination.exists() or destination.is_symlink():
+        return
+    try:
+        if cached_path.is_dir():
+            shutil.copytree(cached_path, destination, copy_function=os.link)
+        else:
+            os.link(cached_path, destination)
+    except OSError:
+        if destination.is_dir():
+            shutil.rmtree(destination)
+        os.symlink(cached_path.resolve(), destination)
+
+
+def _get_reference_name(job_path: pathlib.Path) -> str:
+    """Return the name of the reference files of a job directory."""
+    return hashlib.sha256(str(job_path.resolve()).encode()).hexdigest()[:32]
+
+
+def _remove_empty_dir(directory: pathlib.Path) -> None:
+    try:
+        directory.rmdir()
+    except OSError:
+        pass
+
+
+def _is_same_file_version(source: pathlib.Path, destination: pathlib.Path) -> bool:
+    source_stat = source.stat()
+    destination_stat = destination.stat()
+    return (
+        source_stat.st_size == destination_stat.st_size
+        and source_stat.st_mtime_ns == destination_stat.st_mtime_ns
+    )
@@ -0,0 +1,232 @@
+"""Module for creating per-stage timing reports from FragPipe log files."""
+
+import dataclasses
+import datetime
+import json
+import logging
+import pathlib
+import re
+from collections.abc import Sequence
+
+from .progress import (
+    FileProgress,
+    FragPipeProgressParser,
+    RunFinished,
+    StageFinished,
+    StageStarted,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+_DONE_IN_PATTERN = re.compile(
+    r"\b(?:done|finished|completed) in (?P<value>[\d.]+) ?(?P<unit>ms|s|sec|min)\b",
+    re.IGNORECASE,
+)
+_DURATION_PATTERN = re.compile(
+    r"(?<![\w.])(?P<value>\d+(?:\.\d+)?) ?(?P<unit>ms|s|min)\b"
+)
+_CLOCK_TIME_PATTERN = re.compile(r"\[(?P<h>\d{2}):(?P<m>\d{2}):(?P<s>\d{2})\]")
+_ELAPSED_TIME_PATTERN = re.compile(r"^\[(?P<m>\d+):(?P<s>\d{2})\]")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "sec": 1.0, "min": 60.0}
+
+
+@dataclasses.dataclass
+class StageTiming:
+    """Wall time of a single FragPipe task.
+
+    Attributes:
+        stage: Task name as reported by FragPipe.
+        tool: Tool the task belongs to, see `fragpipe_runner.progress.classify_stage`.
+        seconds: Wall time of the task in seconds, or None if it could not be
+            determined.
+        exit_code: Exit code of the task, or None if the task did not finish.
+        files: Wall time in seconds per spectral file, for tools reporting it.
+    """
+
+    stage: str
+    tool: str
+    seconds: float | None = None
+    exit_code: int | None = None
+    files: dict[str, float] = dataclasses.field(default_factory=dict)
+
+
+@dataclasses.dataclass
+class TimingReport:
+    """Per-stage timing breakdown of a FragPipe run.
+
+    Attributes:
+        log_path: Path of the FragPipe log file the report was created from.
+        stages: Timings of all tasks in the order they were executed.
+        total_seconds: Total wall time of the run in seconds, or None if unknown.
+    """
+
+    log_path: str
+    stages: list[StageTiming]
+    total_seconds: float | None
+
+    def tool_seconds(self) -> dict[str, float]:
+        """Return the summed wall time in seconds per tool."""
+        seconds: dict[str, float] = {}
+        for stage in self.stages:
+            if stage.seconds is not None:
+                seconds[stage.tool] = seconds.get(stage.tool, 0.0) + stage.seconds
+        return seconds
+
+    def to_dict(self) -> dict:
+        """Return the report as a JSON serializable dictionary."""
+        return {
+            "log_path": self.log_path,
+            "total_seconds": self.total_seconds,
+            "tools": self.tool_seconds(),
+            "stages": [dataclasses.asdict(stage) for stage in self.stages],
+        }
+
+
+def create_timing_report(
+    log_path: pathlib.Path | str,
+    observed_stages: Sequence[StageFinished] = (),
+    observed_total_seconds: float | None = None,
+) -> TimingReport:
+    """Parse a FragPipe log file into a per-stage timing report.
+
+    FragPipe does not timestamp its log lines, so stage wall times are taken from
+    durations reported by the tools themselves, e.g. "Done in 2.1 s", the timestamps
+    printed by Philosopher and DIA-NN, or the per-file times reported by MSFragger.
+    Stage durations that were measured while streaming FragPipe stdout take precedence
+    over values parsed from the log.
+
+    Args:
+        log_path: Path to the FragPipe log file.
+        observed_stages: Stage finished events observed while FragPipe was running, in
+            the order they occurred.
+        observed_total_seconds: Total wall time measured while FragPipe was running,
+            used if the log does not report the total run time.
+
+    Returns:
+        The timing report.
+    """
+    log_path = pathlib.Path(log_path)
+    observed = list(observed_stages)
+    parser = FragPipeProgressParser()
+    stages: list[StageTiming] = []
+    scanner: _StageScanner | None = None
+    total_seconds = None
+
+    with open(log_path, errors="replace") as log_file:
+        for line in log_file:
+            for event in parser.feed(line):
+                if isinstance(event, StageStarted):
+                    scanner = _StageScanner(StageTiming(event.stage, event.tool))
+                    stages.append(scanner.timing)
+                elif isinstance(event, FileProgress) and scanner is not None:
+                    scanner.current_file = event.file
+                elif isinstance(event, StageFinished):
+                    if scanner is None or scanner.timing.stage != event.stage:
+                        scanner = _StageScanner(StageTiming(event.stage, event.tool))
+                        stages.append(scanner.timing)
+                    scanner.finish(event.exit_code, _pop_observed(observed, event))
+                    scanner = None
+                elif isinstance(event, RunFinished):
+                    total_seconds = event.reported_minutes * 60
+            if scanner is not None:
+                scanner.scan(line)
+
+    if scanner is not None:
+        scanner.finish(None, None)
+    if total_seconds is None:
+        total_seconds = observed_total_seconds
+    return TimingReport(log_path.as_posix(), stages, total_seconds)
+
+
+def write_timing_report(
+    report: TimingReport,
+    report_path: pathlib.Path | str | None = None,
+) -> pathlib.Path:
+    """Write a timing report as JSON.
+
+    Args:
+        report: The timing report to write.
+        report_path: Path of the JSON file. If None, the report is written next to the
+            FragPipe log file, with the suffix '_timing.json'.
+
+    Returns:
+        Path of the written JSON file.
+    """
+    if report_path is None:
+        log_path = pathlib.Path(report.log_path)
+        report_path = log_path.with_name(f"{log_path.stem}_timing.json")
+    report_path = pathlib.Path(report_path)
+    LOGGER.debug(f"Writing FragPipe timing report to '{report_path}'")
+    with open(report_path, "w") as report_file:
+        json.dump(report.to_dict(), report_file, indent=2)
+    return report_path
+
+
+class _StageScanner:
+    """Collects durations reported within the log lines of a single task."""
+
+    def __init__(self, timing: StageTiming):
+        self.timing = timing
+        self.current_file: str | None = None
+        self._reported_seconds: float | None = None
+        self._last_clock_time: datetime.timedelta | None = None
+        self._clock_span = datetime.timedelta()
+        self._max_elapsed: float | None = None
+
+    def scan(self, line: str) -> None:
+        """Extract durations from a log line of the task."""
+        done_in_match = _DONE_IN_PATTERN.search(line)
+        if done_in_match:
+            # Nested tasks report their own durations, the last one covers the task
+            self._reported_seconds = (
+                float(done_in_match["value"])
+                * _UNIT_SECONDS[done_in_match["unit"].lower()]
+            )
+        if match := _CLOCK_TIME_PATTERN.search(line):
+            self._add_clock_time(match)
+        if match := _ELAPSED_TIME_PATTERN.match(line):
+            elapsed = int(match["m"]) * 60 + int(match["s"])
+            self._max_elapsed = max(self._max_elapsed or 0, elapsed)
+        if self.current_file is not None and done_in_match is None:
+            # Steps following '|', e.g. "12.3 s | deisotoping 1.0 s", are part of the
+            # total before it
+            match = _DURATION_PATTERN.search(line.split("|", 1)[0])
+            if match:
+                seconds = float(match["value"]) * _UNIT_SECONDS[match["unit"]]
+                files = self.timing.files
+                files[self.current_file] = files.get(self.current_file, 0.0) + seconds
+
+    def finish(self, exit_code: int | None, observed_seconds: float | None) -> None:
+        """Determine the wall time of the task once all lines have been scanned."""
+        self.timing.exit_code = exit_code
+        if observed_seconds is not None:
+            self.timing.seconds = observed_seconds
+        elif self._reported_seconds is not None:
+            self.timing.seconds = self._reported_seconds
+        elif self._last_clock_time is not None:
+            self.timing.seconds = self._clock_span.total_seconds()
+        elif self._max_elapsed is not None:
+            self.timing.seconds = float(self._max_elapsed)
+        elif self.timing.files:
+            self.timing.seconds = sum(self.timing.files.values())
+
+    def _add_clock_time(self, match: re.Match) -> None:
+        clock_time = datetime.timedelta(
+            hours=int(match["h"]), minutes=int(match["m"]), seconds=int(match["s"])
+        )
+        if self._last_clock_time is not None:
+            step = clock_time - self._last_clock_time
+            if step < datetime.timedelta():
+                # The clock time passed midnight
+                step += datetime.timedelta(days=1)
+            self._clock_span += step
+        self._last_clock_time = clock_time
+
+
+def _pop_observed(observed: list[StageFinished], event: StageFinished) -> float | None:
+    """Return the observed duration of the next task matching the finished event."""
+    for index, observed_event in enumerate(observed):
+        if observed_event.stage == event.stage:
+            del observed[: index + 1]
+            return observed_event.duration
+    return None
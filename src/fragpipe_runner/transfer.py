@@ -0,0 +1,365 @@
+"""Module for moving FragPipe output between directories and file systems."""
+
+import concurrent.futures
+import errno
+import hashlib
+import logging
+import os
+import pathlib
+import shutil
+import threading
+import time
+from collections.abc import Mapping
+
+from . import _inotify
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_TRANSFER_WORKERS = 8
+"""Default number of threads copying files between file systems."""
+
+_HASH_CHUNK_SIZE = 4 * 1024 * 1024
+# Maximum number of bytes copied by a single 'copy_file_range' call
+_COPY_CHUNK_SIZE = 1024 * 1024 * 1024
+_SYNC_EVENTS = _inotify.IN_CLOSE_WRITE | _inotify.IN_MOVED_TO
+
+
+class TransferVerificationError(OSError):
+    """Raised when a copied file does not match the checksum of its source."""
+
+
+def move_tree(
+    source_dir: pathlib.Path | str,
+    destination_dir: pathlib.Path | str,
+    max_workers: int = DEFAULT_TRANSFER_WORKERS,
+    verify_checksums: bool = False,
+    synced_files: Mapping[pathlib.Path, tuple[int, int]] | None = None,
+) -> None:
+    """Move the contents of a directory, replacing files and merging folders.
+
+    Files and whole subtrees are renamed when source and destination are on the same
+    file system. Otherwise, files are copied in parallel using 'copy_file_range'
+    where available, which allows server-side and copy-on-write copies, and the
+    source files are removed afterwards. The source directory is removed at the end.
+
+    Args:
+        source_dir: Path of the source directory.
+        destination_dir: Path of the destination directory.
+        max_workers: Number of threads copying files between file systems.
+        verify_checksums: If True, files copied between file systems are compared to
+            their source by checksum before the source is removed.
+        synced_files: Optional mapping of source file paths to the (size, mtime_ns)
+            they had when they were copied to the destination, as recorded by
+            `OutputSync`. Files that are unchanged since then are not copied again.
+
+    Raises:
+        TransferVerificationError: If a copied file does not match its source.
+    """
+    source_path = pathlib.Path(source_dir)
+    destination_path = pathlib.Path(destination_dir)
+    destination_path.mkdir(parents=True, exist_ok=True)
+
+    copy_tasks: list[tuple[pathlib.Path, pathlib.Path]] = []
+    _rename_or_plan_copies(
+        source_path, destination_path, copy_tasks, synced_files or {}
+    )
+    if copy_tasks:
+        LOGGER.debug(f"Copying {len(copy_tasks)} files to '{destination_path}'.")
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            futures = [
+                executor.submit(_copy_and_remove, source, dest, verify_checksums)
+                for source, dest in copy_tasks
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+    shutil.rmtree(source_path)
+
+
+def copy_file(
+    source: pathlib.Path | str,
+    destination: pathlib.Path | str,
+    verify_checksum: bool = False,
+) -> None:
+    """Copy a file including its metadata, using kernel copy offloading if available.
+
+    Args:
+        source: Path of the source file.
+        destination: Path of the destination file, replaced if it exists.
+        verify_checksum: If True, the copy is compared to the source by checksum.
+
+    Raises:
+        TransferVerificationError: If the copied file does not match its source.
+    """
+    source = pathlib.Path(source)
+    destination = pathlib.Path(destination)
+    try:
+        _copy_file_range(source, destination)
+    except OSError:
+        # Falls back to 'sendfile' on Linux
+        shutil.copyfile(source, destination)
+    shutil.copystat(source, destination)
+    if verify_checksum and _hash_file(source) != _hash_file(destination):
+        raise TransferVerificationError(
+            f"Checksum of '{destination}' does not match '{source}'."
+        )
+
+
+class OutputSync:
+    """Copies finished files from a directory to a destination in the background.
+
+    A file counts as finished once it was closed after writing and has not changed
+    for 'settle_seconds'. On Linux, files are detected with inotify, otherwise the
+    directory is scanned every 'poll_interval' seconds. Files that are modified again
+    after they were copied are copied again. When stopped, copies of files that were
+    deleted from the source in the meantime are removed from the destination.
+
+    The recorded `synced_files` can be passed to `move_tree`, which then only moves
+    the files that were not synced yet.
+
+    Example:
+        with OutputSync("path/to/temp_output", "path/to/output") as sync:
+            run_tool("path/to/temp_output")
+        move_tree(
+            "path/to/temp_output", "path/to/output", synced_files=sync.synced_files
+        )
+    """
+
+    def __init__(
+        self,
+        source_dir: pathlib.Path | str,
+        destination_dir: pathlib.Path | str,
+        settle_seconds: float = 5.0,
+        poll_interval: float = 10.0,
+        verify_checksums: bool = False,
+        use_inotify: bool | None = None,
+    ):
+        """Initialize the output sync.
+
+        Args:
+            source_dir: Path of the directory that is being written to.
+            destination_dir: Path of the destination directory.
+            settle_seconds: Number of seconds a file must remain unchanged after it
+                was closed before it is copied.
+            poll_interval: Number of seconds between scans of the source directory
+                if inotify is not used.
+            verify_checksums: If True, copied files are compared to their source by
+                checksum.
+            use_inotify: Whether to detect finished files with inotify. If None,
+                inotify is used if it is available.
+        """
+        self.source_dir = pathlib.Path(source_dir)
+        self.destination_dir = pathlib.Path(destination_dir)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.verify_checksums = verify_checksums
+        self.use_inotify = (
+            _inotify.is_available() if use_inotify is None else use_inotify
+        )
+        self.synced_files: dict[pathlib.Path, tuple[int, int]] = {}
+        self.synced_bytes = 0
+        self._pending: dict[pathlib.Path, float] = {}
+        self._scanned: dict[pathlib.Path, tuple[int, int]] = {}
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._watcher: _inotify.TreeWatcher | None = None
+
+    def start(self) -> None:
+        """Start watching the source directory in a background thread."""
+        if self.use_inotify:
+            try:
+                self._watcher = _inotify.TreeWatcher(self.source_dir, _SYNC_EVENTS)
+            except OSError as e:
+                LOGGER.warning(f"Falling back to polling, inotify failed: {e}")
+        self._thread = threading.Thread(
+            target=self._run, name="output-sync", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching and remove copies of files deleted from the source."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+        for source in list(self.synced_files):
+            if not source.exists():
+                destination = self._get_destination(source)
+                LOGGER.debug(f"Removing synced copy of deleted file '{source}'")
+                destination.unlink(missing_ok=True)
+                self.synced_bytes -= self.synced_files.pop(source)[0]
+        LOGGER.debug(
+            f"Synced {len(self.synced_files)} files ({self.synced_bytes} bytes) to "
+            f"'{self.destination_dir}' while running."
+        )
+
+    def __enter__(self) -> "OutputSync":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            if self._watcher is not None:
+                self._collect_events()
+            else:
+                self._stop_event.wait(self.poll_interval)
+                self._scan()
+            self._sync_settled()
+
+    def _collect_events(self) -> None:
+        assert self._watcher is not None
+        for path, mask in self._watcher.read_events(timeout=1.0):
+            if mask & _inotify.IN_Q_OVERFLOW:
+                self._scan()
+            else:
+                self._pending[path] = time.monotonic()
+
+    def _scan(self) -> None:
+        """Mark files as pending whose size and mtime changed since the last scan."""
+        scanned = {}
+        for root, _, filenames in os.walk(self.source_dir):
+            for filename in filenames:
+                path = pathlib.Path(root, filename)
+                key = _stat_key(path)
+                if key is None:
+                    continue
+                scanned[path] = key
+                if self._scanned.get(path) != key:
+                    self._pending[path] = time.monotonic()
+        self._scanned = scanned
+
+    def _sync_settled(self) -> None:
+        now = time.monotonic()
+        for path, event_time in list(self._pending.items()):
+            if now - event_time < self.settle_seconds:
+                continue
+            del self._pending[path]
+            try:
+                if not self._sync_file(path):
+                    self._pending[path] = now
+            except OSError as e:
+                # Intermediate files may be deleted or rewritten while being copied
+                LOGGER.debug(f"Could not sync '{path}': {e}")
+
+    def _sync_file(self, path: pathlib.Path) -> bool:
+        """Copy a file unless it is unchanged since the last copy.
+
+        Returns:
+            False if the file was modified too recently and should be retried later.
+        """
+        key = _stat_key(path)
+        if key is None or path.is_symlink() or self.synced_files.get(path) == key:
+            return True
+        if time.time() - key[1] / 1e9 < self.settle_seconds:
+            return False
+        destination = self._get_destination(path)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        copy_file(path, destination, self.verify_checksums)
+        if _stat_key(path) == key:
+            self.synced_files[path] = key
+            self.synced_bytes += key[0]
+        else:
+            self.synced_files.pop(path, None)
+        return True
+
+    def _get_destination(self, path: pathlib.Path) -> pathlib.Path:
+        return self.destination_dir / path.relative_to(self.source_dir)
+
+
+def _rename_or_plan_copies(
+    source_path: pathlib.Path,
+    destination_path: pathlib.Path,
+    copy_tasks: list[tuple[pathlib.Path, pathlib.Path]],
+    synced_files: Mapping[pathlib.Path, tuple[int, int]],
+) -> None:
+    """Rename items to the destination, collecting files that have to be copied."""
+    same_device = source_path.stat().st_dev == destination_path.stat().st_dev
+    for item_path in source_path.iterdir():
+        dest_item_path = destination_path / item_path.name
+        is_dir = item_path.is_dir() and not item_path.is_symlink()
+
+        if is_dir and dest_item_path.is_dir():
+            _rename_or_plan_copies(item_path, dest_item_path, copy_tasks, synced_files)
+            continue
+
+        if not is_dir and item_path in synced_files:
+            if _stat_key(item_path) == synced_files[item_path]:
+                item_path.unlink()
+                continue
+
+        if dest_item_path.exists() or dest_item_path.is_symlink():
+            if dest_item_path.is_dir() and not dest_item_path.is_symlink():
+                shutil.rmtree(dest_item_path)
+            else:
+                dest_item_path.unlink()
+
+        if same_device:
+            try:
+                os.rename(item_path, dest_item_path)
+                continue
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+
+        if is_dir:
+            dest_item_path.mkdir()
+            _rename_or_plan_copies(item_path, dest_item_path, copy_tasks, synced_files)
+        elif item_path.is_symlink():
+            os.symlink(os.readlink(item_path), dest_item_path)
+        else:
+            copy_tasks.append((item_path, dest_item_path))
+
+
+def _copy_and_remove(
+    source: pathlib.Path,
+    destination: pathlib.Path,
+    verify_checksum: bool,
+) -> None:
+    copy_file(source, destination, verify_checksum)
+    source.unlink()
+
+
+def _copy_file_range(source: pathlib.Path, destination: pathlib.Path) -> None:
+    """Copy a file with 'os.copy_file_range'.
+
+    Raises:
+        OSError: If 'copy_file_range' is not supported by the platform or between
+            the two file systems.
+    """
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+    with open(source, "rb") as source_file, open(destination, "wb") as dest_file:
+        source_fd = source_file.fileno()
+        dest_fd = dest_file.fileno()
+        remaining = os.fstat(source_fd).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(
+                source_fd, dest_fd, min(remaining, _COPY_CHUNK_SIZE)
+            )
+            if copied == 0:
+                break
+            remaining -= copied
+    if remaining > 0:
+        raise OSError(errno.EIO, f"copy_file_range stopped early for '{source}'")
+
+
+def _stat_key(path: pathlib.Path) -> tuple[int, int] | None:
+    """Return the size and mtime of a file, or None if it does not exist."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _hash_file(path: pathlib.Path) -> str:
+    digest = hashlib.blake2b()
+    with open(path, "rb") as file:
+        while chunk := file.read(_HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
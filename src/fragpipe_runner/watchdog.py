@@ -0,0 +1,191 @@
+"""Module for terminating hanging or stalled FragPipe runs.
+
+A `Watchdog` observes the stdout and progress events of a running FragPipe process and
+terminates its whole process tree, including Java and native tools like DIA-NN and
+Philosopher, when the run exceeds an overall timeout, a task exceeds its stage timeout,
+or FragPipe has not written to stdout for a given time.
+"""
+
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections.abc import Callable, Mapping
+
+from .progress import ProgressEvent, StageFinished, StageStarted
+
+LOGGER = logging.getLogger(__name__)
+
+TIMEOUT = "timeout"
+"""Termination reason if the run exceeded its overall timeout."""
+
+STAGE_TIMEOUT = "stage_timeout"
+"""Termination reason if a FragPipe task exceeded its stage timeout."""
+
+STALL = "stall"
+"""Termination reason if FragPipe did not write to stdout for too long."""
+
+CANCELLED = "cancelled"
+"""Termination reason if the run was cancelled, see `FragPipeJob.cancel`."""
+
+StageTimeout = float | Mapping[str, float]
+"""Stage timeout in seconds, either for all tasks or per tool name, e.g.
+{"MSFragger": 36000, "IonQuant": 7200}. Tools missing from a mapping have no limit.
+"""
+
+
+class Watchdog:
+    """Terminates the process group of a FragPipe run that hangs or stalls.
+
+    Stdout lines and progress events have to be passed to `notify_output` and
+    `notify_progress`. The limits are checked in a background thread.
+    """
+
+    def __init__(
+        self,
+        pid: int,
+        timeout: float | None = None,
+        stage_timeout: StageTimeout | None = None,
+        stall_timeout: float | None = None,
+        grace_seconds: float = 10.0,
+        check_interval: float = 1.0,
+        logger: logging.Logger | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Initialize the watchdog.
+
+        Args:
+            pid: Process ID of the FragPipe process. On POSIX systems, it has to be
+                the leader of its own process group, i.e. started with
+                'start_new_session=True'.
+            timeout: Maximum wall time of the run in seconds.
+            stage_timeout: Maximum wall time of a single FragPipe task in seconds,
+                see `StageTimeout`.
+            stall_timeout: Maximum time in seconds without any stdout output.
+            grace_seconds: Seconds between asking the processes to terminate and
+                killing them.
+            check_interval: Seconds between checks of the limits.
+            logger: Logger for logging messages. If None, the module-level logger is
+                used.
+            clock: Monotonic clock returning seconds.
+        """
+        self.pid = pid
+        self.timeout = timeout
+        self.stage_timeout = stage_timeout
+        self.stall_timeout = stall_timeout
+        self.grace_seconds = grace_seconds
+        self.check_interval = check_interval
+        self.logger = logger if logger is not None else LOGGER
+        self.reason: str | None = None
+        self._clock = clock
+        self._start_time = clock()
+        self._last_output_time = self._start_time
+        self._stage: StageStarted | None = None
+        self._stage_start_time = self._start_time
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._terminate_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start checking the limits in a background thread."""
+        self._thread = threading.Thread(
+            target=self._run, name="fragpipe-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop checking the limits."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def notify_output(self, line: str = "") -> None:
+        """Record that FragPipe wrote a line to stdout."""
+        self._last_output_time = self._clock()
+
+    def notify_progress(self, event: ProgressEvent) -> None:
+        """Record the start and end of FragPipe tasks."""
+        if isinstance(event, StageStarted):
+            self._stage = event
+            self._stage_start_time = self._clock()
+        elif isinstance(event, StageFinished):
+            self._stage = None
+
+    def check(self) -> str | None:
+        """Return the reason the run should be terminated, or None if it is within
+        all limits.
+        """
+        now = self._clock()
+        if self.timeout is not None and now - self._start_time > self.timeout:
+            return TIMEOUT
+        stage_limit = self._get_stage_limit()
+        if stage_limit is not None and now - self._stage_start_time > stage_limit:
+            return STAGE_TIMEOUT
+        if (
+            self.stall_timeout is not None
+            and now - self._last_output_time > self.stall_timeout
+        ):
+            return STALL
+        return None
+
+    def terminate(self, reason: str) -> None:
+        """Terminate the FragPipe process group and record the reason."""
+        with self._terminate_lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+        stage = f" in task '{self._stage.stage}'" if self._stage is not None else ""
+        self.logger.warning(f"Terminating FragPipe{stage}, reason: {reason}.")
+        terminate_process_group(self.pid, self.grace_seconds)
+
+    def _get_stage_limit(self) -> float | None:
+        if self._stage is None or self.stage_timeout is None:
+            return None
+        if isinstance(self.stage_timeout, Mapping):
+            return self.stage_timeout.get(self._stage.tool)
+        return self.stage_timeout
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.check_interval):
+            reason = self.check()
+            if reason is not None:
+                self.terminate(reason)
+                return
+
+
+def terminate_process_group(pid: int, grace_seconds: float = 10.0) -> None:
+    """Terminate a process and all processes in its process group.
+
+    On POSIX systems, SIGTERM is sent to the process group first, followed by SIGKILL
+    if processes are still alive after 'grace_seconds'. On Windows, the process tree
+    is killed with 'taskkill'.
+
+    Args:
+        pid: Process ID of the process group leader.
+        grace_seconds: Seconds to wait for the processes to exit before killing them.
+    """
+    if os.name != "posix":
+        subprocess.run(
+            ["taskkill", "/F", "/T", "/PID", str(pid)], capture_output=True, check=False
+        )
+        return
+    if not _signal_process_group(pid, signal.SIGTERM):
+        return
+    deadline = time.monotonic() + grace_seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        if not _signal_process_group(pid, 0):
+            return
+    _signal_process_group(pid, signal.SIGKILL)
+
+
+def _signal_process_group(pgid: int, signal_number: int) -> bool:
+    """Send a signal to a process group, returning False if it no longer exists."""
+    try:
+        os.killpg(pgid, signal_number)
+    except ProcessLookupError:
+        return False
+    return True
@@ -0,0 +1,322 @@
+"""Module for processing raw files while they are being acquired.
+
+Instruments write raw files to a share over hours. A `WatchFolder` watches the share
+for the raw files of an SDRF-defined batch, processes each raw file as soon as it is
+completely written, and runs the final combined FragPipe analysis once all raw files
+of the batch have arrived.
+
+With a `SearchResultCache`, each raw file is searched with MSFragger right after it
+arrives, so that the final run only has to search raw files whose search failed and
+run the FDR and quantification stages, see `fragpipe_runner.searchcache`.
+"""
+
+import concurrent.futures
+import logging
+import os
+import pathlib
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+import pandas as pd
+
+from . import _inotify
+from .cache import get_rawfile_identity
+from .execute import RunResult, run_fragpipe
+from .manifest import sdrf_to_manifest
+from .searchcache import (
+    SearchResultCache,
+    run_fragpipe_incremental,
+    search_uncached_rawfiles,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+# Candidates are re-checked until they settle, so writes need not be reported
+_WATCH_EVENTS = _inotify.IN_CLOSE_WRITE | _inotify.IN_MOVED_TO | _inotify.IN_CREATE
+
+
+class WatchFolder:
+    """Watches a folder for the raw files of a batch and processes them on arrival.
+
+    A raw file counts as completely written once its size and modification time, or
+    those of all files in a Bruker '.d' directory, have not changed for
+    'settle_seconds'. On Linux, raw files are detected with inotify, otherwise the
+    folder is scanned every 'poll_interval' seconds. Network shares often do not
+    report changes made by other hosts to inotify, in which case 'use_inotify' should
+    be False. Errors of processing a raw file on arrival are recorded in 'failures' by
+    raw file name.
+
+    Example:
+        watch_folder = WatchFolder(
+            "path/to/share",
+            "path/to/batch.sdrf.tsv",
+            "path/to/fragpipe",
+            "path/to/workflow.workflow",
+            "path/to/output",
+            search_cache=SearchResultCache("path/to/search_cache"),
+        )
+        result = watch_folder.run()
+    """
+
+    def __init__(
+        self,
+        watch_dir: pathlib.Path | str,
+        sdrf_path: pathlib.Path | str,
+        fragpipe_root: pathlib.Path | str,
+        workflow_path: pathlib.Path | str,
+        output_dir: pathlib.Path | str,
+        data_type: str = "DDA",
+        search_cache: SearchResultCache | None = None,
+        rawfile_callback: Callable[[pathlib.Path], None] | None = None,
+        settle_seconds: float = 60.0,
+        poll_interval: float = 30.0,
+        max_parallel_searches: int = 1,
+        use_inotify: bool | None = None,
+        logger: logging.Logger | None = None,
+        **kwargs: Any,
+    ):
+        """Initialize the watch folder.
+
+        Args:
+            watch_dir: Folder the instruments write raw files to, including
+                subfolders.
+            sdrf_path: Path to the SDRF file defining the raw files of the batch.
+            fragpipe_root: Path to FragPipe installation directory
+            workflow_path: Path to workflow file
+            output_dir: Path to analysis output directory. The manifest of the batch
+                is written to this directory.
+            data_type: Acquisition data type of the raw files, see `sdrf_to_manifest`.
+            search_cache: Optional search result cache. If provided, each raw file is
+                searched with MSFragger as soon as it arrives, and the final run
+                reuses these results.
+            rawfile_callback: Optional function called with the path of each raw file
+                once it is completely written, e.g. to stage or fingerprint it.
+            settle_seconds: Number of seconds a raw file must remain unchanged before
+                it counts as completely written.
+            poll_interval: Number of seconds between scans of the watch folder if
+                inotify is not used.
+            max_parallel_searches: Maximum number of raw files processed at the same
+                time.
+            use_inotify: Whether to detect raw files with inotify. If None, inotify
+                is used if it is available.
+            logger: Logger for logging messages. If None, the module-level logger is
+                used.
+            **kwargs: Additional keyword arguments passed to `run_fragpipe`.
+        """
+        self.watch_dir = pathlib.Path(watch_dir)
+        self.sdrf_path = pathlib.Path(sdrf_path)
+        self.fragpipe_root = fragpipe_root
+        self.workflow_path = workflow_path
+        self.output_dir = pathlib.Path(output_dir)
+        self.data_type = data_type
+        self.search_cache = search_cache
+        self.rawfile_callback = rawfile_callback
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.max_parallel_searches = max_parallel_searches
+        self.use_inotify = (
+            _inotify.is_available() if use_inotify is None else use_inotify
+        )
+        self.logger = logger if logger is not None else LOGGER
+        self.run_kwargs = kwargs
+
+        self.manifest_path = self.output_dir / "manifest.fp-manifest"
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        sdrf_to_manifest(self.sdrf_path, data_type, self.manifest_path)
+        self._manifest = pd.read_csv(
+            self.manifest_path, sep="\t", header=None, dtype=str, keep_default_na=False
+        )
+        self.expected_names = {
+            pathlib.Path(path).name for path in self._manifest.iloc[:, 0]
+        }
+        self.arrived: dict[str, pathlib.Path] = {}
+        self.failures: dict[str, str] = {}
+        self._candidates: dict[str, pathlib.Path] = {}
+        self._observed: dict[str, tuple[list, float]] = {}
+        self._stop_event = threading.Event()
+
+    @property
+    def complete(self) -> bool:
+        """True if all raw files of the batch have been completely written."""
+        return len(self.arrived) == len(self.expected_names)
+
+    def stop(self) -> None:
+        """Stop watching, e.g. from another thread, without running the final run."""
+        self._stop_event.set()
+
+    def run(self, timeout: float | None = None) -> RunResult | None:
+        """Watch the folder until the batch is complete and run the final analysis.
+
+        Args:
+            timeout: Maximum number of seconds to wait for the batch to be complete.
+
+        Returns:
+            The `RunResult` of the final run, or None if the timeout expired or the
+            watch folder was stopped before the batch was complete. Raw files whose
+            processing on arrival failed are listed in its `rawfile_errors`, see also
+            `failures`.
+        """
+        self.logger.info(
+            f"Watching '{self.watch_dir}' for {len(self.expected_names)} raw files "
+            f"of '{self.sdrf_path.name}'."
+        )
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        watcher = None
+        if self.use_inotify:
+            try:
+                watcher = _inotify.TreeWatcher(self.watch_dir, _WATCH_EVENTS)
+            except OSError as e:
+                self.logger.warning(f"Falling back to polling, inotify failed: {e}")
+
+        with concurrent.futures.ThreadPoolExecutor(
+            self.max_parallel_searches, thread_name_prefix="watch-folder"
+        ) as executor:
+            futures = []
+            try:
+                self._scan()
+                last_scan = time.monotonic()
+                while not self.complete and not self._stop_event.is_set():
+                    if deadline is not None and time.monotonic() > deadline:
+                        break
+                    if watcher is not None:
+                        self._collect_events(watcher)
+                    else:
+                        self._stop_event.wait(min(self.poll_interval, 1.0))
+                        if time.monotonic() - last_scan >= self.poll_interval:
+                            self._scan()
+                            last_scan = time.monotonic()
+                    for rawfile_path in self._check_candidates():
+                        futures.append(executor.submit(self._process, rawfile_path))
+            finally:
+                if watcher is not None:
+                    watcher.close()
+            if not self.complete:
+                self.logger.warning(
+                    f"Stopped watching '{self.watch_dir}', "
+                    f"{len(self.expected_names) - len(self.arrived)} raw files of the "
+                    "batch are missing."
+                )
+                executor.shutdown(cancel_futures=True)
+                return None
+            concurrent.futures.wait(futures)
+
+        self.logger.info("All raw files of the batch arrived, running final analysis.")
+        self._write_manifest()
+        if self.search_cache is not None:
+            result = run_fragpipe_incremental(
+                self.search_cache,
+                self.fragpipe_root,
+                self.workflow_path,
+                self.manifest_path,
+                self.output_dir,
+                logger=self.logger,
+                **self.run_kwargs,
+            )
+        else:
+            result = run_fragpipe(
+                self.fragpipe_root,
+                self.workflow_path,
+                self.manifest_path,
+                self.output_dir,
+                logger=self.logger,
+                **self.run_kwargs,
+            )
+        result.rawfile_errors = dict(self.failures)
+        return result
+
+    def _collect_events(self, watcher: _inotify.TreeWatcher) -> None:
+        for path, mask in watcher.read_events(timeout=1.0):
+            if mask & _inotify.IN_Q_OVERFLOW:
+                self._scan()
+                continue
+            rawfile_path = self._get_rawfile_path(path)
+            if rawfile_path is not None and rawfile_path.name not in self.arrived:
+                self._candidates[rawfile_path.name] = rawfile_path
+
+    def _scan(self) -> None:
+        """Add all expected raw files present in the watch folder as candidates."""
+        for root, dirnames, filenames in os.walk(self.watch_dir):
+            for name in (*dirnames, *filenames):
+                if name in self.expected_names and name not in self.arrived:
+                    self._candidates[name] = pathlib.Path(root, name)
+            # Do not descend into Bruker '.d' directories
+            dirnames[:] = [d for d in dirnames if d not in self.expected_names]
+
+    def _get_rawfile_path(self, path: pathlib.Path) -> pathlib.Path | None:
+        """Return the expected raw file a path belongs to, or None."""
+        for candidate in (path, *path.parents):
+            if candidate.name in self.expected_names:
+                return candidate
+            if candidate == self.watch_dir:
+                break
+        return None
+
+    def _check_candidates(self) -> list[pathlib.Path]:
+        """Return the candidates that have not changed for 'settle_seconds'."""
+        now = time.monotonic()
+        settled = []
+        for name, rawfile_path in list(self._candidates.items()):
+            try:
+                identity = get_rawfile_identity(rawfile_path)
+            except OSError:
+                del self._candidates[name]
+                self._observed.pop(name, None)
+                continue
+            observed = self._observed.get(name)
+            if observed is None or observed[0] != identity:
+                self._observed[name] = (identity, now)
+            elif now - observed[1] >= self.settle_seconds:
+                del self._candidates[name]
+                del self._observed[name]
+                self.arrived[name] = rawfile_path
+                self.logger.info(
+                    f"Raw file '{name}' is complete ({len(self.arrived)} of "
+                    f"{len(self.expected_names)})."
+                )
+                settled.append(rawfile_path)
+        return settled
+
+    def _process(self, rawfile_path: pathlib.Path) -> None:
+        """Run the per raw file processing, recording errors in 'failures' instead of
+        raising them.
+        """
+        try:
+            if self.rawfile_callback is not None:
+                self.rawfile_callback(rawfile_path)
+            if self.search_cache is not None:
+                manifest_path = self.output_dir / f".{rawfile_path.name}.fp-manifest"
+                rows = self._manifest[
+                    self._manifest.iloc[:, 0].map(lambda p: pathlib.Path(p).name)
+                    == rawfile_path.name
+                ].copy()
+                rows.iloc[:, 0] = rawfile_path.as_posix()
+                rows.to_csv(manifest_path, sep="\t", index=False, header=False)
+                try:
+                    search_result = search_uncached_rawfiles(
+                        self.search_cache,
+                        self.fragpipe_root,
+                        self.workflow_path,
+                        manifest_path,
+                        logger=self.logger,
+                        **self.run_kwargs,
+                    )
+                finally:
+                    manifest_path.unlink(missing_ok=True)
+                if search_result is not None and not search_result.success:
+                    self.failures[rawfile_path.name] = (
+                        f"MSFragger search failed with exit code "
+                        f"{search_result.exit_code}."
+                    )
+        except Exception as e:
+            self.logger.error(f"Processing raw file '{rawfile_path}' failed: {e}")
+            self.failures[rawfile_path.name] = str(e)
+
+    def _write_manifest(self) -> None:
+        """Write the manifest of the batch with the paths of the arrived raw files."""
+        self._manifest.iloc[:, 0] = [
+            self.arrived[pathlib.Path(path).name].as_posix()
+            for path in self._manifest.iloc[:, 0]
+        ]
+        self._manifest.to_csv(self.manifest_path, sep="\t", index=False, header=False)
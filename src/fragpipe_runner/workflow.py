@@ -3,6 +3,9 @@ import pathlib
 
 logger = logging.getLogger(__name__)
 
+SLICE_DB_PARAMETER = "msfragger.misc.slice-db"
+"""Workflow parameter setting the number of MSFragger database slices."""
+
 
 def prepare_workflow_from_template(
     workflow_template: pathlib.Path | str,
@@ -46,5 +49,77 @@ def prepare_workflow_from_template(
         workflow_file.write("".join(updated_workflow))
 
 
+def update_workflow_parameters(
+    workflow_path: pathlib.Path | str,
+    workflow_output: pathlib.Path | str,
+    parameters: dict[str, str],
+) -> None:
+    """Write a copy of a FragPipe workflow file with updated parameters.
+
+    Args:
+        workflow_path: Path to the workflow file.
+        workflow_output: Path to save the updated workflow file. May be the same as
+            'workflow_path'.
+        parameters: Parameter values to set. Parameters missing from the workflow are
+            appended.
+    """
+    remaining = dict(parameters)
+    updated_workflow = []
+    with open(workflow_path) as workflow_file:
+        for line in workflow_file:
+            key = line.partition("=")[0].strip()
+            if not line.lstrip().startswith("#") and key in remaining:
+                logger.debug(f"Setting workflow parameter {key}={remaining[key]}")
+                updated_workflow.append(f"{key}={remaining.pop(key)}\n")
+            else:
+                updated_workflow.append(line)
+
+    if updated_workflow and not updated_workflow[-1].endswith("\n"):
+        updated_workflow.append("\n")
+    for key, value in remaining.items():
+        logger.debug(f"Adding workflow parameter {key}={value}")
+        updated_workflow.append(f"{key}={value}\n")
+
+    with open(workflow_output, "w") as workflow_file:
+        workflow_file.write("".join(updated_workflow))
+
+
+def read_workflow(workflow_path: pathlib.Path | str) -> dict[str, str]:
+    """Read the parameters of a FragPipe workflow file.
+
+    Args:
+        workflow_path: Path to the workflow file.
+
+    Returns:
+        A dictionary mapping parameter names to their values. Comment lines starting
+        with "#" and blank lines are ignored.
+    """
+    parameters = {}
+    with open(workflow_path) as workflow_file:
+        for line in workflow_file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            key, _, value = line.partition("=")
+            parameters[key.strip()] = value.strip()
+    return parameters
+
+
+def get_database_path(workflow_path: pathlib.Path | str) -> pathlib.Path | None:
+    """Return the FASTA database path set in a FragPipe workflow file.
+
+    Args:
+        workflow_path: Path to the workflow file.
+
+    Returns:
+        The database path, or None if the workflow does not specify a database.
+    """
+    db_path = read_workflow(workflow_path).get("database.db-path")
+    if not db_path:
+        return None
+    # Workflows saved by FragPipe escape special characters like in Java properties
+    return pathlib.Path(db_path.replace("\\\\", "\\").replace("\\:", ":"))
+
+
 def _resolve_path(path: pathlib.Path | str) -> str:
     return pathlib.Path(path).resolve().as_posix()
@@ -0,0 +1,125 @@
+import os
+import pathlib
+import sys
+
+import pytest
+
+# Minimal stand-in for the FragPipe launcher. With MSFragger enabled, it writes a
+# '.pepXML' and '.pin' file per manifest row into the experiment directory FragPipe
+# would use and records the searched raw file names in 'searched.txt' next to 'bin'.
+# With MSFragger disabled, it requires these files and writes a combined result. The
+# exit code and a delay before exiting are set with environment variables.
+STUB_FRAGPIPE = """\
+#!{python}
+import os
+import pathlib
+import sys
+import time
+
+args = sys.argv[1:]
+workflow = pathlib.Path(args[args.index("--workflow") + 1]).read_text()
+manifest = pathlib.Path(args[args.index("--manifest") + 1])
+workdir = pathlib.Path(args[args.index("--workdir") + 1])
+search = "msfragger.run-msfragger=false" not in workflow
+searched_path = pathlib.Path(__file__).resolve().parent.parent / "searched.txt"
+
+workdir.mkdir(parents=True, exist_ok=True)
+for line in manifest.read_text().splitlines():
+    rawfile, experiment, bioreplicate, _ = line.split("\\t")
+    if experiment and bioreplicate:
+        group = f"{{experiment}}_{{bioreplicate}}"
+    elif bioreplicate:
+        group = f"exp_{{bioreplicate}}"
+    else:
+        group = experiment
+    stem = pathlib.PurePath(rawfile).stem
+    group_dir = workdir / group
+    group_dir.mkdir(parents=True, exist_ok=True)
+    if search:
+        (group_dir / f"{{stem}}.pepXML").write_text(f"pepXML of {{stem}}")
+        (group_dir / f"{{stem}}.pin").write_text(f"pin of {{stem}}")
+        with open(searched_path, "a") as searched_file:
+            searched_file.write(stem + "\\n")
+    elif not (group_dir / f"{{stem}}.pepXML").exists():
+        print(f"Missing results of {{stem}}")
+        sys.exit(5)
+if not search:
+    (workdir / "combined.tsv").write_text("combined")
+time.sleep(float(os.environ.get("STUB_FRAGPIPE_SLEEP", "0")))
+print("===ALL JOBS DONE IN 0.1 MINUTES===")
+sys.exit(int(os.environ.get("STUB_FRAGPIPE_EXIT_CODE", "0")))
+"""
+
+
+@pytest.fixture
+def fragpipe_root(tmp_path: pathlib.Path) -> pathlib.Path:
+    """A FragPipe installation with a stub launcher, see `STUB_FRAGPIPE`."""
+    if os.name == "nt":
+        pytest.skip("The stub FragPipe launcher requires a POSIX shell.")
+    root = tmp_path / "fragpipe"
+    (root / "bin").mkdir(parents=True)
+    (root / "lib").mkdir()
+    (root / "lib" / "fragpipe-23.1.jar").write_bytes(b"jar")
+    launcher = root / "bin" / "fragpipe"
+    launcher.write_text(STUB_FRAGPIPE.format(python=sys.executable))
+    launcher.chmod(0o755)
+    return root
+
+
+@pytest.fixture
+def database_path(tmp_path: pathlib.Path) -> pathlib.Path:
+    path = tmp_path / "inputs" / "database.fasta"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(">sp|P1|PROT1\nMKRAPEPTIDEKSAMPLER\n")
+    return path
+
+
+@pytest.fixture
+def workflow_path(tmp_path: pathlib.Path, database_path: pathlib.Path) -> pathlib.Path:
+    path = tmp_path / "inputs" / "search.workflow"
+    path.write_text(
+        "msfragger.run-msfragger=true\n"
+        "msfragger.search_enzyme_cut_1=KR\n"
+        f"database.db-path={database_path.as_posix()}\n"
+    )
+    return path
+
+
+@pytest.fixture
+def write_manifest(tmp_path: pathlib.Path):
+    """Return a function writing a manifest and the raw files it lists.
+
+    The function takes the manifest name and (raw file name, experiment, bioreplicate)
+    tuples, and returns the path of the manifest.
+    """
+    rawfile_dir = tmp_path / "rawfiles"
+    rawfile_dir.mkdir(exist_ok=True)
+
+    def write(name: str, rows: list[tuple[str, str, str]]) -> pathlib.Path:
+        lines = []
+        for rawfile_name, experiment, bioreplicate in rows:
+            rawfile_path = rawfile_dir / rawfile_name
+            if not rawfile_path.exists():
+                rawfile_path.write_bytes(rawfile_name.encode() * 100)
+            lines.append(
+                f"{rawfile_path.as_posix()}\t{experiment}\t{bioreplicate}\tDDA"
+            )
+        manifest_path = tmp_path / "inputs" / name
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        manifest_path.write_text("\n".join(lines) + "\n")
+        return manifest_path
+
+    return write
+
+
+@pytest.fixture
+def searched_rawfiles(fragpipe_root: pathlib.Path):
+    """Return a function listing the raw files the stub FragPipe searched, in order."""
+
+    def read() -> list[str]:
+        searched_path = fragpipe_root / "searched.txt"
+        if not searched_path.exists():
+            return []
+        return searched_path.read_text().split()
+
+    return read
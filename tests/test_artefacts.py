@@ -0,0 +1,63 @@
+import os
+import pathlib
+
+from fragpipe_runner.artefacts import ArtefactCache
+
+
+def _write_artefacts(rawfile_dir: pathlib.Path, stem: str) -> pathlib.Path:
+    rawfile_path = rawfile_dir / f"{stem}.raw"
+    rawfile_path.write_bytes(b"raw")
+    (rawfile_dir / f"{stem}.mzBIN").write_text(f"mzBIN of {stem}")
+    (rawfile_dir / f"{stem}_uncalibrated.mzML").write_text(f"mzML of {stem}")
+    return rawfile_path
+
+
+def test_collect_stores_one_read_only_entry_per_rawfile(tmp_path, fragpipe_root):
+    cache = ArtefactCache(tmp_path / "cache", fragpipe_root)
+    workflow_path = tmp_path / "search.workflow"
+    workflow_path.write_text("msfragger.calibrate_mass=2\nmsfragger.num_threads=4\n")
+    _write_artefacts(tmp_path, "a")
+    (tmp_path / "orphan.mzBIN").write_text("no raw file")
+
+    collected = cache.collect(tmp_path, workflow_path)
+
+    assert collected == 2
+    assert not list(tmp_path.glob("*.mzBIN"))
+    (entry_dir,) = [p for p in cache.cache_dir.iterdir() if not p.name.startswith(".")]
+    metadata = cache.read_metadata(entry_dir.name)
+    assert metadata["rawfile"] == "a.raw"
+    assert metadata["parameters"] == {"msfragger.calibrate_mass": "2"}
+    assert "created" in metadata
+    assert not os.stat(entry_dir / "a.mzBIN").st_mode & 0o222
+
+
+def test_restore_moves_artefacts_back_and_removes_the_entry(
+    tmp_path, fragpipe_root, workflow_path
+):
+    cache = ArtefactCache(tmp_path / "cache", fragpipe_root)
+    rawfile_path = _write_artefacts(tmp_path, "a")
+    cache.collect(tmp_path, workflow_path)
+
+    restored = cache.restore([rawfile_path], workflow_path)
+
+    assert restored == 2
+    assert (tmp_path / "a.mzBIN").read_text() == "mzBIN of a"
+    assert os.stat(tmp_path / "a.mzBIN").st_mode & 0o200
+    assert cache.restore([rawfile_path], workflow_path) == 0
+
+
+def test_restore_ignores_artefacts_of_other_parameters_and_installations(
+    tmp_path, fragpipe_root, workflow_path
+):
+    cache = ArtefactCache(tmp_path / "cache", fragpipe_root)
+    rawfile_path = _write_artefacts(tmp_path, "a")
+    cache.collect(tmp_path, workflow_path)
+    other_workflow_path = tmp_path / "other.workflow"
+    other_workflow_path.write_text("msfragger.calibrate_mass=0\n")
+    (fragpipe_root / "lib" / "fragpipe-23.1.jar").write_bytes(b"other version")
+
+    other_cache = ArtefactCache(tmp_path / "cache", fragpipe_root)
+
+    assert cache.restore([rawfile_path], other_workflow_path) == 0
+    assert other_cache.restore([rawfile_path], workflow_path) == 0
+    assert cache.restore([rawfile_path], workflow_path) == 2
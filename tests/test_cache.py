@@ -0,0 +1,90 @@
+import os
+import pathlib
+
+from fragpipe_runner.cache import ResultCache, run_fragpipe_cached
+
+
+def _write_output(output_dir: pathlib.Path, content: str) -> pathlib.Path:
+    output_dir.mkdir(parents=True)
+    (output_dir / "result.tsv").write_text(content)
+    return output_dir
+
+
+def test_run_fragpipe_cached_restores_identical_run(
+    tmp_path, fragpipe_root, workflow_path, write_manifest, searched_rawfiles
+):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    cache = ResultCache(tmp_path / "cache")
+
+    first = run_fragpipe_cached(
+        cache, fragpipe_root, workflow_path, manifest_path, tmp_path / "out1"
+    )
+    second = run_fragpipe_cached(
+        cache, fragpipe_root, workflow_path, manifest_path, tmp_path / "out2"
+    )
+
+    assert first.success and not first.cached
+    assert second.success and second.cached
+    assert searched_rawfiles() == ["a"]
+    restored = tmp_path / "out2" / "E_1" / "a.pepXML"
+    assert restored.read_text() == "pepXML of a"
+
+
+def test_compute_key_changes_with_manifest(
+    tmp_path, fragpipe_root, workflow_path, write_manifest
+):
+    cache = ResultCache(tmp_path / "cache")
+    manifest_a = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    manifest_b = write_manifest("b.fp-manifest", [("a.raw", "E", "2")])
+
+    key_a = cache.compute_key(fragpipe_root, workflow_path, manifest_a)
+    key_b = cache.compute_key(fragpipe_root, workflow_path, manifest_b)
+
+    assert key_a != key_b
+    assert key_a == cache.compute_key(fragpipe_root, workflow_path, manifest_a)
+
+
+def test_restored_output_is_independent_of_cache(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+    cache.store("a" * 64, _write_output(tmp_path / "run", "original"))
+
+    assert cache.restore("a" * 64, tmp_path / "restored")
+    restored_path = tmp_path / "restored" / "result.tsv"
+    restored_path.write_text("modified")
+    (tmp_path / "run" / "result.tsv").write_text("modified")
+
+    assert os.stat(restored_path).st_nlink == 1
+    assert cache.restore("a" * 64, tmp_path / "restored_again")
+    assert (tmp_path / "restored_again" / "result.tsv").read_text() == "original"
+
+
+def test_restore_of_missing_entry_returns_false(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+
+    assert not cache.restore("a" * 64, tmp_path / "restored")
+    assert not (tmp_path / "restored").exists()
+
+
+def test_evict_removes_least_recently_used_entries(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_size_bytes=250)
+    cache.store("a" * 64, _write_output(tmp_path / "a", "a" * 100))
+    cache.store("b" * 64, _write_output(tmp_path / "b", "b" * 100))
+    cache.restore("a" * 64, tmp_path / "restored")
+
+    cache.store("c" * 64, _write_output(tmp_path / "c", "c" * 100))
+
+    assert cache.contains("a" * 64)
+    assert not cache.contains("b" * 64)
+    assert cache.contains("c" * 64)
+
+
+def test_evict_skips_protected_entries(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+    cache.store("a" * 64, _write_output(tmp_path / "a", "a" * 100))
+    cache.store("b" * 64, _write_output(tmp_path / "b", "b" * 100))
+
+    cache.max_size_bytes = 0
+    cache.evict(protected={"a" * 64})
+
+    assert cache.contains("a" * 64)
+    assert not cache.contains("b" * 64)
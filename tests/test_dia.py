@@ -0,0 +1,105 @@
+import pathlib
+
+import pandas as pd
+import pytest
+
+from fragpipe_runner.dia import merge_dia_reports
+
+
+def _write_shard(
+    shard_dir: pathlib.Path,
+    report: str | None = None,
+    pg_matrix: pd.DataFrame | None = None,
+) -> pathlib.Path:
+    diann_dir = shard_dir / "diann-output"
+    diann_dir.mkdir(parents=True)
+    if report is not None:
+        (diann_dir / "report.tsv").write_text(report)
+    if pg_matrix is not None:
+        pg_matrix.to_csv(diann_dir / "report.pg_matrix.tsv", sep="\t", index=False)
+    return shard_dir
+
+
+def test_merge_dia_reports_concatenates_reports(tmp_path):
+    shards = [
+        _write_shard(tmp_path / "s1", "Run\tValue\nr1\t1\n"),
+        _write_shard(tmp_path / "s2", "Run\tValue\nr2\t2\nr3\t3\n"),
+    ]
+
+    merged_paths = merge_dia_reports(shards, tmp_path / "merged")
+
+    assert merged_paths == [tmp_path / "merged" / "report.tsv"]
+    assert merged_paths[0].read_text() == "Run\tValue\nr1\t1\nr2\t2\nr3\t3\n"
+
+
+def test_merge_dia_reports_rejects_different_headers(tmp_path):
+    shards = [
+        _write_shard(tmp_path / "s1", "Run\tValue\nr1\t1\n"),
+        _write_shard(tmp_path / "s2", "Run\tOther\nr2\t2\n"),
+    ]
+
+    with pytest.raises(ValueError, match="differs"):
+        merge_dia_reports(shards, tmp_path / "merged")
+
+
+def test_merge_dia_reports_joins_matrices_on_row_ids(tmp_path):
+    shards = [
+        _write_shard(
+            tmp_path / "s1",
+            "Run\nr1\n",
+            pd.DataFrame(
+                {"Protein.Group": ["P1", "P2"], "Genes": ["G1", "G2"], "r1": [1.0, 2.0]}
+            ),
+        ),
+        _write_shard(
+            tmp_path / "s2",
+            "Run\nr2\n",
+            pd.DataFrame(
+                {
+                    "Protein.Group": ["P2", "P3"],
+                    "Genes": ["G2;G2B", "G3"],
+                    "r2": [3.0, 4.0],
+                }
+            ),
+        ),
+    ]
+
+    merge_dia_reports(shards, tmp_path / "merged")
+
+    merged = pd.read_csv(tmp_path / "merged" / "report.pg_matrix.tsv", sep="\t")
+    assert merged["Protein.Group"].tolist() == ["P1", "P2", "P3"]
+    assert merged["Genes"].tolist() == ["G1", "G2", "G3"]
+    assert merged["r1"].tolist()[:2] == [1.0, 2.0]
+    assert merged["r2"].tolist()[1:] == [3.0, 4.0]
+
+
+def test_merge_dia_reports_raises_on_missing_shard_output(tmp_path):
+    matrix = pd.DataFrame({"Protein.Group": ["P1"], "r1": [1.0]})
+    shards = [
+        _write_shard(tmp_path / "s1", "Run\nr1\n", matrix),
+        _write_shard(tmp_path / "s2", "Run\nr2\n"),
+    ]
+
+    with pytest.raises(FileNotFoundError, match="report.pg_matrix.tsv"):
+        merge_dia_reports(shards, tmp_path / "merged")
+
+
+def test_merge_dia_reports_raises_without_reports(tmp_path):
+    shards = [_write_shard(tmp_path / "s1"), _write_shard(tmp_path / "s2")]
+
+    with pytest.raises(FileNotFoundError, match="report"):
+        merge_dia_reports(shards, tmp_path / "merged")
+
+
+def test_merge_dia_reports_concatenates_parquet_reports(tmp_path):
+    pytest.importorskip("pyarrow")
+    shards = [_write_shard(tmp_path / "s1"), _write_shard(tmp_path / "s2")]
+    for index, shard in enumerate(shards):
+        report = pd.DataFrame({"Run": [f"r{index}"], "Value": [float(index)]})
+        report.to_parquet(shard / "diann-output" / "report.parquet")
+
+    merged_paths = merge_dia_reports(shards, tmp_path / "merged")
+
+    assert merged_paths == [tmp_path / "merged" / "report.parquet"]
+    merged = pd.read_parquet(merged_paths[0])
+    assert merged["Run"].tolist() == ["r0", "r1"]
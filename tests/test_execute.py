@@ -0,0 +1,76 @@
+import asyncio
+import subprocess
+
+import pytest
+
+from fragpipe_runner.execute import run_fragpipe_async, start_fragpipe
+
+
+def test_run_fragpipe_async_moves_synced_output_from_temp_dir(
+    tmp_path, fragpipe_root, workflow_path, write_manifest
+):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+
+    result = asyncio.run(
+        run_fragpipe_async(
+            fragpipe_root,
+            workflow_path,
+            manifest_path,
+            tmp_path / "out",
+            temp_dir=tmp_path / "temp",
+            sync_output=True,
+            verify_transfer=True,
+        )
+    )
+
+    assert result.success
+    assert (tmp_path / "out" / "E_1" / "a.pepXML").read_text() == "pepXML of a"
+    assert not (tmp_path / "temp").exists()
+
+
+def test_run_fragpipe_async_terminates_on_timeout(
+    tmp_path, fragpipe_root, workflow_path, write_manifest, monkeypatch
+):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    monkeypatch.setenv("STUB_FRAGPIPE_SLEEP", "60")
+
+    result = asyncio.run(
+        run_fragpipe_async(
+            fragpipe_root, workflow_path, manifest_path, tmp_path / "out", timeout=0.5
+        )
+    )
+
+    assert not result.success
+    assert result.termination_reason == "timeout"
+    assert result.wall_seconds < 30
+
+
+def test_cancel_terminates_a_started_job(
+    tmp_path, fragpipe_root, workflow_path, write_manifest, monkeypatch
+):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    monkeypatch.setenv("STUB_FRAGPIPE_SLEEP", "60")
+    job = start_fragpipe(fragpipe_root, workflow_path, manifest_path, tmp_path / "out")
+
+    assert job.poll() is None
+    with pytest.raises(subprocess.TimeoutExpired):
+        job.wait(timeout=0.1)
+    job.cancel()
+    result = job.wait(timeout=30)
+
+    assert not result.success
+    assert result.termination_reason == "cancelled"
+    assert job.poll() == result.exit_code
+
+
+def test_cancel_does_nothing_once_the_job_finished(
+    tmp_path, fragpipe_root, workflow_path, write_manifest
+):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    job = start_fragpipe(fragpipe_root, workflow_path, manifest_path, tmp_path / "out")
+    job.wait(timeout=30)
+
+    job.cancel()
+
+    assert job.wait().success
+    assert job.wait().termination_reason is None
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from fragpipe_runner import fingerprint
+from fragpipe_runner.fingerprint import FingerprintIndex, compute_fingerprint
+
+
+@pytest.fixture
+def computed(monkeypatch):
+    """Record the paths fingerprints are computed for."""
+    paths = []
+    original_compute_fingerprint = fingerprint.compute_fingerprint
+
+    def compute(path, full_hash=False):
+        paths.append(path.name)
+        return original_compute_fingerprint(path, full_hash)
+
+    monkeypatch.setattr(fingerprint, "compute_fingerprint", compute)
+    return paths
+
+
+def test_index_reuses_fingerprints_until_the_file_changes(tmp_path, computed):
+    rawfile_path = tmp_path / "a.raw"
+    rawfile_path.write_bytes(b"spectra")
+    database_path = tmp_path / "index" / "fingerprints.sqlite"
+
+    with FingerprintIndex(database_path) as index:
+        first = index.get(rawfile_path)
+    with FingerprintIndex(database_path) as index:
+        assert index.get(rawfile_path) == first
+        stat = rawfile_path.stat()
+        os.utime(rawfile_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        changed = index.get(rawfile_path)
+
+    assert computed == ["a.raw", "a.raw"]
+    assert changed.fast_hash == first.fast_hash
+    assert changed.mtime_ns != first.mtime_ns
+
+
+def test_full_hash_is_computed_on_demand(tmp_path, computed):
+    rawfile_path = tmp_path / "a.raw"
+    rawfile_path.write_bytes(b"spectra")
+
+    with FingerprintIndex(tmp_path / "fingerprints.sqlite") as index:
+        assert index.get(rawfile_path).full_hash is None
+        full_hash = index.get(rawfile_path, full_hash=True).full_hash
+        assert index.get(rawfile_path).full_hash == full_hash
+
+    assert full_hash is not None
+    assert len(computed) == 2
+
+
+def test_fast_hash_samples_large_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(fingerprint, "SAMPLE_BLOCK_SIZE", 4)
+    monkeypatch.setattr(fingerprint, "SAMPLE_BLOCK_COUNT", 2)
+    rawfile_path = tmp_path / "a.raw"
+    rawfile_path.write_bytes(b"head" + b"x" * 8 + b"tail")
+    original = compute_fingerprint(rawfile_path, full_hash=True)
+
+    rawfile_path.write_bytes(b"head" + b"y" * 8 + b"tail")
+    unsampled_change = compute_fingerprint(rawfile_path, full_hash=True)
+    rawfile_path.write_bytes(b"head" + b"x" * 8 + b"TAIL")
+    sampled_change = compute_fingerprint(rawfile_path)
+
+    assert unsampled_change.fast_hash == original.fast_hash
+    assert unsampled_change.full_hash != original.full_hash
+    assert sampled_change.fast_hash != original.fast_hash
+
+
+def test_bruker_directories_cover_all_files(tmp_path):
+    rawfile_path = tmp_path / "a.d"
+    rawfile_path.mkdir()
+    (rawfile_path / "analysis.tdf").write_bytes(b"tdf")
+    (rawfile_path / "analysis.tdf_bin").write_bytes(b"binary")
+    original = compute_fingerprint(rawfile_path)
+
+    (rawfile_path / "analysis.tdf_bin").write_bytes(b"changed")
+
+    changed = compute_fingerprint(rawfile_path)
+    assert original.size == 9
+    assert changed.size == 10
+    assert changed.fast_hash != original.fast_hash
+
+
+def test_fingerprint_manifest_and_prune(tmp_path, write_manifest):
+    manifest_path = write_manifest(
+        "a.fp-manifest", [("a.raw", "E", "1"), ("b.raw", "E", "2")]
+    )
+
+    with FingerprintIndex(tmp_path / "fingerprints.sqlite") as index:
+        fingerprints = index.fingerprint_manifest(manifest_path)
+        (tmp_path / "rawfiles" / "b.raw").unlink()
+        removed = index.prune()
+
+    assert [path.name for path in fingerprints] == ["a.raw", "b.raw"]
+    assert removed == 1
@@ -0,0 +1,15 @@
+from fragpipe_runner.manifest import create_rawfile_view, read_rawfile_paths
+
+
+def test_create_rawfile_view_resolves_paths_against_the_manifest(tmp_path, monkeypatch):
+    manifest_dir = tmp_path / "project"
+    (manifest_dir / "raw").mkdir(parents=True)
+    (manifest_dir / "raw" / "a.raw").write_bytes(b"raw")
+    manifest_path = manifest_dir / "a.fp-manifest"
+    manifest_path.write_text("raw/a.raw\tE\t1\tDDA\n")
+    monkeypatch.chdir(tmp_path)
+
+    view_manifest_path = create_rawfile_view(manifest_path, tmp_path / "view")
+
+    assert (tmp_path / "view" / "a.raw").read_bytes() == b"raw"
+    assert read_rawfile_paths(view_manifest_path) == [tmp_path / "view" / "a.raw"]
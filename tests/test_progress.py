@@ -0,0 +1,93 @@
+import pytest
+
+from fragpipe_runner.progress import (
+    FileProgress,
+    FragPipeProgressParser,
+    RunFinished,
+    StageFinished,
+    StageStarted,
+    classify_stage,
+    iter_progress_events,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.parametrize(
+    ("stage", "tool"),
+    [
+        ("MSFragger", "MSFragger"),
+        ("CrystalC", "Crystal-C"),
+        ("PeptideProphet", "PeptideProphet"),
+        ("PhilosopherFilter", "Philosopher filter"),
+        ("PhilosopherReport", "Philosopher report"),
+        ("PhilosopherDbAnnotate", "Philosopher"),
+        ("DiaNN", "DIA-NN"),
+        ("WorkspaceClean", "WorkspaceClean"),
+    ],
+)
+def test_classify_stage(stage, tool):
+    assert classify_stage(stage) == tool
+
+
+def test_parser_reports_stage_start_end_and_duration():
+    clock = FakeClock()
+    parser = FragPipeProgressParser(clock=clock)
+
+    clock.now = 101.0
+    (started,) = parser.feed("PhilosopherFilter [Work dir: /out]\n")
+    assert parser.feed("philosopher filter --razor") == []
+    clock.now = 104.5
+    (finished,) = parser.feed("Process 'PhilosopherFilter' finished, exit code: 0\n")
+
+    assert started == StageStarted(
+        1.0, "PhilosopherFilter", "Philosopher filter", "/out"
+    )
+    assert finished == StageFinished(
+        4.5, "PhilosopherFilter", "Philosopher filter", 0, 3.5
+    )
+    assert parser.current_stage is None
+
+
+def test_parser_reports_msfragger_files_with_total_from_command_line():
+    clock = FakeClock()
+    parser = FragPipeProgressParser(clock=clock)
+    parser.feed("MSFragger [Work dir: /out]")
+    parser.feed('java -jar MSFragger.jar params "/data/a.mzML" /data/b.d/ -Xmx4G')
+
+    (progress,) = parser.feed("    002. b.d 12.3 s | deisotoping 1.0 s")
+
+    assert progress == FileProgress(0.0, "MSFragger", "MSFragger", "b.d", 2, 2)
+    assert parser.feed("Process 'MSFragger' finished, exit code: 1")[0].exit_code == 1
+
+
+def test_parser_matches_file_names_of_other_tools_in_order():
+    parser = FragPipeProgressParser()
+    parser.feed("IonQuant [Work dir: /out]")
+    parser.feed("java -jar IonQuant.jar --specdir /data a.raw b.raw")
+
+    events = [parser.feed(line) for line in ["Loading b.raw", "Loading a.raw"]]
+
+    assert [[(e.file, e.index, e.total) for e in es] for es in events] == [
+        [("b.raw", 2, 2)],
+        [],
+    ]
+
+
+def test_iter_progress_events_reports_run_finished():
+    lines = [
+        "Process 'MSFragger' finished, exit code: 0",
+        "===ALL JOBS DONE IN 12.5 MINUTES===",
+    ]
+
+    events = list(iter_progress_events(lines))
+
+    assert events[0].duration is None
+    assert isinstance(events[1], RunFinished)
+    assert events[1].reported_minutes == 12.5
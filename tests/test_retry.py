@@ -0,0 +1,91 @@
+import json
+import pathlib
+
+import pytest
+
+from fragpipe_runner.execute import RunResult
+from fragpipe_runner.retry import (
+    RetryPolicy,
+    _get_retry_settings,
+    is_out_of_memory,
+    run_fragpipe_with_retry,
+)
+
+
+def _result(tmp_path: pathlib.Path, exit_code: int, **kwargs) -> RunResult:
+    return RunResult(["fragpipe"], exit_code, 0.0, 1.0, tmp_path, **kwargs)
+
+
+@pytest.mark.parametrize(
+    ("exit_code", "kwargs", "expected"),
+    [
+        (0, {}, False),
+        (137, {}, True),
+        (-9, {}, True),
+        (1, {"error_output": "java.lang.OutOfMemoryError: Java heap space"}, True),
+        (1, {"error_output": "Exception in thread main"}, False),
+        (137, {"termination_reason": "timeout"}, False),
+    ],
+)
+def test_is_out_of_memory(tmp_path, exit_code, kwargs, expected):
+    assert is_out_of_memory(_result(tmp_path, exit_code, **kwargs)) is expected
+
+
+def test_is_out_of_memory_reads_the_log_tail(tmp_path):
+    log_path = tmp_path / "log.txt"
+    log_path.write_text("x\n" * 1000 + "GC overhead limit exceeded\n")
+
+    assert is_out_of_memory(_result(tmp_path, 1, log_path=log_path))
+
+
+@pytest.mark.parametrize(
+    ("ram", "threads", "slice_db", "failed_tool", "expected"),
+    [
+        # RAM is raised first, up to the maximum
+        (8, 16, 1, "MSFragger", (12, 16, 1)),
+        (30, 16, 1, "MSFragger", (32, 16, 1)),
+        # Then threads are halved and MSFragger databases sliced
+        (32, 16, 1, "MSFragger", (32, 8, 2)),
+        (32, 16, 1, "IonQuant", (32, 8, 1)),
+        (32, 1, 64, "MSFragger", None),
+    ],
+)
+def test_get_retry_settings(ram, threads, slice_db, failed_tool, expected):
+    settings = _get_retry_settings(
+        ram, threads, slice_db, failed_tool, max_ram=32, policy=RetryPolicy()
+    )
+
+    assert settings == expected
+
+
+def test_run_fragpipe_with_retry_keeps_inputs_in_output_dir(
+    tmp_path, fragpipe_root, workflow_path, write_manifest, monkeypatch
+):
+    # The workflow, manifest and FASTA are written to the output directory
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    output_dir = manifest_path.parent
+    monkeypatch.setenv("STUB_FRAGPIPE_EXIT_CODE", "137")
+
+    result = run_fragpipe_with_retry(
+        fragpipe_root,
+        workflow_path,
+        manifest_path,
+        output_dir,
+        ram=8,
+        threads=2,
+        policy=RetryPolicy(max_attempts=2, max_ram=16),
+    )
+
+    assert not result.success
+    assert len(result.attempts) == 1
+    assert workflow_path.exists() and manifest_path.exists()
+    attempt_dir = output_dir / ".attempt-1"
+    assert (attempt_dir / "E_1" / "a.pepXML").exists()
+    assert not (attempt_dir / manifest_path.name).exists()
+
+    attempt = result.attempts[0]
+    assert (attempt.ram, attempt.result.output_dir) == (8, attempt_dir)
+    assert attempt.result.log_path.parent == attempt_dir
+    (report_path,) = attempt_dir.glob("*_timing.json")
+    report = json.loads(report_path.read_text())
+    assert report["log_path"] == attempt.result.log_path.as_posix()
@@ -0,0 +1,109 @@
+from fragpipe_runner.progress import StageStarted
+from fragpipe_runner.scheduler import FragPipeScheduler, SearchJob
+
+
+def _job(name: str, threads: int | None = None) -> SearchJob:
+    return SearchJob("a.workflow", "a.fp-manifest", name, threads=threads)
+
+
+def _stage(tool: str) -> StageStarted:
+    return StageStarted(elapsed=0.0, stage=tool, tool=tool, workdir="")
+
+
+def test_jobs_share_the_budget(tmp_path):
+    scheduler = FragPipeScheduler(tmp_path, ram_budget=64, thread_budget=16)
+    first, second = _job("a"), _job("b")
+
+    scheduler._allocate(first)
+
+    assert (first.allocated_ram, first.allocated_threads) == (32, 8)
+    assert scheduler._can_start(second)
+    scheduler._allocate(second)
+    assert (scheduler._available_ram, scheduler._available_threads) == (0, 0)
+    assert not scheduler._can_start(_job("c"))
+
+    scheduler._release(first)
+    scheduler._release(second)
+    assert (scheduler._available_ram, scheduler._available_threads) == (64, 16)
+
+
+def test_min_job_threads_clamps_allocation_to_free_threads(tmp_path):
+    scheduler = FragPipeScheduler(
+        tmp_path, ram_budget=64, thread_budget=10, min_job_threads=2
+    )
+    first, second = _job("a", threads=8), _job("b", threads=8)
+    scheduler._allocate(first)
+
+    assert scheduler._can_start(second)
+    scheduler._allocate(second)
+
+    assert second.allocated_threads == 2
+    assert scheduler._available_threads == 0
+
+
+def test_jobs_wait_for_min_job_threads(tmp_path):
+    scheduler = FragPipeScheduler(
+        tmp_path, ram_budget=64, thread_budget=9, min_job_threads=2
+    )
+    scheduler._allocate(_job("a", threads=8))
+
+    assert not scheduler._can_start(_job("b", threads=8))
+
+
+def test_low_cpu_stage_releases_and_reclaims_threads(tmp_path):
+    scheduler = FragPipeScheduler(
+        tmp_path,
+        ram_budget=64,
+        thread_budget=16,
+        low_cpu_tools={"Philosopher filter"},
+        low_cpu_threads=1,
+    )
+    first, second = _job("a", threads=16), _job("b", threads=8)
+    scheduler._allocate(first)
+    assert not scheduler._can_start(second)
+
+    scheduler._on_progress(first, _stage("Philosopher filter"))
+    scheduler._on_progress(first, _stage("Philosopher filter"))
+    assert first.released_threads == 15
+    assert scheduler._available_threads == 15
+    assert scheduler._can_start(second)
+    scheduler._allocate(second)
+
+    scheduler._on_progress(first, _stage("IonQuant"))
+    assert first.released_threads == 0
+    assert scheduler._available_threads == -8
+
+    scheduler._release(first)
+    scheduler._release(second)
+    assert scheduler._available_threads == 16
+
+
+def test_release_during_low_cpu_stage_restores_budget(tmp_path):
+    scheduler = FragPipeScheduler(
+        tmp_path, ram_budget=64, thread_budget=16, low_cpu_tools={"Philosopher"}
+    )
+    job = _job("a", threads=16)
+    scheduler._allocate(job)
+    scheduler._on_progress(job, _stage("Philosopher"))
+
+    scheduler._release(job)
+
+    assert scheduler._available_threads == 16
+    assert job.released_threads == 0
+
+
+def test_run_finishes_all_jobs_and_restores_budget(
+    tmp_path, fragpipe_root, workflow_path, write_manifest
+):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    scheduler = FragPipeScheduler(
+        fragpipe_root, ram_budget=8, thread_budget=4, max_parallel_jobs=2
+    )
+    for name in ("a", "b", "c"):
+        scheduler.submit(workflow_path, manifest_path, tmp_path / name)
+
+    jobs = scheduler.run()
+
+    assert [job.success for job in jobs] == [True, True, True]
+    assert [job.allocated_threads for job in jobs] == [2, 2, 2]
+    assert (scheduler._available_ram, scheduler._available_threads) == (8, 4)
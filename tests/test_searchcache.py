@@ -0,0 +1,126 @@
+import pathlib
+
+import pytest
+
+from fragpipe_runner.searchcache import (
+    SearchResultCache,
+    find_results,
+    run_fragpipe_incremental,
+)
+
+
+def _write_results(output_dir: pathlib.Path, group: str, stem: str) -> list:
+    group_dir = output_dir / group
+    group_dir.mkdir(parents=True, exist_ok=True)
+    (group_dir / f"{stem}.pepXML").write_text(f"pepXML of {stem}")
+    (group_dir / f"{stem}.pin").write_text(f"pin of {stem}")
+    return find_results(output_dir, f"{stem}.raw")
+
+
+def test_restore_creates_results_at_recorded_paths(tmp_path):
+    cache = SearchResultCache(tmp_path / "cache")
+    search_dir = tmp_path / "search"
+    cache.store("a" * 64, search_dir, _write_results(search_dir, "E_1", "a"))
+
+    restored = cache.restore("a" * 64, tmp_path / "output")
+
+    assert restored == 2
+    assert (tmp_path / "output" / "E_1" / "a.pepXML").read_text() == "pepXML of a"
+    assert (tmp_path / "output" / "E_1" / "a.pin").read_text() == "pin of a"
+
+
+def test_restore_of_missing_entry_returns_zero(tmp_path):
+    cache = SearchResultCache(tmp_path / "cache")
+
+    assert cache.restore("a" * 64, tmp_path / "output") == 0
+
+
+def test_find_results_includes_rank_files(tmp_path):
+    _write_results(tmp_path, "E", "a")
+    (tmp_path / "E" / "a_rank2.pepXML").write_text("rank 2")
+    (tmp_path / "E" / "ab.pepXML").write_text("other raw file")
+
+    names = [path.name for path in find_results(tmp_path, "a.raw")]
+
+    assert names == ["a.pepXML", "a.pin", "a_rank2.pepXML"]
+
+
+def test_run_fragpipe_incremental_searches_only_new_rawfiles(
+    tmp_path, fragpipe_root, workflow_path, write_manifest, searched_rawfiles
+):
+    cache = SearchResultCache(tmp_path / "cache")
+    first_manifest = write_manifest("first.fp-manifest", [("a.raw", "E", "1")])
+    second_manifest = write_manifest(
+        "second.fp-manifest", [("a.raw", "E", "1"), ("b.raw", "E", "")]
+    )
+
+    first = run_fragpipe_incremental(
+        cache, fragpipe_root, workflow_path, first_manifest, tmp_path / "out1"
+    )
+    second = run_fragpipe_incremental(
+        cache, fragpipe_root, workflow_path, second_manifest, tmp_path / "out2"
+    )
+
+    assert first.success and second.success
+    assert searched_rawfiles() == ["a", "b"]
+    assert (tmp_path / "out2" / "E_1" / "a.pepXML").exists()
+    assert (tmp_path / "out2" / "E" / "b.pepXML").exists()
+    assert (tmp_path / "out2" / "combined.tsv").exists()
+
+
+def test_run_fragpipe_incremental_keeps_cohort_within_budget(
+    tmp_path, fragpipe_root, workflow_path, write_manifest, searched_rawfiles
+):
+    # A budget smaller than one entry must not evict results before they are restored
+    cache = SearchResultCache(tmp_path / "cache", max_size_bytes=1)
+    manifest_path = write_manifest(
+        "cohort.fp-manifest", [("a.raw", "E", "1"), ("b.raw", "E", "2")]
+    )
+
+    result = run_fragpipe_incremental(
+        cache, fragpipe_root, workflow_path, manifest_path, tmp_path / "out"
+    )
+
+    assert result.success
+    assert searched_rawfiles() == ["a", "b"]
+    assert (tmp_path / "out" / "E_1" / "a.pepXML").exists()
+    assert (tmp_path / "out" / "E_2" / "b.pepXML").exists()
+
+
+def test_run_fragpipe_incremental_searches_evicted_rawfiles_again(
+    tmp_path, fragpipe_root, workflow_path, write_manifest, searched_rawfiles
+):
+    cache = SearchResultCache(tmp_path / "cache")
+    manifest_path = write_manifest("cohort.fp-manifest", [("a.raw", "E", "1")])
+    original_restore = cache.restore
+    evicted = []
+
+    def restore_after_eviction(key, output_dir):
+        # Simulates another process evicting the entry right before the restore
+        if not evicted:
+            cache.max_size_bytes = 0
+            cache.evict()
+            cache.max_size_bytes = None
+            evicted.append(key)
+        return original_restore(key, output_dir)
+
+    cache.restore = restore_after_eviction
+    result = run_fragpipe_incremental(
+        cache, fragpipe_root, workflow_path, manifest_path, tmp_path / "out"
+    )
+
+    assert result.success
+    assert searched_rawfiles() == ["a", "a"]
+
+
+def test_run_fragpipe_incremental_raises_on_missing_results(
+    tmp_path, fragpipe_root, workflow_path, write_manifest
+):
+    cache = SearchResultCache(tmp_path / "cache")
+    manifest_path = write_manifest("cohort.fp-manifest", [("a.raw", "E", "1")])
+    cache.restore = lambda key, output_dir: 0
+
+    with pytest.raises(FileNotFoundError, match="a.raw"):
+        run_fragpipe_incremental(
+            cache, fragpipe_root, workflow_path, manifest_path, tmp_path / "out"
+        )
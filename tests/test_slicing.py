@@ -0,0 +1,110 @@
+import pathlib
+
+import pytest
+
+from fragpipe_runner.slicing import DigestionRules, plan_slices, set_slice_db
+from fragpipe_runner.workflow import read_workflow
+
+# Tryptic peptides without missed cleavages: AAAAAK and GGGGGRPAAAAAK, as R is
+# followed by P
+_SEQUENCE = "AAAAAKGGGGGRPAAAAAK"
+
+
+@pytest.fixture
+def digestion_workflow_path(tmp_path: pathlib.Path):
+    """Return a function writing a workflow that digests `_SEQUENCE`."""
+    fasta_path = tmp_path / "database.fasta"
+    fasta_path.write_text(f">sp|P1|PROT1\n{_SEQUENCE[:10]}\n{_SEQUENCE[10:]}\n")
+
+    def write(**parameters: str) -> pathlib.Path:
+        parameters = {
+            "search_enzyme_cut_1": "KR",
+            "search_enzyme_nocut_1": "P",
+            "num_enzyme_termini": "2",
+            "allowed_missed_cleavage_1": "0",
+            "digest_min_length": "3",
+            "digest_mass_range": "0 10000",
+            **parameters,
+        }
+        workflow_path = tmp_path / "digestion.workflow"
+        workflow_path.write_text(
+            "".join(f"msfragger.{key}={value}\n" for key, value in parameters.items())
+            + f"database.db-path={fasta_path.as_posix()}\n"
+        )
+        return workflow_path
+
+    return write
+
+
+def test_from_workflow_keeps_defaults_of_missing_parameters(tmp_path):
+    workflow_path = tmp_path / "empty.workflow"
+    workflow_path.write_text("msfragger.digest_min_length=\n")
+
+    rules = DigestionRules.from_workflow(workflow_path)
+
+    assert rules == DigestionRules()
+
+
+def test_from_workflow_keeps_empty_cut_and_nocut(digestion_workflow_path):
+    workflow_path = digestion_workflow_path(
+        search_enzyme_cut_1="", search_enzyme_nocut_1="", num_enzyme_termini="0"
+    )
+
+    rules = DigestionRules.from_workflow(workflow_path)
+
+    assert rules.cut == ""
+    assert rules.nocut == ""
+    assert rules.enzyme_termini == 0
+    assert (rules.min_mass, rules.max_mass) == (0.0, 10000.0)
+
+
+def test_from_workflow_reads_variable_mods_table(tmp_path):
+    workflow_path = tmp_path / "mods.workflow"
+    workflow_path.write_text(
+        "msfragger.table.var-mods=15.9949,M,true,3; -17.0265,nQ,true,1; "
+        "79.96633,STY,false,3\n"
+    )
+
+    rules = DigestionRules.from_workflow(workflow_path)
+
+    assert rules.variable_mods == ["M", "nQ"]
+
+
+@pytest.mark.parametrize(
+    ("parameters", "peptides"),
+    [
+        ({}, 2),
+        ({"allowed_missed_cleavage_1": "1"}, 3),
+        # Every subsequence of length 3 to 19
+        (
+            {
+                "search_enzyme_cut_1": "",
+                "search_enzyme_nocut_1": "",
+                "num_enzyme_termini": "0",
+            },
+            sum(range(1, len(_SEQUENCE) - 1)),
+        ),
+    ],
+)
+def test_plan_slices_counts_peptides(digestion_workflow_path, parameters, peptides):
+    plan = plan_slices(digestion_workflow_path(**parameters), ram=1)
+
+    assert plan.peptides == peptides
+    assert plan.slices == 1
+
+
+def test_set_slice_db_writes_planned_slices(tmp_path, digestion_workflow_path):
+    workflow_path = digestion_workflow_path()
+    index_bytes = plan_slices(workflow_path, ram=1).index_bytes
+    workflow_output = tmp_path / "sliced.workflow"
+
+    plan = set_slice_db(
+        workflow_path,
+        ram=1,
+        workflow_output=workflow_output,
+        index_memory_fraction=index_bytes / 2 / 1024**3,
+    )
+
+    assert plan.slices == 2
+    assert read_workflow(workflow_output)["msfragger.misc.slice-db"] == "2"
+    assert "msfragger.misc.slice-db" not in read_workflow(workflow_path)
@@ -0,0 +1,129 @@
+import concurrent.futures
+import os
+import shutil
+
+from fragpipe_runner import staging
+from fragpipe_runner.scheduler import SearchJob
+from fragpipe_runner.staging import RawfileCache, run_fragpipe_batch, stage_rawfiles
+
+
+def _entry_keys(cache: RawfileCache) -> list[str]:
+    return [p.name for p in cache.cache_dir.iterdir() if not p.name.startswith(".")]
+
+
+def test_stage_rawfiles_rewrites_manifest(tmp_path, write_manifest):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+
+    staged_manifest_path = stage_rawfiles(manifest_path, tmp_path / "staging")
+
+    staged_rawfile_path = tmp_path / "staging" / "a.raw"
+    assert staged_rawfile_path.read_bytes() == b"a.raw" * 100
+    assert staged_rawfile_path.as_posix() in staged_manifest_path.read_text()
+
+
+def test_stage_links_cached_rawfiles_into_job_dir(tmp_path, write_manifest):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    cache = RawfileCache(tmp_path / "cache")
+
+    cache.stage(manifest_path, tmp_path / "job1")
+    cache.stage(manifest_path, tmp_path / "job2")
+
+    assert len(_entry_keys(cache)) == 1
+    assert (tmp_path / "job1" / "a.raw").read_bytes() == b"a.raw" * 100
+    assert os.path.samefile(tmp_path / "job1" / "a.raw", tmp_path / "job2" / "a.raw")
+
+
+def test_concurrent_stages_store_one_entry(tmp_path, write_manifest):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    cache = RawfileCache(tmp_path / "cache")
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        job_dirs = [tmp_path / f"job{index}" for index in range(4)]
+        list(
+            executor.map(lambda job_dir: cache.stage(manifest_path, job_dir), job_dirs)
+        )
+
+    assert len(_entry_keys(cache)) == 1
+    assert not [p for p in cache.cache_dir.iterdir() if p.name.startswith(".staging")]
+    for job_dir in job_dirs:
+        assert (job_dir / "a.raw").read_bytes() == b"a.raw" * 100
+
+
+def test_evict_keeps_rawfiles_referenced_by_jobs(tmp_path, write_manifest):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    cache = RawfileCache(tmp_path / "cache", max_size_bytes=0)
+
+    cache.stage(manifest_path, tmp_path / "job")
+    assert len(_entry_keys(cache)) == 1
+
+    shutil.rmtree(tmp_path / "job")
+    cache.release(tmp_path / "job")
+    cache.evict()
+    assert _entry_keys(cache) == []
+
+
+def test_evict_ignores_references_of_removed_job_dirs(tmp_path, write_manifest):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    cache = RawfileCache(tmp_path / "cache", max_size_bytes=0)
+    cache.stage(manifest_path, tmp_path / "job")
+
+    shutil.rmtree(tmp_path / "job")
+    cache.evict()
+
+    assert _entry_keys(cache) == []
+
+
+def test_evict_keeps_rawfiles_linked_with_symlinks(tmp_path, write_manifest):
+    # References are tracked explicitly, so symlinked job directories are protected
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    cache = RawfileCache(tmp_path / "cache", max_size_bytes=0)
+    cache.stage(manifest_path, tmp_path / "job")
+    staged_path = tmp_path / "job" / "a.raw"
+    cached_path = cache.cache_dir / _entry_keys(cache)[0] / "a.raw"
+    staged_path.unlink()
+    staged_path.symlink_to(cached_path)
+
+    cache.evict()
+
+    assert staged_path.read_bytes() == b"a.raw" * 100
+
+
+def test_run_fragpipe_batch_releases_cached_rawfiles(
+    tmp_path, fragpipe_root, workflow_path, write_manifest
+):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    cache = RawfileCache(tmp_path / "cache")
+    jobs = [SearchJob(workflow_path, manifest_path, tmp_path / "out")]
+
+    finished = run_fragpipe_batch(
+        fragpipe_root, jobs, tmp_path / "staging", rawfile_cache=cache
+    )
+
+    assert finished[0].success
+    assert list((tmp_path / "staging").iterdir()) == []
+    cache.max_size_bytes = 0
+    cache.evict()
+    assert _entry_keys(cache) == []
+
+
+def test_run_fragpipe_batch_passes_job_settings(
+    tmp_path, fragpipe_root, workflow_path, write_manifest, monkeypatch
+):
+    manifest_path = write_manifest("a.fp-manifest", [("a.raw", "E", "1")])
+    jobs = [
+        SearchJob(
+            workflow_path, manifest_path, tmp_path / "out", ram=8, isolate_rawfiles=True
+        )
+    ]
+    calls = []
+    original_run_fragpipe = staging.run_fragpipe
+
+    def run_fragpipe(*args, **kwargs):
+        calls.append(kwargs)
+        return original_run_fragpipe(*args, **kwargs)
+
+    monkeypatch.setattr(staging, "run_fragpipe", run_fragpipe)
+    run_fragpipe_batch(fragpipe_root, jobs, tmp_path / "staging")
+
+    assert calls[0]["ram"] == 8
+    assert calls[0]["isolate_rawfiles"] is True
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from fragpipe_runner.progress import StageFinished
+from fragpipe_runner.timing import create_timing_report, write_timing_report
+
+MSFRAGGER_LOG = """\
+MSFragger [Work dir: /out]
+java -jar MSFragger.jar params /data/a.mzML /data/b.mzML
+    001. a.mzML 0.8 s | deisotoping 0.6 s
+        [progress: 100/100 (100%) - 100 spectra/s] 0.9s | postprocessing 0.1 s
+    002. b.mzML 1.5 s | deisotoping 0.5 s
+Process 'MSFragger' finished, exit code: 0
+"""
+
+
+@pytest.fixture
+def write_log(tmp_path):
+    def write(text: str):
+        log_path = tmp_path / "log.txt"
+        log_path.write_text(text)
+        return log_path
+
+    return write
+
+
+def test_msfragger_file_durations_exclude_sub_steps(write_log):
+    report = create_timing_report(write_log(MSFRAGGER_LOG))
+
+    (stage,) = report.stages
+    # Durations accumulate over all lines while a file is processed
+    assert stage.files == pytest.approx({"a.mzML": 1.7, "b.mzML": 1.5})
+    assert stage.seconds == pytest.approx(3.2)
+    assert stage.exit_code == 0
+
+
+def test_last_done_in_line_is_the_stage_duration(write_log):
+    log_path = write_log(
+        "IonQuant [Work dir: /out]\n"
+        "java -jar IonQuant.jar a.raw\n"
+        "Building index done in 2 s\n"
+        "All done in 1.5 min\n"
+        "Process 'IonQuant' finished, exit code: 0\n"
+    )
+
+    (stage,) = create_timing_report(log_path).stages
+
+    assert stage.seconds == 90.0
+    assert stage.files == {}
+
+
+def test_clock_times_span_midnight(write_log):
+    log_path = write_log(
+        "PhilosopherFilter [Work dir: /out]\n"
+        "philosopher filter\n"
+        "INFO[23:59:50] Executing Filter\n"
+        "INFO[00:00:20] Done\n"
+        "Process 'PhilosopherFilter' finished, exit code: 0\n"
+        "DiaNN [Work dir: /out]\n"
+        "diann --f a.raw\n"
+        "[0:07] Loading spectral library\n"
+        "[1:15] Quantification\n"
+    )
+
+    filter_stage, diann_stage = create_timing_report(log_path).stages
+
+    assert (filter_stage.tool, filter_stage.seconds) == ("Philosopher filter", 30.0)
+    assert (diann_stage.seconds, diann_stage.exit_code) == (75.0, None)
+
+
+def test_observed_durations_take_precedence(write_log):
+    observed = [StageFinished(10.0, "MSFragger", "MSFragger", 0, 42.0)]
+
+    report = create_timing_report(
+        write_log(MSFRAGGER_LOG), observed, observed_total_seconds=50.0
+    )
+
+    assert report.stages[0].seconds == 42.0
+    assert report.total_seconds == 50.0
+
+
+def test_write_timing_report_next_to_log(write_log):
+    log_path = write_log(MSFRAGGER_LOG + "===ALL JOBS DONE IN 0.5 MINUTES===\n")
+
+    report_path = write_timing_report(create_timing_report(log_path))
+
+    assert report_path == log_path.with_name("log_timing.json")
+    report = json.loads(report_path.read_text())
+    assert report["total_seconds"] == 30.0
+    assert report["tools"] == {"MSFragger": pytest.approx(3.2)}
@@ -0,0 +1,130 @@
+import errno
+import os
+import time
+
+import pytest
+
+from fragpipe_runner import _inotify, transfer
+from fragpipe_runner.transfer import (
+    OutputSync,
+    TransferVerificationError,
+    move_tree,
+)
+
+
+@pytest.fixture
+def source_dir(tmp_path):
+    path = tmp_path / "source"
+    (path / "E_1").mkdir(parents=True)
+    (path / "E_1" / "a.pepXML").write_text("pepXML of a")
+    (path / "combined.tsv").write_text("combined")
+    os.symlink("combined.tsv", path / "latest.tsv")
+    return path
+
+
+@pytest.fixture
+def cross_device(monkeypatch):
+    """Make renames fail as if source and destination were on different devices."""
+
+    def rename(source, destination):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "rename", rename)
+
+
+def test_move_tree_merges_folders_and_replaces_files(tmp_path, source_dir):
+    destination_dir = tmp_path / "output"
+    (destination_dir / "E_1").mkdir(parents=True)
+    (destination_dir / "E_1" / "b.pepXML").write_text("pepXML of b")
+    (destination_dir / "combined.tsv").write_text("old")
+
+    move_tree(source_dir, destination_dir)
+
+    assert not source_dir.exists()
+    assert (destination_dir / "E_1" / "a.pepXML").read_text() == "pepXML of a"
+    assert (destination_dir / "E_1" / "b.pepXML").exists()
+    assert (destination_dir / "combined.tsv").read_text() == "combined"
+
+
+def test_move_tree_copies_across_devices(tmp_path, source_dir, cross_device):
+    destination_dir = tmp_path / "output"
+
+    move_tree(source_dir, destination_dir, max_workers=2, verify_checksums=True)
+
+    assert not source_dir.exists()
+    assert (destination_dir / "E_1" / "a.pepXML").read_text() == "pepXML of a"
+    assert os.readlink(destination_dir / "latest.tsv") == "combined.tsv"
+
+
+def test_move_tree_keeps_sources_that_fail_verification(
+    tmp_path, source_dir, cross_device, monkeypatch
+):
+    def corrupt_copy(source, destination):
+        destination.write_text("corrupt")
+
+    monkeypatch.setattr(transfer, "_copy_file_range", corrupt_copy)
+
+    with pytest.raises(TransferVerificationError):
+        move_tree(source_dir, tmp_path / "output", verify_checksums=True)
+
+    assert (source_dir / "combined.tsv").read_text() == "combined"
+
+
+def _wait_for(condition, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Condition was not met in time.")
+        time.sleep(0.02)
+
+
+@pytest.mark.parametrize(
+    "use_inotify",
+    [
+        False,
+        pytest.param(
+            True,
+            marks=pytest.mark.skipif(
+                not _inotify.is_available(), reason="inotify is not available"
+            ),
+        ),
+    ],
+)
+def test_output_sync_copies_finished_files(tmp_path, use_inotify):
+    source_dir = tmp_path / "temp_output"
+    (source_dir / "E_1").mkdir(parents=True)
+    destination_dir = tmp_path / "output"
+
+    with OutputSync(
+        source_dir,
+        destination_dir,
+        settle_seconds=0,
+        poll_interval=0.05,
+        use_inotify=use_inotify,
+    ) as sync:
+        (source_dir / "E_1" / "a.pepXML").write_text("pepXML of a")
+        (source_dir / "a.tmp").write_text("intermediate")
+        _wait_for(lambda: len(sync.synced_files) == 2)
+        (source_dir / "a.tmp").unlink()
+
+    assert (destination_dir / "E_1" / "a.pepXML").read_text() == "pepXML of a"
+    assert not (destination_dir / "a.tmp").exists()
+    assert list(sync.synced_files) == [source_dir / "E_1" / "a.pepXML"]
+    assert sync.synced_bytes == len("pepXML of a")
+
+
+def test_move_tree_skips_files_synced_unchanged(tmp_path, source_dir, cross_device):
+    destination_dir = tmp_path / "output"
+    (destination_dir / "E_1").mkdir(parents=True)
+    synced_path = source_dir / "E_1" / "a.pepXML"
+    (destination_dir / "E_1" / "a.pepXML").write_text("synced copy")
+    (destination_dir / "combined.tsv").write_text("outdated copy")
+    synced_files = {
+        synced_path: transfer._stat_key(synced_path),
+        source_dir / "combined.tsv": (0, 0),
+    }
+
+    move_tree(source_dir, destination_dir, synced_files=synced_files)
+
+    assert (destination_dir / "E_1" / "a.pepXML").read_text() == "synced copy"
+    assert (destination_dir / "combined.tsv").read_text() == "combined"
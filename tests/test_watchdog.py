@@ -0,0 +1,102 @@
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from fragpipe_runner import watchdog
+from fragpipe_runner.progress import StageFinished, StageStarted
+from fragpipe_runner.watchdog import (
+    STAGE_TIMEOUT,
+    STALL,
+    TIMEOUT,
+    Watchdog,
+    terminate_process_group,
+)
+
+posix_only = pytest.mark.skipif(
+    os.name != "posix", reason="Process groups require POSIX."
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_check_reports_the_exceeded_limit():
+    clock = FakeClock()
+    dog = Watchdog(
+        1,
+        timeout=100,
+        stage_timeout={"MSFragger": 30},
+        stall_timeout=20,
+        clock=clock,
+    )
+
+    clock.now = 15
+    dog.notify_output("line")
+    dog.notify_progress(StageStarted(15, "IonQuant", "IonQuant", "/out"))
+    clock.now = 30
+    assert dog.check() is None
+    dog.notify_progress(StageFinished(30, "IonQuant", "IonQuant", 0, 15))
+    dog.notify_progress(StageStarted(30, "MSFragger", "MSFragger", "/out"))
+    clock.now = 36
+    assert dog.check() == STALL
+    dog.notify_output("line")
+    assert dog.check() is None
+    clock.now = 61
+    dog.notify_output("line")
+    assert dog.check() == STAGE_TIMEOUT
+    clock.now = 101
+    assert dog.check() == TIMEOUT
+
+
+def test_terminate_records_the_first_reason(monkeypatch):
+    terminated = []
+    monkeypatch.setattr(
+        watchdog,
+        "terminate_process_group",
+        lambda pid, grace_seconds: terminated.append(pid),
+    )
+    dog = Watchdog(42, stall_timeout=1)
+
+    dog.terminate(STALL)
+    dog.terminate(TIMEOUT)
+
+    assert dog.reason == STALL
+    assert terminated == [42]
+
+
+@posix_only
+def test_terminate_process_group_kills_processes_ignoring_sigterm():
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import signal, time\n"
+            "signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+            "print('ready', flush=True)\n"
+            "time.sleep(60)\n",
+        ],
+        stdout=subprocess.PIPE,
+        start_new_session=True,
+    )
+    process.stdout.readline()
+
+    terminate_process_group(process.pid, grace_seconds=0.2)
+
+    assert process.wait(timeout=5) == -signal.SIGKILL
+    process.stdout.close()
+
+
+@posix_only
+def test_terminate_process_group_ignores_exited_processes():
+    process = subprocess.Popen(["true"], start_new_session=True)
+    process.wait()
+
+    terminate_process_group(process.pid, grace_seconds=0.2)
@@ -0,0 +1,102 @@
+import pathlib
+
+import pytest
+
+from fragpipe_runner import watchfolder
+from fragpipe_runner.watchfolder import WatchFolder
+
+
+def _write_sdrf(tmp_path: pathlib.Path, rawfile_names: list[str]) -> pathlib.Path:
+    sdrf_path = tmp_path / "batch.sdrf.tsv"
+    lines = ["comment[data file]\tcharacteristics[biological replicate]"]
+    lines.extend(f"{name}\t{i}" for i, name in enumerate(rawfile_names, start=1))
+    sdrf_path.write_text("\n".join(lines) + "\n")
+    return sdrf_path
+
+
+@pytest.fixture
+def watch_dir(tmp_path: pathlib.Path) -> pathlib.Path:
+    path = tmp_path / "share"
+    path.mkdir()
+    return path
+
+
+def test_candidates_arrive_once_unchanged_for_settle_seconds(
+    tmp_path, watch_dir, fragpipe_root, workflow_path, monkeypatch
+):
+    now = [0.0]
+    monkeypatch.setattr(watchfolder.time, "monotonic", lambda: now[0])
+    watch_folder = WatchFolder(
+        watch_dir,
+        _write_sdrf(tmp_path, ["a.raw", "b.d"]),
+        fragpipe_root,
+        workflow_path,
+        tmp_path / "output",
+        settle_seconds=10,
+        use_inotify=False,
+    )
+    rawfile_path = watch_dir / "instrument" / "a.raw"
+    rawfile_path.parent.mkdir()
+    rawfile_path.write_bytes(b"scan")
+    (watch_dir / "other.raw").write_bytes(b"not part of the batch")
+
+    watch_folder._scan()
+    assert watch_folder._check_candidates() == []
+    now[0] = 8.0
+    rawfile_path.write_bytes(b"scan scan")
+    assert watch_folder._check_candidates() == []
+    now[0] = 15.0
+    assert watch_folder._check_candidates() == []
+    now[0] = 18.0
+
+    assert watch_folder._check_candidates() == [rawfile_path]
+    assert watch_folder.arrived == {"a.raw": rawfile_path}
+    assert not watch_folder.complete
+
+
+def test_get_rawfile_path_returns_the_bruker_directory_of_a_file(
+    tmp_path, watch_dir, fragpipe_root, workflow_path
+):
+    watch_folder = WatchFolder(
+        watch_dir,
+        _write_sdrf(tmp_path, ["b.d"]),
+        fragpipe_root,
+        workflow_path,
+        tmp_path / "output",
+        use_inotify=False,
+    )
+
+    assert (
+        watch_folder._get_rawfile_path(watch_dir / "x" / "b.d" / "analysis.tdf")
+        == watch_dir / "x" / "b.d"
+    )
+    assert watch_folder._get_rawfile_path(watch_dir / "x" / "c.d" / "a.tdf") is None
+
+
+def test_run_reports_rawfiles_that_failed_processing(
+    tmp_path, watch_dir, fragpipe_root, workflow_path
+):
+    for name in ("a.raw", "b.raw"):
+        (watch_dir / name).write_bytes(name.encode())
+
+    def rawfile_callback(rawfile_path: pathlib.Path) -> None:
+        if rawfile_path.name == "b.raw":
+            raise OSError("staging failed")
+
+    watch_folder = WatchFolder(
+        watch_dir,
+        _write_sdrf(tmp_path, ["a.raw", "b.raw"]),
+        fragpipe_root,
+        workflow_path,
+        tmp_path / "output",
+        rawfile_callback=rawfile_callback,
+        settle_seconds=0,
+        poll_interval=0.01,
+        use_inotify=False,
+    )
+
+    result = watch_folder.run(timeout=30)
+
+    assert result.success
+    assert result.rawfile_errors == {"b.raw": "staging failed"}
+    assert watch_folder.failures == result.rawfile_errors